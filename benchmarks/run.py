@@ -0,0 +1,305 @@
+"""
+Benchmarks of the model steps and of full runs, for both models and every
+main_v2 engine, at the paper scale (~100 deer), the Black Mount scale (~9k
+deer) and synthetic herds up to 1M deer.
+
+Run from the repository root:
+
+    python -m benchmarks.run                      # writes benchmarks/baseline.json
+    python -m benchmarks.run --quick --output new.json --compare benchmarks/baseline.json
+
+Results are written as JSON, one record per benchmark with its timings in
+seconds, so a later run can be compared against them with --compare.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import src.main as paper
+import src.main_v2 as v2
+from src.blackmount import REAL_CULLING_DATA
+
+BLACK_MOUNT_SIZE = 9200  # 1800 stags, 3700 hinds and 3700 calves
+SYNTHETIC_SIZES = [100_000, 1_000_000]
+
+# The Deer object engines (individual, indexed) need minutes per step beyond this
+MAX_INDIVIDUAL_SIZE = 100_000
+
+
+def paper_parameters():
+    # reproduce_results.ipynb
+    return (
+        paper.ModelParameters(
+            maxCapacityImpact=0.3,
+            capacityCurveSlope=1,
+            initialIndividuals=100,
+            maximumIndividuals=150,
+            huntingLimit=10,
+        ),
+        paper.HuntingParameters(
+            calves=4, youngHinds=4, youngStags=4, matureHinds=4, matureStags=4
+        ),
+    )
+
+
+def blackmount_parameters(size=BLACK_MOUNT_SIZE):
+    # blackmount.ipynb, with the carrying capacity and culls scaled to the herd
+    scale = size / BLACK_MOUNT_SIZE
+    return (
+        v2.ModelParameters(
+            maxCapacityImpact=0.1,
+            capacityCurveSlope=1,
+            maximumIndividuals=round(15300 * scale),
+            huntingLimit=100,
+            probYoungReproduce=0.1,
+            probMatureReproduce=0.9,
+        ),
+        v2.HuntingParameters(
+            culling_data={
+                year: {group: round(cull * scale) for group, cull in culls.items()}
+                for year, culls in REAL_CULLING_DATA.items()
+            }
+        ),
+        {
+            "initial_stags": round(1800 * scale),
+            "initial_hinds": round(3700 * scale),
+            "initial_calves": round(3700 * scale),
+        },
+    )
+
+
+def measure(function, setup=None, repeat=5):
+    """
+    Timings in seconds of repeat calls of function(setup()), without setup.
+    """
+
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+    }
+
+
+def paper_benchmarks(repeat):
+    parameters, strategy = paper_parameters()
+    population = paper.generateInitialPopulation()
+    rng = paper.make_rng(0)
+
+    steps = {
+        "grow": lambda pop: paper.grow(pop),
+        "reproduce": lambda pop: paper.reproduce(pop, parameters, rng),
+        "naturalDeath": lambda pop: paper.naturalDeath(pop, parameters, rng),
+        "hunting": lambda pop: paper.hunting(pop, parameters, strategy),
+    }
+    for step, function in steps.items():
+        yield {
+            "name": f"main/individual/{len(population)}/{step}",
+            "model": "main",
+            "engine": "individual",
+            "size": len(population),
+            "benchmark": step,
+            **measure(function, lambda: copy.deepcopy(population), repeat * 20),
+        }
+
+    for engine in ("individual", "jit"):
+        if engine == "jit":
+            # Compile outside the timings
+            paper.runSimulation(
+                parameters, strategy, samples=1, years=1, seed=0, engine=engine
+            )
+        yield {
+            "name": f"main/{engine}/{len(population)}/runSimulation",
+            "model": "main",
+            "engine": engine,
+            "size": len(population),
+            "benchmark": "runSimulation",
+            "samples": 10,
+            "years": 101,
+            **measure(
+                lambda _: paper.runSimulation(
+                    parameters, strategy, samples=10, years=101, seed=0, engine=engine
+                ),
+                repeat=repeat,
+            ),
+        }
+
+
+def blackmount_benchmarks(engine, size, repeat, run_samples):
+    parameters, strategy, initial = blackmount_parameters(size)
+    model = v2.get_engine(engine)
+    population = model.generateInitialPopulation(
+        initial["initial_stags"], initial["initial_hinds"], initial["initial_calves"]
+    )
+    rng = model.make_rng(0)
+    year = min(strategy.culling_data)
+
+    steps = {
+        "grow": lambda pop: model.grow(pop),
+        "reproduce": lambda pop: model.reproduce(pop, parameters, rng),
+        "naturalDeath": lambda pop: model.naturalDeath(pop, parameters, rng),
+        "hunting": lambda pop: model.hunting(pop, year, strategy, parameters, rng),
+    }
+    for step, function in steps.items():
+        yield {
+            "name": f"main_v2/{engine}/{size}/{step}",
+            "model": "main_v2",
+            "engine": engine,
+            "size": size,
+            "benchmark": step,
+            **measure(function, lambda: copy.deepcopy(population), repeat),
+        }
+
+    if run_samples:
+        yield {
+            "name": f"main_v2/{engine}/{size}/runSimulation",
+            "model": "main_v2",
+            "engine": engine,
+            "size": size,
+            "benchmark": "runSimulation",
+            "samples": run_samples,
+            "years": 14,
+            **measure(
+                lambda _: v2.runSimulation(
+                    parameters,
+                    strategy,
+                    samples=run_samples,
+                    engine=engine,
+                    seed=0,
+                    **initial,
+                ),
+                repeat=repeat,
+            ),
+        }
+
+
+def run_benchmarks(sizes, engines, repeat=5, run_samples=5):
+    yield from paper_benchmarks(repeat)
+
+    for size in sizes:
+        for engine in engines:
+            if engine in ("individual", "indexed") and size > MAX_INDIVIDUAL_SIZE:
+                continue
+            # Full runs only at the Black Mount scale, steps cover the rest
+            yield from blackmount_benchmarks(
+                engine,
+                size,
+                repeat,
+                run_samples if size == BLACK_MOUNT_SIZE else 0,
+            )
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """
+    Benchmarks whose median is more than threshold times the baseline median.
+    """
+
+    baseline_medians = {
+        record["name"]: record["median"] for record in baseline["results"]
+    }
+    regressions = []
+    for record in results:
+        if record["name"] not in baseline_medians:
+            continue
+        ratio = record["median"] / baseline_medians[record["name"]]
+        print(f"{record['name']:45} {ratio:6.2f}x")
+        if ratio > threshold:
+            regressions.append(record["name"])
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--output",
+        default=os.path.join(os.path.dirname(__file__), "baseline.json"),
+        help="JSON file to write the results to",
+    )
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown over the baseline reported as a regression",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=["individual", "indexed", "array", "cohort"],
+        help="main_v2 engines to benchmark",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[BLACK_MOUNT_SIZE, *SYNTHETIC_SIZES],
+        help="main_v2 herd sizes",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Black Mount scale only, fewer repeats",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [BLACK_MOUNT_SIZE] if args.quick else args.sizes
+    repeat = 2 if args.quick else args.repeat
+
+    results = []
+    for record in run_benchmarks(sizes, args.engines, repeat):
+        print(f"{record['name']:45} {record['median'] * 1000:10.3f} ms")
+        results.append(record)
+
+    with open(args.output, "w") as file:
+        json.dump({"environment": environment(), "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"Slower than {args.threshold}x the baseline: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Adaptive sample counts: keep adding samples in batches until the confidence
+intervals of chosen statistics are narrow enough, instead of guessing samples.
+
+    runAdaptiveSimulation(
+        parameters, huntingStrategy, [Target("num_individuals", tolerance=100)]
+    )
+
+runs batches of samples until the confidence interval of the mean final-year
+population has a half-width of at most 100 deer.
+
+Sweeps sample every scenario with the same seed streams (common random
+numbers), so sample k of two strategies sees the same random events as far as
+their populations allow. Comparing scenarios against a baseline, the intervals
+are then computed on the paired differences, which vary far less than either
+scenario's results and so need far fewer samples. Scenarios stop sampling as
+soon as their own targets are met.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from src.parallel import root_seed
+from src.sweep import Scenario, runSweep
+
+
+class Target:
+    def __init__(
+        self, column="num_individuals", tolerance=1.0, year=None, relative=False
+    ):
+        """
+        column: results column whose mean is estimated
+        tolerance: largest accepted confidence interval half-width
+        year: the year estimated, the last simulated by default. A sample that
+            stopped earlier counts with its last year.
+        relative: tolerance is a fraction of the absolute mean instead
+        """
+
+        self.column = column
+        self.tolerance = tolerance
+        self.year = year
+        self.relative = relative
+
+    @property
+    def name(self) -> str:
+        return self.column if self.year is None else f"{self.column}_{self.year}"
+
+    def values(self, results: pd.DataFrame) -> pd.Series:
+        """
+        The value of every sample, by iteration.
+        """
+
+        if self.year is not None:
+            results = results[results["year"] <= self.year]
+        return results.groupby("iteration")[self.column].last()
+
+    def met(self, mean: float, half_width: float) -> bool:
+        tolerance = self.tolerance * abs(mean) if self.relative else self.tolerance
+        return half_width <= tolerance
+
+
+def confidence_half_width(values, confidence=0.95) -> float:
+    """
+    Half-width of the normal confidence interval for the mean of values.
+    """
+
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return np.inf
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return float(z * values.std(ddof=1) / np.sqrt(len(values)))
+
+
+class AdaptiveSweep:
+    def __init__(self, results: pd.DataFrame, estimates: pd.DataFrame):
+        self.results = results  # runSweep table, every sample of every scenario
+        self.estimates = estimates  # One row per scenario and target
+
+    @property
+    def converged(self) -> bool:
+        return bool(self.estimates["converged"].all())
+
+
+def estimate(targets: list, results: pd.DataFrame, reference=None, confidence=0.95):
+    """
+    One row per target: mean (of the difference from reference, if given,
+    sample by sample), confidence interval half-width and whether it is met.
+    """
+
+    rows = []
+    for target in targets:
+        values = target.values(results)
+        if reference is not None:
+            values = values - target.values(reference).reindex(values.index)
+        mean = float(values.mean())
+        half_width = confidence_half_width(values, confidence)
+        rows.append(
+            {
+                "target": target.name,
+                "paired": reference is not None,
+                "mean": mean,
+                "half_width": half_width,
+                "samples": len(values),
+                "converged": target.met(mean, half_width),
+            }
+        )
+
+    return rows
+
+
+def runAdaptiveSweep(
+    scenarios: list,
+    targets: list,
+    baseline: str = None,
+    confidence=0.95,
+    initial_samples=20,
+    batch_samples=20,
+    max_samples=1000,
+    seed=None,
+    workers=1,
+    **options,
+) -> AdaptiveSweep:
+    """
+    runSweep with as many samples per scenario as its targets need, from
+    initial_samples up to max_samples in steps of batch_samples.
+
+    targets: Target list, met by every scenario
+    baseline: name of the scenario the others are compared with. The targets
+        of the other scenarios then apply to their paired difference from it,
+        and the baseline samples until they are all met.
+    options: runSweep keyword arguments, e.g. end_year, engine or model
+    """
+
+    if initial_samples < 2:
+        raise ValueError("initial_samples must be at least 2 to estimate an interval")
+    if max_samples < initial_samples:
+        raise ValueError("max_samples must be at least initial_samples")
+    if batch_samples < 1:
+        raise ValueError("batch_samples must be positive")
+
+    # The same streams every round, and for every scenario
+    seed = root_seed(seed)
+
+    names = [scenario.name for scenario in scenarios]
+    if baseline is not None and baseline not in names:
+        raise ValueError(f"Unknown baseline scenario: {baseline!r}")
+
+    frames = []
+    estimates = {}
+    active = list(names)
+    sampled = 0
+    samples = initial_samples
+    while active and samples > 0:
+        frames.append(
+            runSweep(
+                [scenario for scenario in scenarios if scenario.name in active],
+                samples=samples,
+                seed=seed,
+                workers=workers,
+                first_sample=sampled,
+                **options,
+            )
+        )
+        sampled += samples
+
+        results = pd.concat(frames, ignore_index=True)
+        by_scenario = dict(list(results.groupby("scenario", sort=False)))
+        for name in active:
+            reference = None
+            if baseline is not None and name != baseline:
+                reference = by_scenario[baseline]
+            estimates[name] = estimate(
+                targets, by_scenario[name], reference, confidence
+            )
+
+        converged = {
+            name: all(row["converged"] for row in estimates[name]) for name in active
+        }
+        active = [name for name in active if not converged[name]]
+        if baseline is not None and active and baseline not in active:
+            # The comparisons still sampling need the baseline's samples
+            active.append(baseline)
+        samples = min(batch_samples, max_samples - sampled)
+
+    # Scenario by scenario, in sample order, as runSweep returns them
+    order = results["scenario"].map({name: i for i, name in enumerate(names)})
+    results = results.iloc[
+        np.lexsort((results["year"], results["iteration"], order))
+    ].reset_index(drop=True)
+
+    return AdaptiveSweep(
+        results,
+        pd.DataFrame(
+            [{"scenario": name, **row} for name in names for row in estimates[name]]
+        ),
+    )
+
+
+def runAdaptiveSimulation(
+    parameters,
+    huntingStrategy,
+    targets: list,
+    confidence=0.95,
+    initial_samples=20,
+    batch_samples=20,
+    max_samples=1000,
+    seed=None,
+    workers=1,
+    **options,
+) -> AdaptiveSweep:
+    """
+    runSimulation with as many samples as the targets need, see
+    runAdaptiveSweep. The results have no scenario column.
+
+    options: runSimulation keyword arguments, and model="main" for the paper
+        model
+    """
+
+    adaptive = runAdaptiveSweep(
+        [Scenario("default", parameters, huntingStrategy)],
+        targets,
+        confidence=confidence,
+        initial_samples=initial_samples,
+        batch_samples=batch_samples,
+        max_samples=max_samples,
+        seed=seed,
+        workers=workers,
+        **options,
+    )
+    adaptive.results = adaptive.results.drop(columns="scenario")
+    adaptive.estimates = adaptive.estimates.drop(columns="scenario")
+    return adaptive
@@ -0,0 +1,232 @@
+"""
+NumPy-backed version of the main_v2 population.
+
+Deer are stored as two parallel arrays (age and sex) kept in the same order as
+the ``List[Deer]`` used by ``src.main_v2``, so ``hunting`` removes the same
+individuals the list model would. Every yearly step is vectorised and draws its
+random numbers in bulk from a ``numpy.random.Generator``.
+
+The functions mirror the names and signatures of ``src.main_v2`` so the module
+can be passed to ``runSimulation(..., engine="array")`` as a drop-in engine.
+"""
+
+import numpy as np
+
+from src.main_v2 import (
+    AGE_CLASSES,
+    HuntingParameters,
+    ModelParameters,
+    adjustMortalityRate,
+)
+
+
+class ArrayPopulation:
+    def __init__(self, age: np.ndarray, isFemale: np.ndarray):
+        self.age = age  # i_a
+        self.isFemale = isFemale  # i_f
+
+    @property
+    def isMale(self) -> np.ndarray:  # i_m
+        return ~self.isFemale
+
+    def __len__(self):
+        return len(self.age)
+
+    def take(self, index) -> "ArrayPopulation":
+        return ArrayPopulation(self.age[index], self.isFemale[index])
+
+
+def make_rng(seed=None) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def grow(population: ArrayPopulation):
+    population.age += 1
+
+    return population
+
+
+def reproduce(
+    population: ArrayPopulation, params: ModelParameters, rng: np.random.Generator
+):
+    hasMale = np.any(population.isMale & (population.age >= 1))
+
+    if not hasMale:
+        return population
+
+    age = population.age
+    fertility = params.vitalRates.fertility_table()
+    probReproduce = np.where(
+        population.isFemale, fertility[np.minimum(age, len(fertility) - 1)], 0.0
+    )
+
+    numNewDeer = np.count_nonzero(rng.random(len(population)) < probReproduce)
+    if numNewDeer == 0:
+        return population
+
+    male = rng.random(numNewDeer) < params.probMale
+
+    return ArrayPopulation(
+        np.concatenate([age, np.zeros(numNewDeer, dtype=age.dtype)]),
+        np.concatenate([population.isFemale, ~male]),
+    )
+
+
+def naturalDeath(
+    population: ArrayPopulation, params: ModelParameters, rng: np.random.Generator
+):
+    if len(population) == 0:
+        return population
+
+    inow = len(population)  # Current population size
+    imax = params.maximumIndividuals  # Maximum carrying capacity
+
+    # The carrying capacity adjustment (Algorithm 3) is the same for every deer
+    adjustment = adjustMortalityRate(
+        0.0,
+        params.maxCapacityImpact,
+        params.capacityCurveSlope,
+        inow,
+        imax,
+    )
+    mortality = params.vitalRates.mortality_table()
+    adjusted_mortality = (
+        mortality[np.minimum(population.age, len(mortality) - 1)] + adjustment
+    )
+
+    survivors = rng.random(inow) >= adjusted_mortality
+
+    return population.take(survivors)
+
+
+def get_group(
+    population: ArrayPopulation,
+    age: int = None,
+    min_age: int = None,
+    max_age: int = None,
+    onlyMale: bool = False,
+    onlyFemale: bool = False,
+) -> np.ndarray:
+    """
+    Returns the indices (in population order) of the deer matching every filter.
+    """
+
+    mask = np.ones(len(population), dtype=bool)
+
+    if age is not None:
+        mask &= population.age == age
+    if min_age is not None:
+        mask &= population.age >= min_age
+    if max_age is not None:
+        mask &= population.age <= max_age
+    if onlyMale:
+        mask &= population.isMale
+    if onlyFemale:
+        mask &= population.isFemale
+
+    return np.flatnonzero(mask)
+
+
+def hunting(
+    population: ArrayPopulation,
+    year: int,
+    huntingStrategy: HuntingParameters,
+    params: ModelParameters,
+    rng: np.random.Generator = None,  # Unused: array order decides who is culled
+):
+    # Retrieve cull data for the current year
+    year_cull = huntingStrategy.culling_data.get(
+        year, {"calves": 0, "hinds": 0, "stags": 0}
+    )
+
+    calves = get_group(population, min_age=0, max_age=2)
+    if len(calves) > params.huntingLimit:
+        calves = calves[min(year_cull["calves"], len(calves)) :]
+
+    hinds = get_group(population, min_age=3, onlyFemale=True)
+    if len(hinds) > params.huntingLimit:
+        hinds = hinds[min(year_cull["hinds"], len(hinds)) :]
+
+    stags = get_group(population, min_age=3, onlyMale=True)
+    if len(stags) > params.huntingLimit:
+        stags = stags[min(year_cull["stags"], len(stags)) :]
+
+    # Rebuild population with remaining deer, in the same order as main_v2
+    return population.take(np.concatenate([calves, hinds, stags]))
+
+
+def generateInitialPopulation(
+    total_stags=1800,
+    total_hinds=3700,
+    total_calves=3700,
+):
+    """
+    Same initial population (and ordering) as main_v2.generateInitialPopulation.
+    """
+
+    adult_ages = np.arange(3, 16, dtype=np.int16)
+    calf_ages = np.arange(3, dtype=np.int16)
+
+    age = np.concatenate(
+        [
+            np.repeat(adult_ages, total_stags // 13),
+            np.repeat(adult_ages, total_hinds // 13),
+            np.repeat(calf_ages, 2 * (total_calves // 6)),
+        ]
+    )
+    isFemale = np.concatenate(
+        [
+            np.zeros(13 * (total_stags // 13), dtype=bool),
+            np.ones(13 * (total_hinds // 13), dtype=bool),
+            # Female and male calves alternate within each age
+            np.tile([True, False], 3 * (total_calves // 6)),
+        ]
+    )
+
+    return ArrayPopulation(age, isFemale)
+
+
+def count_population(population: ArrayPopulation):
+    adult = population.age >= 3
+
+    num_calves = len(population) - np.count_nonzero(adult)
+    num_stags = np.count_nonzero(adult & population.isMale)
+    num_hinds = np.count_nonzero(adult & population.isFemale)
+
+    return int(num_calves), int(num_stags), int(num_hinds)
+
+
+def copy_population(population: ArrayPopulation) -> ArrayPopulation:
+    return ArrayPopulation(population.age.copy(), population.isFemale.copy())
+
+
+def sex_age_counts(population: ArrayPopulation) -> np.ndarray:
+    """
+    Number of deer of each [sex, age] (female first), the last age class
+    absorbing, in one bincount.
+    """
+
+    index = population.isMale * AGE_CLASSES + np.minimum(
+        population.age, AGE_CLASSES - 1
+    )
+    return np.bincount(index, minlength=2 * AGE_CLASSES).reshape(2, AGE_CLASSES)
+
+
+def summarise_population(population: ArrayPopulation, age_format: str = "list"):
+    num_calves, num_stags, num_hinds = count_population(population)
+    if age_format == "counts":
+        age_distribution = np.bincount(
+            np.minimum(population.age, AGE_CLASSES - 1), minlength=AGE_CLASSES
+        )
+    else:
+        age_distribution = population.age.tolist()
+    average_age = float(population.age.mean()) if len(population) else 0
+
+    return (
+        len(population),
+        num_stags,
+        num_hinds,
+        num_calves,
+        age_distribution,
+        average_age,
+    )
@@ -0,0 +1,81 @@
+"""
+Black Mount deer management group data (see README) and the culling strategies
+used in blackmount_desired_density.ipynb.
+"""
+
+from src.main_v2 import HuntingParameters
+
+AREA = 910  # km^2
+DESIRED_DENSITY = 4  # deer per km^2 for natural regeneration
+DESIRED_POPULATION = AREA * DESIRED_DENSITY
+
+# Deer Count Figures (2005-2018) from Figure 2
+OBSERVED_COUNTS = {
+    2005: {"stags": 2000, "hinds": 4100, "calves": 4100, "total": 10200},
+    2008: {"stags": 1900, "hinds": 3850, "calves": 3500, "total": 9250},
+    2011: {"stags": 1800, "hinds": 3950, "calves": 3500, "total": 9350},
+    2014: {"stags": 1600, "hinds": 3500, "calves": 3000, "total": 8100},
+    2015: {"stags": 1700, "hinds": 4000, "calves": 4000, "total": 9700},
+    2018: {"stags": 1400, "hinds": 3600, "calves": 3500, "total": 8500},
+}
+
+# Deer Cull Figures (2005-2018) from Figure 3
+REAL_CULLING_DATA = {
+    2005: {"calves": 160, "hinds": 570, "stags": 420},
+    2006: {"calves": 200, "hinds": 500, "stags": 520},
+    2007: {"calves": 260, "hinds": 580, "stags": 450},
+    2008: {"calves": 210, "hinds": 550, "stags": 450},
+    2009: {"calves": 260, "hinds": 490, "stags": 430},
+    2010: {"calves": 270, "hinds": 510, "stags": 520},
+    2011: {"calves": 160, "hinds": 490, "stags": 550},
+    2012: {"calves": 290, "hinds": 600, "stags": 590},
+    2013: {"calves": 290, "hinds": 650, "stags": 610},
+    2014: {"calves": 290, "hinds": 620, "stags": 500},
+    2015: {"calves": 220, "hinds": 590, "stags": 510},
+    2016: {"calves": 290, "hinds": 610, "stags": 490},
+    2017: {"calves": 400, "hinds": 830, "stags": 600},
+    2018: {"calves": 200, "hinds": 520, "stags": 580},
+}
+
+calf_base_rate = 20
+hind_base_rate = 50
+stag_base_rate = 50
+
+
+def create_hunting_strategy(
+    period_1_multiplier,
+    period_2_multiplier,
+    change_year,
+    start_year=2019,
+    end_year=2050,
+):
+    """
+    The real culls up to 2018, then the base rates times period_1_multiplier
+    until change_year and times period_2_multiplier after it. As in the
+    notebook, change_year and end_year themselves have no cull.
+    """
+
+    culling_data = {
+        **REAL_CULLING_DATA,
+        **{
+            year: {
+                "calves": calf_base_rate * period_1_multiplier,
+                "hinds": hind_base_rate * period_1_multiplier,
+                "stags": stag_base_rate * period_1_multiplier,
+            }
+            for year in range(start_year, change_year)
+        },
+        **{
+            year: {
+                "calves": calf_base_rate * period_2_multiplier,
+                "hinds": hind_base_rate * period_2_multiplier,
+                "stags": stag_base_rate * period_2_multiplier,
+            }
+            for year in range(change_year + 1, end_year)
+        },
+    }
+
+    # Instantiate HuntingParameters with yearly cull data
+    hunting_strategy = HuntingParameters(culling_data=culling_data)
+
+    return hunting_strategy
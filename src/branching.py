@@ -0,0 +1,201 @@
+"""
+Sweeps of scenarios sharing their history. Every culling strategy of
+blackmount_desired_density.ipynb culls the real numbers up to 2018 and only
+diverges from 2019, yet runSweep simulates 2005-2018 again for each of them.
+
+runBranchedSweep simulates the shared years once per sample, snapshots the
+population and the random generator at the end of shared_until, and continues
+every scenario from its own copy of the snapshot. A scenario's sample draws the
+same random numbers in the same order as in a full run, so the results are
+identical to runSweep with the same seed.
+"""
+
+import copy
+import inspect
+
+import pandas as pd
+
+from src.cache import cache_key
+from src.main_v2 import (
+    HuntingParameters,
+    ModelParameters,
+    get_engine,
+    iterateSample,
+    result_columns,
+)
+from src.parallel import imap_jobs, sample_seeds
+from src.results import ResultBuffer
+from src.sweep import collect_sweep
+
+# runSimulation options of a branch, the others must be the same for every one
+BRANCH_OPTIONS = ("end_year", "stop_sample")
+
+# runSimulation options that do not apply to single samples
+UNSUPPORTED_OPTIONS = ("batched", "batch_size", "profile")
+
+
+def shared_strategy(huntingStrategy: HuntingParameters, shared_until: int):
+    return HuntingParameters(
+        culling_data={
+            year: year_cull
+            for year, year_cull in huntingStrategy.culling_data.items()
+            if year <= shared_until
+        }
+    )
+
+
+def runBranchedSample(
+    parameters: ModelParameters,
+    branches: list,
+    shared_until: int,
+    iteration=0,
+    seed=None,
+    **options,
+) -> list:
+    """
+    The runSample results of every branch of one sample, a branch being a
+    (huntingStrategy, end_year, stop_sample) tuple. The years up to
+    shared_until are simulated once, with the first branch's culls.
+
+    options: iterateSample keyword arguments shared by every branch
+    """
+
+    model = get_engine(options.get("engine", "individual"))
+    rng = model.make_rng(seed)
+
+    shared = []
+    for row in iterateSample(
+        parameters,
+        branches[0][0],
+        iteration,
+        end_year=shared_until,
+        include_population=True,
+        rng=rng,
+        **options,
+    ):
+        shared.append(row)
+
+    columns = result_columns(options.get("age_format", "list"), options.get("metrics"))
+    results = []
+    for branch, (huntingStrategy, end_year, stop_sample) in enumerate(branches):
+        buffer = ResultBuffer(columns, len(shared) + max(end_year - shared_until, 0))
+        results.append(buffer)
+
+        stopped = False
+        for row in shared:
+            if row["year"] > end_year:
+                break
+            buffer.append(**row)
+            if stop_sample is not None and stop_sample(row):
+                stopped = True
+                break
+        if stopped or end_year <= shared_until:
+            continue
+
+        # The last branch can continue from the snapshot itself
+        population, branch_rng = shared[-1]["population"], rng
+        if branch < len(branches) - 1:
+            population = model.copy_population(population)
+            branch_rng = copy.deepcopy(rng)
+
+        for row in iterateSample(
+            parameters,
+            huntingStrategy,
+            iteration,
+            start_year=shared_until + 1,
+            end_year=end_year,
+            population=population,
+            rng=branch_rng,
+            **options,
+        ):
+            buffer.append(**row)
+            if stop_sample is not None and stop_sample(row):
+                break
+
+    return results
+
+
+def runBranchedSweep(
+    scenarios: list,
+    shared_until=2018,
+    samples=100,
+    seed=None,
+    workers=1,
+    first_sample=0,
+    store=None,
+    chunk_samples=100,
+    **options,
+) -> pd.DataFrame:
+    """
+    runSweep for main_v2 scenarios that only differ after shared_until:
+    the same ModelParameters, culls up to shared_until and runSimulation
+    options, apart from end_year and stop_sample. Raises ValueError if they
+    differ.
+
+    Each job is one sample of every scenario, spread over workers.
+    """
+
+    defaults = {
+        name: parameter.default
+        for name, parameter in inspect.signature(iterateSample).parameters.items()
+    }
+    scenario_options = [{**options, **scenario.options} for scenario in scenarios]
+    for name in UNSUPPORTED_OPTIONS:
+        if any(name in each and each[name] for each in scenario_options):
+            raise ValueError(f"{name} cannot be used with a shared history")
+
+    keys = {
+        cache_key(
+            "main_v2",
+            scenario.parameters,
+            shared_strategy(scenario.huntingStrategy, shared_until),
+            {
+                name: value
+                for name, value in each.items()
+                if name not in BRANCH_OPTIONS
+            },
+        )
+        for scenario, each in zip(scenarios, scenario_options)
+    }
+    if len(keys) > 1:
+        raise ValueError(f"The scenarios differ before {shared_until + 1}")
+
+    shared_options = {
+        name: value
+        for name, value in scenario_options[0].items()
+        if name not in BRANCH_OPTIONS + UNSUPPORTED_OPTIONS
+    }
+    if shared_until < shared_options.get("start_year", defaults["start_year"]):
+        raise ValueError("shared_until is before the first year simulated")
+    branches = [
+        (
+            scenario.huntingStrategy,
+            each.get("end_year", defaults["end_year"]),
+            each.get("stop_sample"),
+        )
+        for scenario, each in zip(scenarios, scenario_options)
+    ]
+    jobs = [
+        {
+            "parameters": scenarios[0].parameters,
+            "branches": branches,
+            "shared_until": shared_until,
+            "iteration": i,
+            "seed": sample_seed,
+            **shared_options,
+        }
+        for i, sample_seed in enumerate(
+            sample_seeds(seed, samples, first_sample), start=first_sample
+        )
+    ]
+
+    return collect_sweep(
+        scenarios,
+        (
+            (index, branch_results)
+            for sample_results in imap_jobs(runBranchedSample, jobs, workers)
+            for index, branch_results in enumerate(sample_results)
+        ),
+        store,
+        chunk_samples,
+    )
@@ -0,0 +1,221 @@
+"""
+Persistent cache of runSimulation results, so re-running a notebook after a
+kernel restart does not re-simulate everything.
+
+Results are stored under a key hashing everything they depend on: the model,
+the ModelParameters fields, the culling data, the initial population, the
+years, the seed and the remaining runSimulation options. The number of samples
+is not part of the key: a run with the same seed can be topped up with more
+samples (see first_sample in runSimulation), so asking for 200 samples when
+100 are cached only runs the missing 100. Batched runs are the exception: the
+samples of a batch share one random stream, so their rows depend on how the
+samples are split into batches, and they are only reused for the same samples
+and batch_size.
+
+Entries are evicted least recently used first once the cache grows past
+max_bytes.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+from src.sweep import get_model
+
+# Bump when a model change alters the results of the same arguments, so stale
+# entries are never returned
+MODEL_VERSION = 1
+
+# runSimulation arguments that do not change the rows of a sample
+_NOT_IN_KEY = ("samples", "workers", "batch_size", "first_sample")
+
+
+def _canonical(value):
+    # JSON-able form of parameters, culling data and stopping conditions
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, functools.partial):
+        return {
+            "partial": _canonical(value.func),
+            "args": _canonical(value.args),
+            "keywords": _canonical(value.keywords),
+        }
+    if isinstance(value, types.MethodType):
+        return {
+            "method": _canonical(value.__func__),
+            "self": _canonical(value.__self__),
+        }
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        # Named by where they are defined; lambdas and closures have no such
+        # name, and their class alone would give every one the same key
+        name = getattr(value, "__qualname__", "")
+        if not name or "<lambda>" in name or "<locals>" in name:
+            raise TypeError(
+                f"Cannot build a cache key from {value!r}, use a module-level "
+                "function or an object with its settings as attributes"
+            )
+        return {"function": f"{value.__module__}.{name}"}
+    if hasattr(value, "__dict__"):
+        # Private attributes hold derived state, e.g. memoised tables
+        return {
+            "class": f"{type(value).__module__}.{type(value).__qualname__}",
+            **_canonical(
+                {name: item for name, item in vars(value).items() if name[0] != "_"}
+            ),
+        }
+    raise TypeError(f"Cannot build a cache key from {type(value).__name__}")
+
+
+def cache_key(model: str, parameters, huntingStrategy, options: dict) -> str:
+    """
+    sha256 of the canonical JSON of everything a run's results depend on.
+    """
+
+    description = {
+        "model": model,
+        "version": MODEL_VERSION,
+        "parameters": _canonical(parameters),
+        "huntingStrategy": _canonical(huntingStrategy),
+        "options": _canonical(
+            {name: value for name, value in options.items() if name not in _NOT_IN_KEY}
+        ),
+    }
+    text = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SimulationCache:
+    def __init__(self, path, max_bytes=2**30):
+        """
+        path: directory holding the cached results, created if missing
+        max_bytes: total size the cache is trimmed to after every write
+        """
+
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, "index.json")
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.pkl")
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write_index(self, index: dict):
+        # Replace atomically so an interrupted write never corrupts the index
+        temporary = f"{self._index_path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(index, file)
+        os.replace(temporary, self._index_path)
+
+    def __len__(self):
+        return len(self._read_index())
+
+    @property
+    def size(self) -> int:
+        return sum(entry["bytes"] for entry in self._read_index().values())
+
+    def clear(self):
+        for key in self._read_index():
+            if os.path.exists(self._file(key)):
+                os.remove(self._file(key))
+        self._write_index({})
+
+    def _evict(self, index: dict, keep: str):
+        # Least recently used first, never the entry just written
+        for key in sorted(index, key=lambda key: index[key]["last_used"]):
+            if sum(entry["bytes"] for entry in index.values()) <= self.max_bytes:
+                break
+            if key != keep:
+                if os.path.exists(self._file(key)):
+                    os.remove(self._file(key))
+                del index[key]
+
+    def runSimulation(
+        self,
+        parameters,
+        huntingStrategy,
+        samples=100,
+        seed=None,
+        model="main_v2",
+        **options,
+    ) -> pd.DataFrame:
+        """
+        runSimulation of the given model, reusing and topping up cached samples.
+
+        seed is required: without it the samples cannot be reproduced, so
+        there is nothing to cache. options are the model's runSimulation
+        keyword arguments, e.g. end_year, engine or workers.
+        """
+
+        if seed is None:
+            raise ValueError("Only seeded runs can be cached, pass a seed")
+        for option in ("store", "summary", "profile", "first_sample"):
+            if option in options:
+                raise ValueError(
+                    f"Cached runs return a DataFrame of samples 0 to samples - 1, "
+                    f"{option} is not supported"
+                )
+
+        key_options = {"seed": seed, **options}
+        if options.get("batched"):
+            # Rows depend on the batches, so no top-ups: key on the whole split
+            key_options["batches"] = [samples, options.get("batch_size")]
+        key = cache_key(model, parameters, huntingStrategy, key_options)
+        index = self._read_index()
+        entry = index.get(key)
+
+        cached = None
+        cached_samples = 0
+        if entry is not None and os.path.exists(self._file(key)):
+            cached = pd.read_pickle(self._file(key))
+            cached_samples = entry["samples"]
+
+        if cached_samples >= samples:
+            results = cached[cached["iteration"] < samples].reset_index(drop=True)
+        else:
+            new_results = get_model(model).runSimulation(
+                parameters,
+                huntingStrategy,
+                samples=samples - cached_samples,
+                seed=seed,
+                first_sample=cached_samples,
+                **options,
+            )
+            results = (
+                new_results
+                if cached is None
+                else pd.concat([cached, new_results], ignore_index=True)
+            )
+            results.to_pickle(self._file(key))
+            entry = {"samples": samples, "bytes": os.path.getsize(self._file(key))}
+
+        # Re-read in case another process updated the index meanwhile
+        index = self._read_index()
+        index[key] = {**entry, "last_used": time.time()}
+        self._evict(index, keep=key)
+        self._write_index(index)
+
+        return results
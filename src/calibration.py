@@ -0,0 +1,263 @@
+"""
+Approximate Bayesian Computation (ABC) calibration of the main_v2 model
+against the Black Mount counts.
+
+Parameters are drawn from their priors and each draw is simulated with the
+real culling data. The draw is accepted if the distance between its stag, hind
+and calf counts and OBSERVED_COUNTS is at most the tolerance. The distance is
+the root mean square relative error over every observed (year, group):
+
+    sqrt(sum(((simulated - observed) / observed) ** 2) / observations)
+
+The sum only grows as the years go by, so a draw is rejected as soon as the
+years simulated so far already put it over the tolerance, and the remaining
+years are never simulated. Early rejection never rejects a draw that would
+have been accepted.
+
+Draws run in batches of batch_size, spread over workers. Draw k always gets
+the same seed stream for a given seed, whatever the batching.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.blackmount import OBSERVED_COUNTS, REAL_CULLING_DATA
+from src.main_v2 import HuntingParameters, ModelParameters, iterateSample
+from src.parallel import imap_jobs, sample_seeds
+
+GROUP_COLUMNS = {"stags": "num_stags", "hinds": "num_hinds", "calves": "num_calves"}
+
+
+class Uniform:
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: np.random.Generator, size=None):
+        return rng.uniform(self.low, self.high, size)
+
+    def quantile(self, u):
+        return self.low + np.asarray(u) * (self.high - self.low)
+
+    def cdf(self, x):
+        return np.clip((np.asarray(x) - self.low) / (self.high - self.low), 0, 1)
+
+
+class LogUniform:
+    """
+    Uniform on a log scale, for parameters spanning orders of magnitude.
+    """
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: np.random.Generator, size=None):
+        return np.exp(rng.uniform(np.log(self.low), np.log(self.high), size))
+
+    def quantile(self, u):
+        return np.exp(
+            np.log(self.low) + np.asarray(u) * (np.log(self.high) - np.log(self.low))
+        )
+
+    def cdf(self, x):
+        return np.clip(
+            np.log(np.asarray(x) / self.low) / np.log(self.high / self.low), 0, 1
+        )
+
+
+# The parameters tuned by eye in blackmount.ipynb
+PRIORS = {
+    "probYoungReproduce": Uniform(0.0, 0.5),
+    "probMatureReproduce": Uniform(0.3, 1.0),
+    "maxCapacityImpact": Uniform(0.0, 0.5),  # c
+    "capacityCurveSlope": LogUniform(1e-4, 1.0),  # a
+}
+
+# The blackmount.ipynb values of the parameters that are not calibrated
+FIXED_PARAMETERS = {
+    "maxCapacityImpact": 0.1,
+    "capacityCurveSlope": 1,
+    "maximumIndividuals": 15300,
+    "huntingLimit": 100,
+}
+
+
+class Calibration:
+    def __init__(self, draws: pd.DataFrame, tolerance: float):
+        self.draws = draws  # One row per draw, accepted or not
+        self.tolerance = tolerance
+
+    @property
+    def posterior(self) -> pd.DataFrame:
+        """
+        The accepted draws.
+        """
+
+        return self.draws[self.draws["accepted"]].reset_index(drop=True)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return float(self.draws["accepted"].mean())
+
+
+def observation_table(
+    observed: dict, groups=tuple(GROUP_COLUMNS), start_year=None
+) -> dict:
+    """
+    Observed counts by year as arrays in groups order, from start_year on.
+    Raises ValueError if no year is left.
+    """
+
+    table = {
+        year: np.array([counts[group] for group in groups], dtype=float)
+        for year, counts in observed.items()
+        if start_year is None or year >= start_year
+    }
+    if not table:
+        raise ValueError(f"No observed counts from {start_year} on")
+    return table
+
+
+def draw_parameters(priors: dict, seed) -> dict:
+    rng = np.random.default_rng(seed)
+    return {name: float(prior.sample(rng)) for name, prior in priors.items()}
+
+
+def runCalibrationBatch(
+    draws: list,
+    seeds: list,
+    tolerance: float,
+    huntingStrategy: HuntingParameters,
+    observed: dict,
+    fixed: dict,
+    groups=tuple(GROUP_COLUMNS),
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    start_year=2005,
+    engine="cohort",
+) -> list:
+    """
+    Simulates each draw (a dict of ModelParameters arguments) until it is
+    rejected or reaches the last observed year. Returns (distance, last year
+    simulated, accepted) for every draw, the distance being that of the years
+    simulated.
+    """
+
+    # Years before start_year are never simulated and would deflate the distance
+    observations = observation_table(observed, groups, start_year)
+    total = len(observations) * len(groups)
+    end_year = max(observations)
+    columns = [GROUP_COLUMNS[group] for group in groups]
+    # Distances are compared squared and summed, as the partial sums grow
+    limit = tolerance**2 * total
+
+    outcomes = []
+    for draw, seed in zip(draws, seeds):
+        squared_error = 0.0
+        year = start_year
+        for row in iterateSample(
+            ModelParameters(**{**fixed, **draw}),
+            huntingStrategy,
+            seed=seed,
+            initial_stags=initial_stags,
+            initial_hinds=initial_hinds,
+            initial_calves=initial_calves,
+            start_year=start_year,
+            end_year=end_year,
+            engine=engine,
+            metrics=columns,
+        ):
+            year = row["year"]
+            if year not in observations:
+                continue
+            simulated = np.array([row[column] for column in columns], dtype=float)
+            observed_counts = observations[year]
+            squared_error += (
+                ((simulated - observed_counts) / observed_counts) ** 2
+            ).sum()
+            if squared_error > limit:
+                break  # Rejected, skip the remaining years
+
+        outcomes.append(
+            (float(np.sqrt(squared_error / total)), year, bool(squared_error <= limit))
+        )
+
+    return outcomes
+
+
+def calibrate(
+    draws=10000,
+    tolerance=0.5,
+    priors=None,
+    huntingStrategy=None,
+    observed=OBSERVED_COUNTS,
+    fixed=None,
+    groups=tuple(GROUP_COLUMNS),
+    seed=None,
+    workers=1,
+    batch_size=100,
+    engine="cohort",
+    first_draw=0,
+    **options,
+) -> Calibration:
+    """
+    ABC rejection sampling of the priors given the observed counts.
+
+    draws: number of parameter draws
+    tolerance: largest accepted root mean square relative error, see above
+    priors: distribution (with a sample(rng) method) of every calibrated
+        ModelParameters argument, PRIORS by default
+    huntingStrategy: the culls simulated, REAL_CULLING_DATA by default
+    observed: counts by year and group, OBSERVED_COUNTS by default
+    fixed: ModelParameters arguments that are not calibrated
+    groups: the observed groups compared, any of stags, hinds and calves
+    first_draw: number the draws from first_draw, to add draws to an earlier
+        calibration with the same seed
+    options: initial_stags, initial_hinds, initial_calves or start_year
+
+    The cohort engine simulates a draw in milliseconds; any main_v2 engine can
+    be used.
+    """
+
+    priors = priors or PRIORS
+    huntingStrategy = huntingStrategy or HuntingParameters(
+        culling_data=REAL_CULLING_DATA
+    )
+    fixed = {**FIXED_PARAMETERS, **(fixed or {})}
+
+    # Each draw has its own streams for its parameters and its simulation
+    draw_seeds = [
+        draw_seed.spawn(2) for draw_seed in sample_seeds(seed, draws, first_draw)
+    ]
+    records = [draw_parameters(priors, prior_seed) for prior_seed, _ in draw_seeds]
+    seeds = [model_seed for _, model_seed in draw_seeds]
+
+    jobs = [
+        {
+            "draws": records[first : first + batch_size],
+            "seeds": seeds[first : first + batch_size],
+            "tolerance": tolerance,
+            "huntingStrategy": huntingStrategy,
+            "observed": observed,
+            "fixed": fixed,
+            "groups": groups,
+            "engine": engine,
+            **options,
+        }
+        for first in range(0, draws, batch_size)
+    ]
+
+    outcomes = [
+        outcome
+        for batch_outcomes in imap_jobs(runCalibrationBatch, jobs, workers)
+        for outcome in batch_outcomes
+    ]
+    frame = pd.DataFrame(records)
+    frame["distance"] = [distance for distance, _, _ in outcomes]
+    frame["last_year"] = [year for _, year, _ in outcomes]
+    frame["accepted"] = [accepted for _, _, accepted in outcomes]
+    frame.insert(0, "draw", np.arange(first_draw, first_draw + draws))
+
+    return Calibration(frame, tolerance)
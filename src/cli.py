@@ -0,0 +1,225 @@
+"""
+Command-line batch runs of scenario files, without a notebook:
+
+    python -m src.cli scenarios.toml --output results/ --workers 16
+
+runs every scenario of the file as one runSweep and writes the results to a
+ResultStore directory (Parquet, needs pyarrow), or to one CSV file if the
+output ends in .csv. ``python -m src.main_v2`` and ``python -m src.main`` do the
+same, with their own model as the default.
+
+Scenario files are TOML or JSON, e.g.
+
+    model = "main_v2"  # or "main", the paper model
+    samples = 100
+    seed = 1
+
+    [parameters]  # ModelParameters arguments of every scenario
+    maxCapacityImpact = 0.1
+    capacityCurveSlope = 1
+    huntingLimit = 100
+    maximumIndividuals = 15300
+
+    [options]  # runSimulation arguments of every scenario
+    end_year = 2050
+    engine = "cohort"
+    age_format = "counts"
+
+    [[scenarios]]
+    name = "real culls"
+    culling = "real"  # REAL_CULLING_DATA
+
+    [[scenarios]]
+    name = "double, then base"
+    strategy = {period_1_multiplier = 2, period_2_multiplier = 1, change_year = 2034}
+
+    [[scenarios]]
+    name = "custom"
+    culling = {2019 = {calves = 100, hinds = 250, stags = 200}}
+    parameters = {huntingLimit = 50}  # Overrides, as can options be
+
+A main_v2 scenario gives its culls as culling, a year to counts table or "real",
+or as strategy, the blackmount.create_hunting_strategy arguments. A main
+scenario's culling is the HuntingParameters arguments (calves, youngHinds,
+youngStags, matureHinds, matureStags).
+
+The models and the modules they import leave pandas out until a DataFrame is
+built, so worker processes start quickly; only this process loads it, to write
+the output.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from src.sweep import Scenario, get_model, runSweep
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+CONFIG_KEYS = ("model", "samples", "seed", "workers", "parameters", "options")
+SCENARIO_KEYS = ("name", "parameters", "culling", "strategy", "options", "labels")
+
+
+def load_config(path) -> dict:
+    """
+    The contents of a TOML or JSON scenario file.
+    """
+
+    path = os.fspath(path)
+    if path.endswith(".json"):
+        with open(path) as file:
+            return json.load(file)
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML scenario files need Python 3.11, use JSON")
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+    raise ValueError(f"Scenario files are .toml or .json, not {path!r}")
+
+
+def hunting_strategy(model: str, scenario: dict):
+    """
+    The HuntingParameters of a scenario table, see the module docstring.
+    """
+
+    module = get_model(model)
+    culling = scenario.get("culling")
+    strategy = scenario.get("strategy")
+
+    if model == "main":
+        if strategy is not None or not isinstance(culling, dict):
+            raise ValueError(
+                f"Scenario {scenario['name']!r} needs a culling table of "
+                "HuntingParameters arguments"
+            )
+        return module.HuntingParameters(**culling)
+
+    if (culling is None) == (strategy is None):
+        raise ValueError(
+            f"Scenario {scenario['name']!r} needs either culling or strategy"
+        )
+    if strategy is not None:
+        from src.blackmount import create_hunting_strategy
+
+        return create_hunting_strategy(**strategy)
+    if culling == "real":
+        from src.blackmount import REAL_CULLING_DATA
+
+        culling = REAL_CULLING_DATA
+    elif not isinstance(culling, dict):
+        raise ValueError(f"Unknown culling for scenario {scenario['name']!r}")
+
+    # TOML and JSON keys are strings
+    return module.HuntingParameters(
+        culling_data={int(year): counts for year, counts in culling.items()}
+    )
+
+
+def load_scenarios(config: dict, model: str) -> list:
+    """
+    The Scenario of every scenarios table of a scenario file.
+    """
+
+    unknown = set(config) - set(CONFIG_KEYS) - {"scenarios"}
+    if unknown:
+        raise ValueError(f"Unknown scenario file keys: {sorted(unknown)}")
+    if not config.get("scenarios"):
+        raise ValueError("The scenario file has no scenarios")
+
+    module = get_model(model)
+    scenarios = []
+    for scenario in config["scenarios"]:
+        unknown = set(scenario) - set(SCENARIO_KEYS)
+        if "name" not in scenario or unknown:
+            raise ValueError(
+                f"Scenarios need a name and only take {', '.join(SCENARIO_KEYS)}"
+            )
+        scenarios.append(
+            Scenario(
+                scenario["name"],
+                module.ModelParameters(
+                    **{**config.get("parameters", {}), **scenario.get("parameters", {})}
+                ),
+                hunting_strategy(model, scenario),
+                labels=scenario.get("labels"),
+                **scenario.get("options", {}),
+            )
+        )
+
+    names = [scenario.name for scenario in scenarios]
+    if len(set(names)) < len(names):
+        raise ValueError("Scenario names must be unique")
+    return scenarios
+
+
+def parser(model="main_v2") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run the scenarios of a TOML or JSON file and save the results."
+    )
+    parser.add_argument("config", help="scenario file, .toml or .json")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="ResultStore directory, or a .csv file",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="worker processes, every core by default",
+    )
+    parser.add_argument("--samples", type=int, help="overrides the file's samples")
+    parser.add_argument("--seed", type=int, help="overrides the file's seed")
+    parser.set_defaults(model=model)
+    return parser
+
+
+def main(argv=None, model="main_v2") -> int:
+    """
+    Runs the command line, model being the default of scenario files that do
+    not name one.
+    """
+
+    arguments = parser(model).parse_args(argv)
+    try:
+        config = load_config(arguments.config)
+        model = config.get("model", arguments.model)
+        scenarios = load_scenarios(config, model)
+    except (OSError, ValueError, TypeError) as error:
+        print(f"{arguments.config}: {error}", file=sys.stderr)
+        return 2
+
+    samples = arguments.samples or config.get("samples", 100)
+    seed = arguments.seed if arguments.seed is not None else config.get("seed")
+    workers = arguments.workers or config.get("workers")
+    options = config.get("options", {})
+
+    if arguments.output.endswith(".csv"):
+        results = runSweep(scenarios, samples, seed, workers, model=model, **options)
+        results.to_csv(arguments.output, index=False)
+    else:
+        runSweep(
+            scenarios,
+            samples,
+            seed,
+            workers,
+            model=model,
+            store=arguments.output,
+            **options,
+        )
+
+    print(
+        f"{len(scenarios)} scenarios x {samples} samples written to "
+        f"{arguments.output}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Cohort-count version of the main_v2 population.
+
+The model never uses individual identity, so the population is stored as a
+count table indexed by ``[sex, age]`` and advanced with binomial draws for
+births, offspring sex (p_o,m) and deaths. The cost of a year depends on the
+number of age classes rather than on the number of deer, which makes herds of
+hundreds of thousands of animals cheap to simulate.
+
+The functions mirror the names and signatures of ``src.main_v2`` so the module
+can be passed to ``runSimulation(..., engine="cohort")`` as a drop-in engine.
+All of them accept count tables with extra leading axes, ``(..., 2, ages)``,
+which share one block order.
+"""
+
+import numpy as np
+
+from src.main_v2 import (
+    AGE_CLASSES,
+    HuntingParameters,
+    ModelParameters,
+    result_columns,
+)
+from src.metrics import CALF_MAX_AGE, FEMALE, MALE
+from src.profiling import NO_PROFILE
+from src.results import ResultBuffer
+
+AGES = np.arange(AGE_CLASSES)
+
+
+class CohortPopulation:
+    def __init__(self, counts: np.ndarray, order: np.ndarray):
+        self.counts = counts  # [..., sex, age]
+        # Position of each (sex, age) block in the list model, see hunting
+        self.order = order  # [sex, age]
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+
+def make_rng(seed=None) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def grow(population: CohortPopulation):
+    counts = np.zeros_like(population.counts)
+    counts[..., 1:] = population.counts[..., :-1]
+    counts[..., -1] += population.counts[..., -1]
+
+    order = population.order.copy()
+    order[:, 1:] = population.order[:, :-1]
+
+    return CohortPopulation(counts, order)
+
+
+def reproduce(
+    population: CohortPopulation, params: ModelParameters, rng: np.random.Generator
+):
+    counts = population.counts
+    hasMale = counts[..., MALE, 1:].sum(axis=-1) > 0
+
+    fertility = params.vitalRates.fertility_table(AGE_CLASSES)
+    births = rng.binomial(counts[..., FEMALE, :], fertility)
+    births = births.sum(axis=-1) * hasMale
+    males = rng.binomial(births, params.probMale)
+
+    counts = counts.copy()
+    counts[..., MALE, 0] += males
+    counts[..., FEMALE, 0] += births - males
+
+    # Newborns are appended to the end of the list
+    order = population.order.copy()
+    order[:, 0] = order.max() + 1
+
+    return CohortPopulation(counts, order)
+
+
+def naturalDeath(
+    population: CohortPopulation, params: ModelParameters, rng: np.random.Generator
+):
+    inow = population.counts.sum(axis=(-2, -1))  # Current population size
+    imax = params.maximumIndividuals  # Maximum carrying capacity
+
+    # Carrying capacity adjustment (Algorithm 3), once per year rather than per deer
+    adjustment = (params.maxCapacityImpact / 2) * (
+        1 + np.tanh(params.capacityCurveSlope * (inow - imax))
+    )
+    mortality = params.vitalRates.mortality_table(AGE_CLASSES)
+    adjusted_mortality = mortality + np.expand_dims(adjustment, (-2, -1))
+
+    counts = rng.binomial(population.counts, np.clip(1 - adjusted_mortality, 0, 1))
+
+    return CohortPopulation(counts, population.order)
+
+
+def cull_in_order(counts: np.ndarray, cull) -> np.ndarray:
+    """
+    Number removed from each class when cull animals are taken from the classes
+    in order along the last axis, never taking more than a class holds.
+    """
+
+    taken_before = np.cumsum(counts, axis=-1) - counts
+    return np.clip(np.expand_dims(cull, -1) - taken_before, 0, counts)
+
+
+def cull_group(counts: np.ndarray, order: np.ndarray, cull, huntingLimit: int):
+    """
+    Number removed from each class of a group when the first cull animals of the
+    group are taken in list order, only if the group is larger than the limit.
+    """
+
+    ranked = np.argsort(order, kind="stable")
+    cull = np.where(counts.sum(axis=-1) > huntingLimit, cull, 0)
+
+    removed = np.empty_like(counts)
+    removed[..., ranked] = cull_in_order(counts[..., ranked], cull)
+    return removed
+
+
+def hunting(
+    population: CohortPopulation,
+    year: int,
+    huntingStrategy: HuntingParameters,
+    params: ModelParameters,
+    rng: np.random.Generator,
+):
+    """
+    The list model always culls from the front of each group and rebuilds the
+    population as calves + hinds + stags, with newborns appended at the end.
+    Every (sex, age) class therefore stays one contiguous block of the list, so
+    tracking the block order is enough to cull exactly the classes the list
+    model would. Calves of both sexes share a block, so the sex of culled calves
+    is drawn hypergeometrically.
+    """
+
+    # Retrieve cull data for the current year
+    year_cull = huntingStrategy.culling_data.get(
+        year, {"calves": 0, "hinds": 0, "stags": 0}
+    )
+
+    counts = population.counts.copy()
+    order = population.order
+    calves = counts[..., : CALF_MAX_AGE + 1]
+    adults = counts[..., CALF_MAX_AGE + 1 :]
+
+    # Cull calves
+    calves_culled = cull_group(
+        calves.sum(axis=-2),
+        order[FEMALE, : CALF_MAX_AGE + 1],
+        year_cull["calves"],
+        params.huntingLimit,
+    )
+    males_culled = rng.hypergeometric(
+        calves[..., MALE, :], calves[..., FEMALE, :], calves_culled
+    )
+    calves[..., MALE, :] -= males_culled
+    calves[..., FEMALE, :] -= calves_culled - males_culled
+
+    # Cull hinds and stags
+    for sex, key in ((FEMALE, "hinds"), (MALE, "stags")):
+        adults[..., sex, :] -= cull_group(
+            adults[..., sex, :],
+            order[sex, CALF_MAX_AGE + 1 :],
+            year_cull[key],
+            params.huntingLimit,
+        )
+
+    # Rebuild population as calves + hinds + stags
+    group = np.full(order.shape, 2)
+    group[FEMALE] = 1
+    group[:, : CALF_MAX_AGE + 1] = 0
+    _, order = np.unique(group * (order.max() + 1) + order, return_inverse=True)
+
+    return CohortPopulation(counts, order.reshape(group.shape))
+
+
+def generateInitialPopulation(
+    total_stags=1800,
+    total_hinds=3700,
+    total_calves=3700,
+):
+    """
+    Same age and sex counts, and block order, as
+    main_v2.generateInitialPopulation.
+    """
+
+    counts = np.zeros((2, AGE_CLASSES), dtype=np.int64)
+    counts[MALE, 3:16] = total_stags // 13
+    counts[FEMALE, 3:16] = total_hinds // 13
+    counts[:, : CALF_MAX_AGE + 1] = total_calves // 6
+
+    # Stags, then hinds, then calves with both sexes alternating in each age
+    order = np.zeros((2, AGE_CLASSES), dtype=np.int64)
+    order[MALE, 3:] = AGES[3:]
+    order[FEMALE, 3:] = AGE_CLASSES + AGES[3:]
+    order[:, : CALF_MAX_AGE + 1] = 2 * AGE_CLASSES + AGES[: CALF_MAX_AGE + 1]
+
+    return CohortPopulation(counts, order)
+
+
+def count_population(population: CohortPopulation):
+    counts = population.counts
+
+    num_calves = counts[..., : CALF_MAX_AGE + 1].sum(axis=(-2, -1))
+    num_stags = counts[..., MALE, CALF_MAX_AGE + 1 :].sum(axis=-1)
+    num_hinds = counts[..., FEMALE, CALF_MAX_AGE + 1 :].sum(axis=-1)
+
+    return num_calves, num_stags, num_hinds
+
+
+def copy_population(population: CohortPopulation) -> CohortPopulation:
+    return CohortPopulation(population.counts.copy(), population.order.copy())
+
+
+def sex_age_counts(population: CohortPopulation) -> np.ndarray:
+    return population.counts
+
+
+def summarise_population(population: CohortPopulation, age_format: str = "list"):
+    num_calves, num_stags, num_hinds = count_population(population)
+    per_age = population.counts.sum(axis=0)
+    num_individuals = int(per_age.sum())
+    if age_format == "counts":
+        age_distribution = per_age
+    else:
+        age_distribution = np.repeat(AGES, per_age).tolist()
+    average_age = (
+        float((AGES * per_age).sum() / num_individuals) if num_individuals else 0
+    )
+
+    return (
+        num_individuals,
+        int(num_stags),
+        int(num_hinds),
+        int(num_calves),
+        age_distribution,
+        average_age,
+    )
+
+
+def batch(population: CohortPopulation, samples: int) -> CohortPopulation:
+    """
+    Stacks samples copies of a population along a new leading axis.
+    """
+
+    counts = np.repeat(population.counts[np.newaxis], samples, axis=0)
+    return CohortPopulation(counts, population.order.copy())
+
+
+def percentage_died(before: np.ndarray, after: np.ndarray) -> np.ndarray:
+    died = np.zeros(before.shape)
+    np.divide(before - after, before, out=died, where=before > 0)
+    return died * 100
+
+
+def summarise_batch(population: CohortPopulation, age_format: str = "list"):
+    """
+    summarise_population for every sample of a batch, as one value per sample.
+    """
+
+    num_calves, num_stags, num_hinds = count_population(population)
+    per_age = population.counts.sum(axis=-2)
+    num_individuals = per_age.sum(axis=-1)
+    if age_format == "counts":
+        age_distribution = per_age
+    else:
+        age_distribution = [np.repeat(AGES, row).tolist() for row in per_age]
+    average_age = np.zeros(num_individuals.shape)
+    np.divide(
+        per_age @ AGES, num_individuals, out=average_age, where=num_individuals > 0
+    )
+
+    return (
+        num_individuals,
+        num_stags,
+        num_hinds,
+        num_calves,
+        age_distribution,
+        average_age,
+    )
+
+
+def runBatchedSimulation(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    age_format="list",
+    first_iteration=0,
+    seed=None,
+    profile=NO_PROFILE,
+) -> ResultBuffer:
+    """
+    Runs every sample in lock-step as one (samples, sex, age) count table, so the
+    per-step overhead is paid once per year rather than once per sample-year.
+    Returns the same columns as main_v2.runSample, with samples numbered from
+    first_iteration.
+    """
+
+    parameters.vitalRates.check_age_classes(AGE_CLASSES, "the cohort engine")
+    rng = make_rng(seed)
+    with profile.phase("generateInitialPopulation"):
+        population = batch(
+            generateInitialPopulation(initial_stags, initial_hinds, initial_calves),
+            samples,
+        )
+    years = np.arange(start_year, end_year + 1)
+
+    yearly_data = []
+    for year in range(start_year, end_year + 1):
+        with profile.phase("grow"):
+            population = grow(population)
+        with profile.phase("reproduce"):
+            population = reproduce(population, parameters, rng)
+        for i, size in enumerate(population.counts.sum(axis=(-2, -1))):
+            profile.record_population(first_iteration + i, year, size)
+
+        with profile.phase("count_population"):
+            before = count_population(population)
+        with profile.phase("naturalDeath"):
+            population = naturalDeath(population, parameters, rng)
+        with profile.phase("count_population"):
+            after = count_population(population)
+
+        with profile.phase("hunting"):
+            population = hunting(population, year, huntingStrategy, parameters, rng)
+
+        with profile.phase("summarise_population"):
+            (
+                num_individuals,
+                num_stags,
+                num_hinds,
+                num_calves,
+                age_distribution,
+                average_age,
+            ) = summarise_batch(population, age_format)
+
+        yearly_data.append(
+            {
+                "num_individuals": num_individuals,
+                "num_stags": num_stags,
+                "num_hinds": num_hinds,
+                "num_calves": num_calves,
+                "age_distribution": age_distribution,
+                "calves_died_percentage": percentage_died(before[0], after[0]),
+                "stags_died_percentage": percentage_died(before[1], after[1]),
+                "hinds_died_percentage": percentage_died(before[2], after[2]),
+                "avg_age": average_age,
+            }
+        )
+
+    # Write the rows sample by sample, as the non-batched runSimulation does
+    with profile.phase("results"):
+        if age_format == "counts":
+            age_distribution = np.stack(
+                [data["age_distribution"] for data in yearly_data], axis=1
+            ).reshape(samples * len(years), AGE_CLASSES)
+        else:
+            age_distribution = [
+                data["age_distribution"][i]
+                for i in range(samples)
+                for data in yearly_data
+            ]
+
+        results = ResultBuffer(result_columns(age_format), samples * len(years))
+        results.extend(
+            samples * len(years),
+            iteration=np.repeat(first_iteration + np.arange(samples), len(years)),
+            year=np.tile(years, samples),
+            age_distribution=age_distribution,
+            **{
+                name: np.stack(
+                    [data[name] for data in yearly_data], axis=-1
+                ).ravel()
+                for name in yearly_data[0]
+                if name != "age_distribution"
+            },
+        )
+
+    return results
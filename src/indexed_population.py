@@ -0,0 +1,362 @@
+"""
+Indexed version of the main_v2 individual population.
+
+The population is still a list of Deer objects, but kept as a sequence of
+runs: consecutive deer of the same age, with a count of the females in each
+run. Concatenating the runs gives exactly the list ``src.main_v2`` would hold,
+so every step draws the same random numbers in the same order and a seeded run
+reproduces the individual engine.
+
+The runs follow from how the list model orders deer. hunting rebuilds the list
+as calves + hinds + stags, reproduce appends the newborns as one run at the
+end, and naturalDeath only removes deer. So deer of one age stay together,
+with hinds and stags of an age in separate runs once they are adults. Counting
+the population and choosing the deer to cull then take time proportional to
+the number of runs (about twice the number of age classes) instead of scanning
+every deer. Only the steps drawing a random number per deer (reproduce and
+naturalDeath) still visit them all.
+
+The functions mirror the names and signatures of ``src.main_v2`` so the module
+can be passed to ``runSimulation(..., engine="indexed")`` as a drop-in engine.
+"""
+
+import random
+
+import numpy as np
+
+from src.main_v2 import (
+    AGE_CLASSES,
+    Deer,
+    HuntingParameters,
+    ModelParameters,
+    adjustMortalityRate,
+    make_rng,
+)
+from src.metrics import CALF_MAX_AGE, FEMALE, MALE
+
+
+class AgeRun:
+    __slots__ = ("age", "deer", "females")
+
+    def __init__(self, age: int, deer: list, females: int = None):
+        self.age = age  # i_a of every deer in the run
+        self.deer = deer  # In list order
+        self.females = (
+            sum(1 for individual in deer if individual.isFemale)
+            if females is None
+            else females
+        )
+
+    @property
+    def males(self) -> int:
+        return len(self.deer) - self.females
+
+    def count(self, onlyMale=False, onlyFemale=False) -> int:
+        if onlyMale and onlyFemale:
+            return 0
+        if onlyMale:
+            return self.males
+        if onlyFemale:
+            return self.females
+        return len(self.deer)
+
+    def cull(self, number: int):
+        """
+        Removes the first number deer of the run.
+        """
+
+        culled = self.deer[:number]
+        self.females -= sum(1 for individual in culled if individual.isFemale)
+        del self.deer[:number]
+
+    def split(self) -> tuple:
+        """
+        The females and the males of the run as two runs, each in list order.
+        """
+
+        females = [individual for individual in self.deer if individual.isFemale]
+        males = [individual for individual in self.deer if not individual.isFemale]
+        return AgeRun(self.age, females, len(females)), AgeRun(self.age, males, 0)
+
+
+class IndexedPopulation:
+    def __init__(self, runs: list):
+        self.runs = runs  # AgeRun list, in list order
+
+    def __len__(self):
+        return sum(len(run.deer) for run in self.runs)
+
+    def __iter__(self):
+        for run in self.runs:
+            yield from run.deer
+
+    def _selected(self, age=None, min_age=None, max_age=None):
+        for run in self.runs:
+            if age is not None and run.age != age:
+                continue
+            if min_age is not None and run.age < min_age:
+                continue
+            if max_age is not None and run.age > max_age:
+                continue
+            yield run
+
+    def count(
+        self,
+        age: int = None,
+        min_age: int = None,
+        max_age: int = None,
+        onlyMale: bool = False,
+        onlyFemale: bool = False,
+    ) -> int:
+        """
+        len(get_group(...)) without building the group.
+        """
+
+        return sum(
+            run.count(onlyMale, onlyFemale)
+            for run in self._selected(age, min_age, max_age)
+        )
+
+    def age_counts(self) -> dict:
+        counts = {}
+        for run in self.runs:
+            counts[run.age] = counts.get(run.age, 0) + len(run.deer)
+        return counts
+
+
+def grow(population: IndexedPopulation):
+    for run in population.runs:
+        run.age += 1
+        for deer in run.deer:
+            deer.age += 1
+
+    return population
+
+
+def reproduce(population: IndexedPopulation, params: ModelParameters, rng=random):
+    hasMale = any(run.males > 0 and run.age >= 1 for run in population.runs)
+
+    if not hasMale:
+        return population
+
+    fertility = params.vitalRates.fertility_table().tolist()
+    last = len(fertility) - 1
+
+    newDeer = []
+    females = 0
+    for run in population.runs:
+        probReproduce = fertility[min(run.age, last)]
+        if probReproduce <= 0 or run.females == 0:
+            continue
+
+        for deer in run.deer:
+            if deer.isFemale and rng.random() < probReproduce:
+                male = False
+                if rng.random() < params.probMale:
+                    male = True
+                newDeer.append(Deer(0, not male, male))
+                females += not male
+
+    if newDeer:
+        # Newborns are appended to the end of the list
+        population.runs.append(AgeRun(0, newDeer, females))
+
+    return population
+
+
+def naturalDeath(population: IndexedPopulation, params: ModelParameters, rng=random):
+    inow = len(population)  # Current population size
+    imax = params.maximumIndividuals  # Maximum carrying capacity
+
+    mortality = params.vitalRates.mortality_table().tolist()
+    last = len(mortality) - 1
+
+    # The carrying capacity adjustment (Algorithm 3) is the same for every deer
+    adjustment = adjustMortalityRate(
+        0.0,
+        params.maxCapacityImpact,
+        params.capacityCurveSlope,
+        inow,
+        imax,
+    )
+
+    runs = []
+    for run in population.runs:
+        adjusted_mortality = mortality[min(run.age, last)] + adjustment
+        survivors = [deer for deer in run.deer if rng.random() >= adjusted_mortality]
+        if survivors:
+            runs.append(AgeRun(run.age, survivors))
+
+    return IndexedPopulation(runs)
+
+
+def get_group(
+    population: IndexedPopulation,
+    age: int = None,
+    min_age: int = None,
+    max_age: int = None,
+    onlyMale: bool = False,
+    onlyFemale: bool = False,
+) -> list:
+    """
+    The deer main_v2.get_group returns, in the same order.
+    """
+
+    group = []
+    for run in population._selected(age, min_age, max_age):
+        if onlyMale and onlyFemale:
+            continue
+        if onlyFemale and run.males:
+            group.extend(deer for deer in run.deer if deer.isFemale)
+        elif onlyMale and run.females:
+            group.extend(deer for deer in run.deer if deer.isMale)
+        elif run.count(onlyMale, onlyFemale):
+            group.extend(run.deer)
+
+    return group
+
+
+def cull_runs(runs: list, cull: int, huntingLimit: int):
+    """
+    Removes the first cull deer of a group held as runs, as main_v2.hunting
+    does, if the group has more than huntingLimit deer.
+    """
+
+    if sum(len(run.deer) for run in runs) <= huntingLimit:
+        return
+
+    for run in runs:
+        if cull <= 0:
+            break
+        number = min(cull, len(run.deer))
+        run.cull(number)
+        cull -= number
+
+
+def hunting(
+    population: IndexedPopulation,
+    year: int,
+    huntingStrategy: HuntingParameters,
+    params: ModelParameters,
+    rng=random,  # Unused: list order decides which deer are culled
+):
+    # Retrieve cull data for the current year
+    year_cull = huntingStrategy.culling_data.get(
+        year, {"calves": 0, "hinds": 0, "stags": 0}
+    )
+
+    calves, hinds, stags = [], [], []
+    for run in population.runs:
+        if run.age <= CALF_MAX_AGE:
+            calves.append(run)
+        elif run.males == 0:
+            hinds.append(run)
+        elif run.females == 0:
+            stags.append(run)
+        else:
+            # Calves that have just become adults
+            females, males = run.split()
+            hinds.append(females)
+            stags.append(males)
+
+    cull_runs(calves, year_cull["calves"], params.huntingLimit)
+    cull_runs(hinds, year_cull["hinds"], params.huntingLimit)
+    cull_runs(stags, year_cull["stags"], params.huntingLimit)
+
+    # Rebuild population with remaining deer
+    return IndexedPopulation([run for run in calves + hinds + stags if run.deer])
+
+
+def generateInitialPopulation(
+    total_stags=1800,
+    total_hinds=3700,
+    total_calves=3700,
+) -> IndexedPopulation:
+    """
+    The population of main_v2.generateInitialPopulation, in the same order.
+    """
+
+    runs = [
+        AgeRun(age, [Deer(age, False, True) for _ in range(total_stags // 13)], 0)
+        for age in range(3, 16)
+    ]
+    runs += [
+        AgeRun(
+            age,
+            [Deer(age, True, False) for _ in range(total_hinds // 13)],
+            total_hinds // 13,
+        )
+        for age in range(3, 16)
+    ]
+    for age in range(3):
+        calves = []
+        for _ in range(total_calves // 6):
+            calves.append(Deer(age, True, False))  # Female calves
+            calves.append(Deer(age, False, True))  # Male calves
+        runs.append(AgeRun(age, calves, total_calves // 6))
+
+    return IndexedPopulation([run for run in runs if run.deer])
+
+
+def count_population(population: IndexedPopulation):
+    num_calves = population.count(max_age=CALF_MAX_AGE)
+    num_stags = population.count(min_age=CALF_MAX_AGE + 1, onlyMale=True)
+    num_hinds = population.count(min_age=CALF_MAX_AGE + 1, onlyFemale=True)
+
+    return num_calves, num_stags, num_hinds
+
+
+def copy_population(population: IndexedPopulation) -> IndexedPopulation:
+    return IndexedPopulation(
+        [
+            AgeRun(
+                run.age,
+                [Deer(deer.age, deer.isFemale, deer.isMale) for deer in run.deer],
+                run.females,
+            )
+            for run in population.runs
+        ]
+    )
+
+
+def sex_age_counts(population: IndexedPopulation) -> np.ndarray:
+    """
+    Number of deer of each [sex, age], the last age class absorbing, from the
+    run counts.
+    """
+
+    counts = np.zeros((2, AGE_CLASSES), dtype=np.int64)
+    for run in population.runs:
+        age = min(run.age, AGE_CLASSES - 1)
+        counts[FEMALE, age] += run.females
+        counts[MALE, age] += run.males
+
+    return counts
+
+
+def summarise_population(population: IndexedPopulation, age_format: str = "list"):
+    num_calves, num_stags, num_hinds = count_population(population)
+    num_individuals = num_calves + num_stags + num_hinds
+
+    average_age = (
+        sum(age * count for age, count in population.age_counts().items())
+        / num_individuals
+        if num_individuals
+        else 0  # TODO this includes 40% being age 0 calves
+    )
+
+    if age_format == "counts":
+        age_distribution = [0] * AGE_CLASSES
+        for age, count in population.age_counts().items():
+            age_distribution[min(age, AGE_CLASSES - 1)] += count
+    else:
+        age_distribution = [run.age for run in population.runs for _ in run.deer]
+
+    return (
+        num_individuals,
+        num_stags,
+        num_hinds,
+        num_calves,
+        age_distribution,
+        average_age,
+    )
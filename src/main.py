@@ -1,8 +1,23 @@
 import random
-from math import exp, tanh
+import sys
+from functools import lru_cache
+from math import tanh
 from typing import List
 
-import pandas as pd
+import numpy as np
+
+from src.parallel import (
+    imap_jobs,
+    python_seed,
+    resolve_workers,
+    run_jobs,
+    sample_seeds,
+)
+from src.profiling import NO_PROFILE, Profiler
+from src.results import ResultBuffer, age_count_spec
+from src.store import ResultStore
+from src.summary import summarised
+from src.vital_rates import FertilityBand, MortalityBand, VitalRates
 
 
 class Deer:
@@ -17,6 +32,29 @@ class Deer:
         self.isMale = isMale  # i_m
 
 
+# Age-based mortality (p_{i,d}) by age (i_a)
+MORTALITY_SCHEDULE = [
+    MortalityBand(0, 0, rate=0.15),
+    # 0.03 + (0.05 / 14) * (age - 1)
+    MortalityBand(1, 15, rate=0.03, slope=0.05 / 14, origin=1),
+    # 0.08 * exp(2.47 * (age - 16))
+    MortalityBand(16, rate=0.08, growth=2.47, origin=16),
+]
+
+
+@lru_cache(maxsize=128)  # Every ModelParameters builds its rates on access
+def defaultVitalRates(
+    probYoungReproduce: float = 0.3, probMatureReproduce: float = 0.9
+) -> VitalRates:
+    return VitalRates(
+        MORTALITY_SCHEDULE,
+        [
+            FertilityBand(1, 1, probYoungReproduce),
+            FertilityBand(2, 11, probMatureReproduce),
+        ],
+    )
+
+
 class ModelParameters:
     def __init__(
         self,
@@ -25,7 +63,14 @@ class ModelParameters:
         huntingLimit: int,
         initialIndividuals: int,
         maximumIndividuals: int,
+        vitalRates: VitalRates = None,
     ):
+        """
+        vitalRates: mortality and fertility schedules, by default those of the
+            paper (Reproduction function, page 18) with probYoungReproduce and
+            probMatureReproduce. Those are None with custom schedules.
+        """
+
         self.maxCapacityImpact = maxCapacityImpact  # c
         self.capacityCurveSlope = capacityCurveSlope  # a
         self.huntingLimit = huntingLimit  # l
@@ -34,8 +79,24 @@ class ModelParameters:
 
         self.probMale = 0.52  # p_o,m
         self.probFemale = 0.48  # p_o,f
-        self.probYoungReproduce = 0.3  # Reproduction function, page 18
-        self.probMatureReproduce = 0.9  # Reproduction function, page 18
+        self.probYoungReproduce = None
+        self.probMatureReproduce = None
+        if vitalRates is None:
+            self.probYoungReproduce = 0.3  # Reproduction function, page 18
+            self.probMatureReproduce = 0.9  # Reproduction function, page 18
+        self.customVitalRates = vitalRates
+
+    @property
+    def vitalRates(self) -> VitalRates:
+        # Built from the probabilities on access, so that changing them after
+        # construction still changes the fertility
+        if self.customVitalRates is not None:
+            return self.customVitalRates
+        return defaultVitalRates(self.probYoungReproduce, self.probMatureReproduce)
+
+    @vitalRates.setter
+    def vitalRates(self, vitalRates: VitalRates):
+        self.customVitalRates = vitalRates
 
 
 class HuntingParameters:
@@ -55,6 +116,20 @@ class HuntingParameters:
         self.matureStags = matureStags  # h_s
 
 
+def make_rng(seed=None):
+    """
+    seed: None to use the global random module itself, otherwise an int or
+        SeedSequence. runSimulation always passes a SeedSequence, see
+        parallel.sample_seeds.
+    """
+
+    if seed is None:
+        return random
+    if not isinstance(seed, int):
+        seed = python_seed(seed)
+    return random.Random(seed)
+
+
 def grow(population: List[Deer]):
     for deer in population:
         deer.age += 1
@@ -62,7 +137,7 @@ def grow(population: List[Deer]):
     return population
 
 
-def reproduce(population: List[Deer], params: ModelParameters):
+def reproduce(population: List[Deer], params: ModelParameters, rng=random):
     newDeer = []
 
     hasMale = any([deer.isMale and deer.age >= 1 for deer in population])
@@ -70,37 +145,36 @@ def reproduce(population: List[Deer], params: ModelParameters):
     if not hasMale:
         return population
 
+    fertility = params.vitalRates.fertility_table().tolist()
+    last = len(fertility) - 1
+
     for deer in population:
         if not deer.isFemale:
             continue
 
-        if deer.age == 1:
-            if random.random() < params.probYoungReproduce:
-                male = False
-                if random.random() < params.probMale:
-                    male = True
-                newDeer.append(Deer(0, not male, male))
-
-        elif 1 < deer.age < 12:
-            if random.random() < params.probMatureReproduce:
-                male = False
-                if random.random() < params.probMale:
-                    male = True
-                newDeer.append(Deer(0, not male, male))
+        probReproduce = fertility[min(deer.age, last)]
+        if probReproduce > 0 and rng.random() < probReproduce:
+            male = False
+            if rng.random() < params.probMale:
+                male = True
+            newDeer.append(Deer(0, not male, male))
 
     return population + newDeer
 
 
 def calculateAgeBasedMortality(age: int) -> float:
+    """
+    Mortality rate (p_{i,d}) of the default schedule at age (i_a). The model
+    steps use the tables of ModelParameters.vitalRates instead.
+    """
+
+    return DEFAULT_VITAL_RATES.mortality_rate(age)
 
-    # Calculates the mortality rate (p_{i,d}) based on age (i_a) using the provided formula.
 
-    if age == 0:
-        return 0.15
-    elif 0 < age < 16:
-        return 0.03 + (0.05 / 14) * (age - 1)
-    else:  # age >= 16
-        return 0.08 * exp(2.47 * (age - 16))
+DEFAULT_VITAL_RATES = defaultVitalRates()
+
+# The count format holds this many ages, the last one absorbing
+AGE_CLASSES = DEFAULT_VITAL_RATES.age_classes
 
 
 def get_group(population, age=None, min_age=None, onlyMale=False, onlyFemale=False):
@@ -168,26 +242,28 @@ def adjustMortalityRate(
     return base_mortality + adjustment
 
 
-def naturalDeath(population: List[Deer], params: ModelParameters):
+def naturalDeath(population: List[Deer], params: ModelParameters, rng=random):
     survivors = []
     inow = len(population)  # Current population size
     imax = params.maximumIndividuals  # Maximum carrying capacity
 
-    for deer in population:
-        # Step 1: Calculate the age-based mortality rate using the provided formula
-        base_mortality = calculateAgeBasedMortality(deer.age)
-
-        # Step 2: Adjust mortality rate based on carrying capacity (Algorithm 3)
-        adjusted_mortality = adjustMortalityRate(
-            base_mortality,
-            params.maxCapacityImpact,
-            params.capacityCurveSlope,
-            inow,
-            imax,
-        )
+    # Step 1: Age-based mortality rates (p_{i,d}) from the vital rate table
+    mortality = params.vitalRates.mortality_table().tolist()
+    last = len(mortality) - 1
+
+    # Step 2: The carrying capacity adjustment (Algorithm 3) is the same for
+    # every deer
+    adjustment = adjustMortalityRate(
+        0.0,
+        params.maxCapacityImpact,
+        params.capacityCurveSlope,
+        inow,
+        imax,
+    )
 
+    for deer in population:
         # Step 3: Determine if the deer survives based on adjusted mortality rate
-        if random.random() >= adjusted_mortality:
+        if rng.random() >= mortality[min(deer.age, last)] + adjustment:
             survivors.append(
                 deer
             )  # Deer survives if random number >= adjusted mortality
@@ -227,52 +303,322 @@ def generateInitialPopulation():
     return population
 
 
-def runSimulation(
+RESULT_COLUMNS = {
+    "iteration": np.int64,
+    "year": np.int64,
+    "num_individuals": np.int64,
+    "num_stags": np.int64,
+    "num_hinds": np.int64,
+    "age_distribution": object,
+}
+
+
+def result_columns(age_format: str = "list") -> dict:
+    """
+    RESULT_COLUMNS with ages stored as age_distribution lists ("list") or as
+    fixed-width age_0 ... age_N count columns ("counts").
+    """
+
+    if age_format == "list":
+        return RESULT_COLUMNS
+    if age_format == "counts":
+        return {
+            name: age_count_spec(AGE_CLASSES) if name == "age_distribution" else dtype
+            for name, dtype in RESULT_COLUMNS.items()
+        }
+
+    raise ValueError(f"Unknown age format: {age_format!r}")
+
+
+def iterateSample(
     parameters: ModelParameters,
     huntingStrategy: HuntingParameters,
-    samples=100,
+    iteration=0,
+    seed=None,
     years=101,
+    age_format="list",
+    include_population=False,
+    profile=NO_PROFILE,
 ):
+    """
+    Yields the runSimulation row of one sample as each year is simulated, with
+    the population itself under "population" if include_population is set.
+    Stop iterating to stop the sample.
 
-    population_df = pd.DataFrame(
-        columns=[
-            "iteration",
-            "year",
-            "num_individuals",
-            "num_stags",
-            "num_hinds",
-            "age_distribution",
-        ]
-    )
+    profile: a src.profiling.Profile timing each phase of the year
+    """
+
+    rng = make_rng(seed)
+    if age_format == "counts":
+        parameters.vitalRates.check_age_classes(AGE_CLASSES, 'age_format="counts"')
 
-    for i in range(samples):
+    with profile.phase("generateInitialPopulation"):
         population = generateInitialPopulation()
-        for t in range(years):
+    for t in range(years):
+        with profile.phase("grow"):
             population = grow(population)
-            population = reproduce(population, parameters)
-            population = naturalDeath(population, parameters)
+        with profile.phase("reproduce"):
+            population = reproduce(population, parameters, rng)
+        profile.record_population(iteration, t, len(population))
+        with profile.phase("naturalDeath"):
+            population = naturalDeath(population, parameters, rng)
+        with profile.phase("hunting"):
             population = hunting(population, parameters, huntingStrategy)
 
+        with profile.phase("summarise_population"):
             num_individuals = len(population)
             num_stags = sum(1 for individual in population if individual.isMale)
             num_hinds = sum(1 for individual in population if individual.isFemale)
-            age_distribution = [individual.age for individual in population]
-
-            year_data = pd.DataFrame(
-                {
-                    "iteration": [i],
-                    "year": [t],
-                    "num_individuals": [num_individuals],
-                    "num_stags": [num_stags],
-                    "num_hinds": [num_hinds],
-                    "age_distribution": [age_distribution],
-                }
-            )
+            if age_format == "counts":
+                age_distribution = [0] * AGE_CLASSES
+                for individual in population:
+                    age_distribution[min(individual.age, AGE_CLASSES - 1)] += 1
+            else:
+                age_distribution = [individual.age for individual in population]
+
+        row = {
+            "iteration": iteration,
+            "year": t,
+            "num_individuals": num_individuals,
+            "num_stags": num_stags,
+            "num_hinds": num_hinds,
+            "age_distribution": age_distribution,
+        }
+        if include_population:
+            row["population"] = population
+
+        yield row
+
+
+def runSample(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    iteration=0,
+    seed=None,
+    years=101,
+    age_format="list",
+    stop_sample=None,
+    profile=NO_PROFILE,
+) -> ResultBuffer:
+    """
+    Runs one sample of runSimulation with its own random stream, stopping after
+    the first year whose row satisfies stop_sample, if given.
+    """
+
+    results = ResultBuffer(result_columns(age_format), years)
+
+    for row in iterateSample(
+        parameters, huntingStrategy, iteration, seed, years, age_format, profile=profile
+    ):
+        with profile.phase("results"):
+            results.append(**row)
+        if stop_sample is not None and stop_sample(row):
+            break
+
+    return results
+
+
+def simulationJobs(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    samples=100,
+    years=101,
+    age_format="list",
+    seed=None,
+    first_sample=0,
+    stop_sample=None,
+    engine="individual",
+):
+    """
+    The job function and keyword arguments of every job runSimulation runs,
+    each job returning a ResultBuffer. Sample k always gets the same seed
+    stream for a given seed, whatever else is being run alongside it.
+    """
+
+    function = runSample
+    if engine == "jit":
+        from src.main_jit import runCompiledSample
+
+        function = runCompiledSample
+    elif engine != "individual":
+        raise ValueError(f"Unknown engine: {engine!r}")
+
+    jobs = [
+        {
+            "parameters": parameters,
+            "huntingStrategy": huntingStrategy,
+            "iteration": i,
+            "seed": sample_seed,
+            "years": years,
+            "age_format": age_format,
+            "stop_sample": stop_sample,
+        }
+        for i, sample_seed in enumerate(
+            sample_seeds(seed, samples, first_sample), start=first_sample
+        )
+    ]
+    return function, jobs
+
+
+def runSimulation(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    samples=100,
+    years=101,
+    age_format="list",
+    seed=None,
+    workers=1,
+    first_sample=0,
+    stop_sample=None,
+    store=None,
+    scenario="default",
+    chunk_samples=100,
+    profile=None,
+    engine="individual",
+    summary=None,
+):
+    """
+    age_format="counts" replaces the age_distribution lists with compact age_0
+    ... age_N count columns, see src.results for helpers reading either format.
+
+    seed makes the run reproducible: every sample gets its own stream derived
+    from it, so results do not depend on the number of workers the samples are
+    spread over (None uses every core). first_sample runs samples first_sample,
+    first_sample + 1, ... so more samples can be added to an earlier run with
+    the same seed.
+    Without a seed the streams derive from the global random module, so
+    random.seed(...) before the run makes it reproducible too.
+
+    stop_sample(row) ends a sample after the first year it returns True for,
+    e.g. src.stopping.Extinct(), see iterateSimulation to stop the whole run.
+
+    store (a ResultStore or its path) streams the results to disk under
+    scenario, chunk_samples samples per file, and returns the store instead of
+    a DataFrame.
+
+    summary (a src.summary.Summary) folds every sample into per-year
+    statistics as it finishes, in the worker that ran it, and returns the
+    Summary instead of a DataFrame: only O(years) memory, whatever samples.
+
+    profile=True times every phase of the run and returns (results, Profile),
+    see src.profiling. A function is called with the Profile of every sample
+    as it finishes instead, and a Profiler collects them.
+
+    engine="jit" runs each sample through the compiled year loop of
+    src.main_jit (Numba, if installed), with the same results columns.
+    """
+
+    profiler = Profiler.resolve(profile)
+    function, jobs = simulationJobs(
+        parameters,
+        huntingStrategy,
+        samples=samples,
+        years=years,
+        age_format=age_format,
+        seed=seed,
+        first_sample=first_sample,
+        stop_sample=stop_sample,
+        engine=engine,
+    )
+    if summary is not None:
+        if store is not None:
+            raise ValueError("store and summary cannot be used together")
+        function, jobs = summarised(function, jobs, summary)
+    function, jobs = profiler.wrap(function, jobs)
+
+    if summary is not None:
+        for job_summary in imap_jobs(function, jobs, workers):
+            with profiler.phase("summary"):
+                summary.merge(profiler.collect(job_summary))
+        return profiler.result(summary)
+
+    if store is not None:
+        store = ResultStore.open(store)
+        writer = store.writer(scenario, chunk_samples)
+        for job_results in imap_jobs(function, jobs, workers):
+            with profiler.phase("store"):
+                writer.add(profiler.collect(job_results))
+        with profiler.phase("store"):
+            writer.close()
+        return profiler.result(store)
+
+    results = ResultBuffer(result_columns(age_format), samples * years)
+    for job_results in run_jobs(function, jobs, workers):
+        with profiler.phase("results"):
+            results.extend_from(profiler.collect(job_results))
+
+    with profiler.phase("to_frame"):
+        frame = results.to_frame()
+    return profiler.result(frame)
+
+
+def iterateSimulation(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    samples=100,
+    years=101,
+    age_format="list",
+    seed=None,
+    workers=1,
+    first_sample=0,
+    stop_sample=None,
+    stop_run=None,
+    include_population=False,
+):
+    """
+    Yields the rows of runSimulation as they are produced instead of returning
+    them all at the end, sample by sample.
+
+    stop_sample(row) ends the current sample after that row, and stop_run(row)
+    ends the whole run after it. Breaking out of the loop also stops the run.
+    With one worker the rows are produced year by year and include_population
+    adds each year's population under "population". With more workers each
+    sample runs in the pool and its rows are yielded once it has finished.
+    """
+
+    seeds = sample_seeds(seed, samples, first_sample)
+    options = {
+        "parameters": parameters,
+        "huntingStrategy": huntingStrategy,
+        "years": years,
+        "age_format": age_format,
+    }
+
+    if resolve_workers(workers) == 1:
+        for i, sample_seed in enumerate(seeds, start=first_sample):
+            for row in iterateSample(
+                **options,
+                iteration=i,
+                seed=sample_seed,
+                include_population=include_population,
+            ):
+                yield row
+                if stop_run is not None and stop_run(row):
+                    return
+                if stop_sample is not None and stop_sample(row):
+                    break
+        return
+
+    jobs = [
+        {**options, "iteration": i, "seed": sample_seed, "stop_sample": stop_sample}
+        for i, sample_seed in enumerate(seeds, start=first_sample)
+    ]
+    for sample_results in imap_jobs(runSample, jobs, workers):
+        for row in sample_results.rows():
+            yield row
+            if stop_run is not None and stop_run(row):
+                return
+
+
+def main(argv=None):
+    """
+    Batch runs of scenario files from the command line, see src.cli.
+    """
 
-            population_df = pd.concat([population_df, year_data], ignore_index=True)
+    from src.cli import main as run_cli
 
-    return population_df
+    return run_cli(argv, model="main")
 
 
-def main():
-    pass
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Compiled year loop for the paper model of ``src.main``.
+
+``runSimulation(..., engine="jit")`` runs every sample through _simulate, one
+function holding the whole year loop (grow, reproduce, naturalDeath, hunting)
+over two arrays: the age (i_a) and sex (i_f) of every deer in list order. The
+individual semantics of src.main are kept exactly: the list order, newborns
+appended at the end of the list, the five hunting groups culled from the front
+and get_group's min_age meaning strictly older.
+
+Only the random numbers differ. They come from NumPy's Mersenne Twister, seeded
+from the sample's SeedSequence, instead of random.Random, so a seeded run is
+reproducible but does not match engine="individual" sample for sample. Given
+the same random numbers the two produce the same populations.
+
+_simulate is compiled with Numba on first use and cached on disk. Without Numba
+the samples fall back to main.runSample, the pure Python model, as running
+_simulate uncompiled would be several times slower.
+"""
+
+from math import tanh
+
+import numpy as np
+
+from src.main import (
+    AGE_CLASSES,
+    HuntingParameters,
+    ModelParameters,
+    generateInitialPopulation,
+    result_columns,
+    runSample,
+)
+from src.profiling import NO_PROFILE
+from src.results import ResultBuffer
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def jit(function):
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def _grown(array: np.ndarray, size: int) -> np.ndarray:
+    grown = np.empty(size, dtype=array.dtype)
+    grown[: array.shape[0]] = array
+    return grown
+
+
+@jit
+def _hunting_group(age: int, isFemale: bool) -> int:
+    # calves, youngHinds, youngStags, hinds, stags, as in main.hunting
+    if age == 0:
+        return 0
+    if age == 1:
+        return 1 if isFemale else 2
+    return 3 if isFemale else 4
+
+
+@jit
+def _simulate(
+    initial_ages,
+    initial_females,
+    years,
+    fertility,
+    mortality,
+    probMale,
+    maxCapacityImpact,
+    capacityCurveSlope,
+    maximumIndividuals,
+    huntingLimit,
+    culls,
+    seed,
+    keep_ages,
+):
+    np.random.seed(seed)
+
+    n = initial_ages.shape[0]
+    capacity = max(2 * n, 16)
+    ages = _grown(initial_ages, capacity)  # i_a, in list order
+    females = _grown(initial_females, capacity)  # i_f
+    hunted_ages = np.empty(capacity, dtype=ages.dtype)
+    hunted_females = np.empty(capacity, dtype=females.dtype)
+    groups = np.empty(capacity, dtype=np.int64)
+
+    last_fertility = fertility.shape[0] - 1
+    last_mortality = mortality.shape[0] - 1
+
+    num_individuals = np.zeros(years, dtype=np.int64)
+    num_stags = np.zeros(years, dtype=np.int64)
+    num_hinds = np.zeros(years, dtype=np.int64)
+    age_counts = np.zeros((years, AGE_CLASSES), dtype=np.int64)
+    age_list = np.empty(n * years if keep_ages else 0, dtype=np.int64)
+    filled = 0
+
+    for t in range(years):
+        # grow
+        for i in range(n):
+            ages[i] += 1
+
+        # reproduce, with room for one newborn per deer
+        if 2 * n > capacity:
+            capacity = 4 * n
+            ages = _grown(ages, capacity)
+            females = _grown(females, capacity)
+            hunted_ages = np.empty(capacity, dtype=ages.dtype)
+            hunted_females = np.empty(capacity, dtype=females.dtype)
+            groups = np.empty(capacity, dtype=np.int64)
+
+        hasMale = False
+        for i in range(n):
+            if not females[i] and ages[i] >= 1:
+                hasMale = True
+                break
+
+        if hasMale:
+            born = n
+            for i in range(n):
+                if not females[i]:
+                    continue
+                probReproduce = fertility[min(ages[i], last_fertility)]
+                if probReproduce > 0 and np.random.random() < probReproduce:
+                    male = np.random.random() < probMale
+                    # Newborns are appended to the end of the list
+                    ages[born] = 0
+                    females[born] = not male
+                    born += 1
+            n = born
+
+        # naturalDeath, with the carrying capacity adjustment (Algorithm 3)
+        adjustment = (maxCapacityImpact / 2) * (
+            1 + tanh(capacityCurveSlope * (n - maximumIndividuals))
+        )
+        survivors = 0
+        for i in range(n):
+            adjusted_mortality = mortality[min(ages[i], last_mortality)] + adjustment
+            if np.random.random() >= adjusted_mortality:
+                ages[survivors] = ages[i]
+                females[survivors] = females[i]
+                survivors += 1
+        n = survivors
+
+        # hunting: cull the front of each group if it is larger than the limit,
+        # then rebuild the list group by group
+        sizes = np.zeros(5, dtype=np.int64)
+        for i in range(n):
+            groups[i] = _hunting_group(ages[i], females[i])
+            sizes[groups[i]] += 1
+
+        culled = np.zeros(5, dtype=np.int64)
+        starts = np.zeros(5, dtype=np.int64)
+        kept = 0
+        for group in range(5):
+            if sizes[group] > huntingLimit:
+                culled[group] = min(culls[group], sizes[group])
+            starts[group] = kept
+            kept += sizes[group] - culled[group]
+
+        seen = np.zeros(5, dtype=np.int64)
+        for i in range(n):
+            group = groups[i]
+            if seen[group] >= culled[group]:
+                position = starts[group] + seen[group] - culled[group]
+                hunted_ages[position] = ages[i]
+                hunted_females[position] = females[i]
+            seen[group] += 1
+
+        ages, hunted_ages = hunted_ages, ages
+        females, hunted_females = hunted_females, females
+        n = kept
+
+        # Summarise the year
+        num_individuals[t] = n
+        for i in range(n):
+            if females[i]:
+                num_hinds[t] += 1
+            else:
+                num_stags[t] += 1
+            age_counts[t, min(ages[i], AGE_CLASSES - 1)] += 1
+
+        if keep_ages:
+            if filled + n > age_list.shape[0]:
+                age_list = _grown(age_list, 2 * (filled + n))
+            age_list[filled : filled + n] = ages[:n]
+            filled += n
+
+    return num_individuals, num_stags, num_hinds, age_counts, age_list[:filled]
+
+
+def kernel_seed(seed) -> int:
+    """
+    Seed for np.random.seed drawn from a SeedSequence, int or None.
+    """
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return int(seed.generate_state(1)[0])
+
+
+def runCompiledSample(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    iteration=0,
+    seed=None,
+    years=101,
+    age_format="list",
+    stop_sample=None,
+    profile=NO_PROFILE,
+) -> ResultBuffer:
+    """
+    main.runSample through the compiled year loop. stop_sample is applied to
+    the rows afterwards, so the results are the same as stopping the sample.
+    """
+
+    if numba is None:
+        return runSample(
+            parameters,
+            huntingStrategy,
+            iteration,
+            seed,
+            years,
+            age_format,
+            stop_sample,
+            profile,
+        )
+
+    if age_format == "counts":
+        parameters.vitalRates.check_age_classes(AGE_CLASSES, 'age_format="counts"')
+
+    with profile.phase("generateInitialPopulation"):
+        population = generateInitialPopulation()
+        initial_ages = np.array([deer.age for deer in population], dtype=np.int64)
+        initial_females = np.array(
+            [deer.isFemale for deer in population], dtype=np.bool_
+        )
+
+    with profile.phase("simulate"):
+        num_individuals, num_stags, num_hinds, age_counts, age_list = _simulate(
+            initial_ages,
+            initial_females,
+            years,
+            parameters.vitalRates.fertility_table(),
+            parameters.vitalRates.mortality_table(),
+            parameters.probMale,
+            parameters.maxCapacityImpact,
+            parameters.capacityCurveSlope,
+            parameters.maximumIndividuals,
+            parameters.huntingLimit,
+            np.array(
+                [
+                    huntingStrategy.calves,  # h_c
+                    huntingStrategy.youngHinds,  # h_yh
+                    huntingStrategy.youngStags,  # h_ys
+                    huntingStrategy.matureHinds,  # h_h
+                    huntingStrategy.matureStags,  # h_s
+                ],
+                dtype=np.int64,
+            ),
+            kernel_seed(seed),
+            age_format != "counts",
+        )
+
+    with profile.phase("results"):
+        if age_format == "counts":
+            age_distribution = age_counts
+        else:
+            ends = np.cumsum(num_individuals)
+            age_distribution = [
+                age_list[end - size : end].tolist()
+                for end, size in zip(ends, num_individuals)
+            ]
+
+        rows = years
+        if stop_sample is not None:
+            for t in range(years):
+                row = {
+                    "iteration": iteration,
+                    "year": t,
+                    "num_individuals": int(num_individuals[t]),
+                    "num_stags": int(num_stags[t]),
+                    "num_hinds": int(num_hinds[t]),
+                    "age_distribution": age_distribution[t],
+                }
+                if stop_sample(row):
+                    rows = t + 1
+                    break
+
+        results = ResultBuffer(result_columns(age_format), rows)
+        results.extend(
+            rows,
+            iteration=iteration,
+            year=np.arange(rows),
+            num_individuals=num_individuals[:rows],
+            num_stags=num_stags[:rows],
+            num_hinds=num_hinds[:rows],
+            age_distribution=age_distribution[:rows],
+        )
+
+    return results
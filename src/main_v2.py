@@ -1,8 +1,31 @@
 import random
-from math import exp, tanh
+import sys
+from functools import lru_cache
+from math import tanh
 from typing import List
 
-import pandas as pd
+import numpy as np
+
+from src.metrics import (
+    FEMALE,
+    MALE,
+    YearState,
+    evaluate,
+    needs_deaths,
+    resolve_metrics,
+)
+from src.parallel import (
+    imap_jobs,
+    python_seed,
+    resolve_workers,
+    run_jobs,
+    sample_seeds,
+)
+from src.profiling import NO_PROFILE, Profiler
+from src.results import ResultBuffer, age_count_spec
+from src.store import ResultStore
+from src.summary import summarised
+from src.vital_rates import FertilityBand, MortalityBand, VitalRates
 
 
 class Deer:
@@ -17,6 +40,29 @@ class Deer:
         self.isMale = isMale  # i_m
 
 
+# Age-based mortality (p_{i,d}) by age (i_a)
+MORTALITY_SCHEDULE = [
+    MortalityBand(0, 2, rate=0.06),  # From Blackmount DMP 6% calf mortality
+    # 0.02 + (0.03 / 14) * (age - 1), was 0.03 + (0.05 / 14) * (age - 1)
+    MortalityBand(3, 15, rate=0.02, slope=0.03 / 14, origin=1),
+    # 0.08 * exp(2.0 * (age - 16)), was 0.08 * exp(2.47 * (age - 16))
+    MortalityBand(16, rate=0.08, growth=2.0, origin=16),
+]
+
+
+@lru_cache(maxsize=128)  # Every ModelParameters builds its rates on access
+def defaultVitalRates(
+    probYoungReproduce: float = 0.1, probMatureReproduce: float = 0.9
+) -> VitalRates:
+    return VitalRates(
+        MORTALITY_SCHEDULE,
+        [
+            FertilityBand(1, 2, probYoungReproduce),
+            FertilityBand(3, 11, probMatureReproduce),
+        ],
+    )
+
+
 class ModelParameters:
     def __init__(
         self,
@@ -26,9 +72,29 @@ class ModelParameters:
         maximumIndividuals: int,
         probMale: float = 0.52,
         probFemale: float = 0.48,
-        probYoungReproduce: float = 0.1,
-        probMatureReproduce: float = 0.9,
+        probYoungReproduce: float = None,
+        probMatureReproduce: float = None,
+        vitalRates: VitalRates = None,
     ):
+        """
+        probYoungReproduce, probMatureReproduce: fertility of ages 1-2 and 3-11
+            of the default schedules, 0.1 and 0.9 if not given
+        vitalRates: custom mortality and fertility schedules instead of the
+            Black Mount mortality and the two probabilities, which are then
+            None. Raises ValueError if either probability is given too.
+        """
+
+        if vitalRates is None:
+            if probYoungReproduce is None:
+                probYoungReproduce = 0.1
+            if probMatureReproduce is None:
+                probMatureReproduce = 0.9
+        elif probYoungReproduce is not None or probMatureReproduce is not None:
+            raise ValueError(
+                "vitalRates replaces probYoungReproduce and probMatureReproduce, "
+                "give one or the other"
+            )
+
         self.maxCapacityImpact = maxCapacityImpact  # c
         self.capacityCurveSlope = capacityCurveSlope  # a
         self.huntingLimit = huntingLimit  # l
@@ -42,6 +108,19 @@ class ModelParameters:
         self.probMatureReproduce = (
             probMatureReproduce  # Reproduction function, page 18 was 0.9
         )
+        self.customVitalRates = vitalRates
+
+    @property
+    def vitalRates(self) -> VitalRates:
+        # Built from the probabilities on access, so that changing them after
+        # construction still changes the fertility
+        if self.customVitalRates is not None:
+            return self.customVitalRates
+        return defaultVitalRates(self.probYoungReproduce, self.probMatureReproduce)
+
+    @vitalRates.setter
+    def vitalRates(self, vitalRates: VitalRates):
+        self.customVitalRates = vitalRates
 
 
 class HuntingParameters:
@@ -58,6 +137,20 @@ class HuntingParameters:
         self.culling_data = culling_data
 
 
+def make_rng(seed=None):
+    """
+    seed: None to use the global random module itself, otherwise an int or
+        SeedSequence. runSimulation always passes a SeedSequence, see
+        parallel.sample_seeds.
+    """
+
+    if seed is None:
+        return random
+    if not isinstance(seed, int):
+        seed = python_seed(seed)
+    return random.Random(seed)
+
+
 def grow(population: List[Deer]):
     for deer in population:
         deer.age += 1
@@ -65,7 +158,7 @@ def grow(population: List[Deer]):
     return population
 
 
-def reproduce(population: List[Deer], params: ModelParameters):
+def reproduce(population: List[Deer], params: ModelParameters, rng=random):
     newDeer = []
 
     hasMale = any([deer.isMale and deer.age >= 1 for deer in population])
@@ -73,39 +166,37 @@ def reproduce(population: List[Deer], params: ModelParameters):
     if not hasMale:
         return population
 
+    fertility = params.vitalRates.fertility_table().tolist()
+    last = len(fertility) - 1
+
     for deer in population:
         if not deer.isFemale:
             continue
 
-        if deer.age == 1 or deer.age == 2:
-            if random.random() < params.probYoungReproduce:
-                male = False
-                if random.random() < params.probMale:
-                    male = True
-                newDeer.append(Deer(0, not male, male))
-
-        elif 2 < deer.age < 12:
-            if random.random() < params.probMatureReproduce:
-                male = False
-                if random.random() < params.probMale:
-                    male = True
-                newDeer.append(Deer(0, not male, male))
+        probReproduce = fertility[min(deer.age, last)]
+        if probReproduce > 0 and rng.random() < probReproduce:
+            male = False
+            if rng.random() < params.probMale:
+                male = True
+            newDeer.append(Deer(0, not male, male))
 
     return population + newDeer
 
 
-def calculateAgeBasedMortality(
-    age: int,
-) -> float:  # TODO: move some of these into model parameters
+def calculateAgeBasedMortality(age: int) -> float:
+    """
+    Mortality rate (p_{i,d}) of the default schedule at age (i_a). The model
+    steps use the tables of ModelParameters.vitalRates instead.
+    """
+
+    return DEFAULT_VITAL_RATES.mortality_rate(age)
+
 
-    # Calculates the mortality rate (p_{i,d}) based on age (i_a) using the provided formula.
+DEFAULT_VITAL_RATES = defaultVitalRates()
 
-    if 0 <= age <= 2:
-        return 0.06  # From Blackmount DMP 6% calf mortality
-    elif 2 < age < 16:
-        return 0.02 + (0.03 / 14) * (age - 1)  # 0.03 + (0.05 / 14) * (age - 1)
-    else:  # age >= 16
-        return 0.08 * exp(2.0 * (age - 16))  # 0.08 * exp(2.47 * (age - 16))
+# The count formats and the cohort engine hold this many ages, the last one
+# absorbing
+AGE_CLASSES = DEFAULT_VITAL_RATES.age_classes
 
 
 def adjustMortalityRate(
@@ -120,26 +211,28 @@ def adjustMortalityRate(
     return base_mortality + adjustment
 
 
-def naturalDeath(population: List[Deer], params: ModelParameters):
+def naturalDeath(population: List[Deer], params: ModelParameters, rng=random):
     survivors = []
     inow = len(population)  # Current population size
     imax = params.maximumIndividuals  # Maximum carrying capacity
 
-    for deer in population:
-        # Step 1: Calculate the age-based mortality rate using the provided formula
-        base_mortality = calculateAgeBasedMortality(deer.age)
-
-        # Step 2: Adjust mortality rate based on carrying capacity (Algorithm 3)
-        adjusted_mortality = adjustMortalityRate(
-            base_mortality,
-            params.maxCapacityImpact,
-            params.capacityCurveSlope,
-            inow,
-            imax,
-        )
+    # Step 1: Age-based mortality rates (p_{i,d}) from the vital rate table
+    mortality = params.vitalRates.mortality_table().tolist()
+    last = len(mortality) - 1
+
+    # Step 2: The carrying capacity adjustment (Algorithm 3) is the same for
+    # every deer
+    adjustment = adjustMortalityRate(
+        0.0,
+        params.maxCapacityImpact,
+        params.capacityCurveSlope,
+        inow,
+        imax,
+    )
 
+    for deer in population:
         # Step 3: Determine if the deer survives based on adjusted mortality rate
-        if random.random() >= adjusted_mortality:
+        if rng.random() >= mortality[min(deer.age, last)] + adjustment:
             survivors.append(
                 deer
             )  # Deer survives if random number >= adjusted mortality
@@ -187,6 +280,7 @@ def hunting(
     year: int,
     huntingStrategy: HuntingParameters,
     params: ModelParameters,
+    rng=random,  # Unused: list order decides which deer are culled
 ):
     # Retrieve cull data for the current year
     year_cull = huntingStrategy.culling_data.get(
@@ -282,107 +376,520 @@ def generateInitialPopulation(
     return population
 
 
-def runSimulation(
+RESULT_COLUMNS = {
+    "iteration": np.int64,
+    "year": np.int64,
+    "num_individuals": np.int64,
+    "num_stags": np.int64,
+    "num_hinds": np.int64,
+    "num_calves": np.int64,
+    "age_distribution": object,
+    "calves_died_percentage": np.float64,
+    "stags_died_percentage": np.float64,
+    "hinds_died_percentage": np.float64,
+    "avg_age": np.float64,
+}
+
+
+def result_columns(age_format: str = "list", metrics: list = None) -> dict:
+    """
+    RESULT_COLUMNS, or the columns of the given metrics (see src.metrics), with
+    ages stored as age_distribution lists ("list") or as fixed-width age_0 ...
+    age_N count columns ("counts").
+    """
+
+    columns = RESULT_COLUMNS
+    if metrics is not None:
+        columns = {
+            "iteration": np.int64,
+            "year": np.int64,
+            **{metric.name: metric.dtype for metric in resolve_metrics(metrics)},
+        }
+
+    if age_format == "list":
+        return columns
+    if age_format == "counts":
+        return {
+            name: age_count_spec(AGE_CLASSES) if name == "age_distribution" else dtype
+            for name, dtype in columns.items()
+        }
+
+    raise ValueError(f"Unknown age format: {age_format!r}")
+
+
+def get_engine(engine: str = "individual"):
+    """
+    Returns the module implementing the yearly steps for the given engine.
+
+    An engine module provides make_rng, generateInitialPopulation, grow,
+    reproduce, naturalDeath, hunting, count_population, sex_age_counts,
+    summarise_population and copy_population with the same signatures as this
+    module.
+    """
+
+    if engine == "individual":
+        return sys.modules[__name__]
+    if engine == "indexed":
+        from src import indexed_population
+
+        return indexed_population
+    if engine == "array":
+        from src import array_population
+
+        return array_population
+    if engine == "cohort":
+        from src import cohort
+
+        return cohort
+
+    raise ValueError(f"Unknown engine: {engine!r}")
+
+
+def iterateSample(
     parameters: ModelParameters,
     huntingStrategy: HuntingParameters,
+    iteration=0,
+    seed=None,
     initial_stags=1800,
     initial_hinds=3700,
     initial_calves=3700,
-    samples=100,
     start_year=2005,
     end_year=2018,
+    engine="individual",
+    age_format="list",
+    include_population=False,
+    profile=NO_PROFILE,
+    metrics=None,
+    population=None,
+    rng=None,
 ):
-    population_df = pd.DataFrame(
-        columns=[
-            "iteration",
-            "year",
-            "num_individuals",
-            "num_stags",
-            "num_hinds",
-            "num_calves",
-            "age_distribution",
-        ]
+    """
+    Yields the runSimulation row of one sample as each year is simulated, with
+    the population itself under "population" if include_population is set.
+    Stop iterating to stop the sample.
+
+    profile: a src.profiling.Profile timing each phase of the year
+    metrics: names or src.metrics.Metric objects to compute instead of every
+        RESULT_COLUMNS column
+    population, rng: the population at the start of start_year and the random
+        generator to continue with, instead of the initial population and a
+        generator seeded with seed (see src.branching). Both are modified.
+    """
+
+    model = get_engine(engine)
+    if rng is None:
+        rng = model.make_rng(seed)
+
+    if engine == "cohort":
+        parameters.vitalRates.check_age_classes(AGE_CLASSES, "the cohort engine")
+    if age_format == "counts":
+        parameters.vitalRates.check_age_classes(AGE_CLASSES, 'age_format="counts"')
+
+    if metrics is not None:
+        # sex_age_counts tables hold AGE_CLASSES classes
+        parameters.vitalRates.check_age_classes(AGE_CLASSES, "the metrics count table")
+        metrics = resolve_metrics(metrics)
+        count = model.sex_age_counts
+        deaths = needs_deaths(metrics)
+    else:
+        count = model.count_population
+        deaths = True
+
+    if population is None:
+        with profile.phase("generateInitialPopulation"):
+            population = model.generateInitialPopulation(
+                initial_stags,
+                initial_hinds,
+                initial_calves,
+            )
+
+    # print(f"Starting {len(population)}")
+
+    for year in range(start_year, end_year + 1):
+        # Annual processes: grow, reproduce, natural death, hunting
+
+        with profile.phase("grow"):
+            population = model.grow(population)
+        # print(f"Year {year}: {len(population)}")
+        with profile.phase("reproduce"):
+            population = model.reproduce(population, parameters, rng)
+        profile.record_population(iteration, year, len(population))
+        # print(f"Year {year}: {len(population)}")
+
+        before = after = None
+        if deaths:
+            with profile.phase("count_population"):
+                before = count(population)
+        with profile.phase("naturalDeath"):
+            population = model.naturalDeath(population, parameters, rng)
+        if deaths:
+            with profile.phase("count_population"):
+                after = count(population)
+
+        # print(f"Year {year}: {len(population)}")
+
+        with profile.phase("hunting"):
+            population = model.hunting(
+                population, year, huntingStrategy, parameters, rng
+            )
+
+        # print(f"Year {year}: {len(population)}")
+
+        if metrics is not None:
+            with profile.phase("metrics"):
+                row = {
+                    "iteration": iteration,
+                    "year": year,
+                    **evaluate(
+                        metrics,
+                        YearState(
+                            population,
+                            model,
+                            year,
+                            parameters,
+                            age_format,
+                            before,
+                            after,
+                        ),
+                    ),
+                }
+        else:
+            with profile.phase("summarise_population"):
+                (
+                    num_individuals,
+                    num_stags,
+                    num_hinds,
+                    num_calves,
+                    age_distribution,
+                    average_age,
+                ) = model.summarise_population(population, age_format)
+            percent_calves_died, percent_stags_died, percent_hinds_died = (
+                calculate_death_percentages(*before, *after)
+            )
+
+            row = {
+                "iteration": iteration,
+                "year": year,
+                "num_individuals": num_individuals,
+                "num_stags": num_stags,
+                "num_hinds": num_hinds,
+                "num_calves": num_calves,
+                "age_distribution": age_distribution,
+                "calves_died_percentage": percent_calves_died,
+                "stags_died_percentage": percent_stags_died,
+                "hinds_died_percentage": percent_hinds_died,
+                "avg_age": average_age,
+            }
+
+        if include_population:
+            row["population"] = population
+
+        yield row
+
+
+def runSample(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    iteration=0,
+    seed=None,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    start_year=2005,
+    end_year=2018,
+    engine="individual",
+    age_format="list",
+    stop_sample=None,
+    profile=NO_PROFILE,
+    metrics=None,
+) -> ResultBuffer:
+    """
+    Runs one sample of runSimulation with its own random stream, stopping after
+    the first year whose row satisfies stop_sample, if given.
+    """
+
+    results = ResultBuffer(
+        result_columns(age_format, metrics), end_year - start_year + 1
     )
 
-    for i in range(samples):
-        population = generateInitialPopulation(
-            initial_stags,
-            initial_hinds,
-            initial_calves,
-        )
+    for row in iterateSample(
+        parameters,
+        huntingStrategy,
+        iteration,
+        seed,
+        initial_stags,
+        initial_hinds,
+        initial_calves,
+        start_year,
+        end_year,
+        engine,
+        age_format,
+        profile=profile,
+        metrics=metrics,
+    ):
+        with profile.phase("results"):
+            results.append(**row)
+        if stop_sample is not None and stop_sample(row):
+            break
 
-        # print(f"Starting {len(population)}")
+    return results
 
-        for year in range(start_year, end_year + 1):
-            # Annual processes: grow, reproduce, natural death, hunting
 
-            population = grow(population)
-            # print(f"Year {year}: {len(population)}")
-            population = reproduce(population, parameters)
-            # print(f"Year {year}: {len(population)}")
+def simulationJobs(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    engine="individual",
+    batched=False,
+    age_format="list",
+    seed=None,
+    batch_size=None,
+    first_sample=0,
+    stop_sample=None,
+    metrics=None,
+):
+    """
+    The job function and keyword arguments of every job runSimulation runs,
+    each job returning a ResultBuffer. Sample k always gets the same seed
+    stream for a given seed, whatever else is being run alongside it.
+    """
 
-            num_calves_before, num_stags_before, num_hinds_before = count_population(
-                population
-            )
-            population = naturalDeath(population, parameters)
-            num_calves_after, num_stags_after, num_hinds_after = count_population(
-                population
-            )
-            percent_calves_died, percent_stags_died, percent_hinds_died = (
-                calculate_death_percentages(
-                    num_calves_before,
-                    num_stags_before,
-                    num_hinds_before,
-                    num_calves_after,
-                    num_stags_after,
-                    num_hinds_after,
-                )
-            )
+    model = get_engine(engine)
+    options = {
+        "parameters": parameters,
+        "huntingStrategy": huntingStrategy,
+        "initial_stags": initial_stags,
+        "initial_hinds": initial_hinds,
+        "initial_calves": initial_calves,
+        "start_year": start_year,
+        "end_year": end_year,
+        "age_format": age_format,
+    }
+
+    if batched:
+        if metrics is not None:
+            raise ValueError("Batched samples compute every metric")
+        if not hasattr(model, "runBatchedSimulation"):
+            raise ValueError(f"The {engine!r} engine cannot run batched samples")
+        if stop_sample is not None:
+            raise ValueError("Batched samples run in lock-step and cannot stop early")
+
+        # Each batch uses the seed stream of its first sample
+        batch_size = batch_size or samples
+        last_sample = first_sample + samples
+        jobs = [
+            {
+                **options,
+                "samples": min(batch_size, last_sample - first),
+                "first_iteration": first,
+                "seed": sample_seeds(seed, 1, first)[0],
+            }
+            for first in range(first_sample, last_sample, batch_size)
+        ]
+        return model.runBatchedSimulation, jobs
+
+    jobs = [
+        {
+            **options,
+            "iteration": i,
+            "seed": sample_seed,
+            "engine": engine,
+            "stop_sample": stop_sample,
+            # Metric objects rather than names, so workers need no registry
+            "metrics": None if metrics is None else resolve_metrics(metrics),
+        }
+        for i, sample_seed in enumerate(
+            sample_seeds(seed, samples, first_sample), start=first_sample
+        )
+    ]
+    return runSample, jobs
 
-            # print(f"Year {year}: {len(population)}")
 
-            population = hunting(population, year, huntingStrategy, parameters)
+def runSimulation(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    engine="individual",
+    batched=False,
+    age_format="list",
+    seed=None,
+    workers=1,
+    batch_size=None,
+    first_sample=0,
+    stop_sample=None,
+    store=None,
+    scenario="default",
+    chunk_samples=100,
+    profile=None,
+    metrics=None,
+    summary=None,
+):
+    """
+    batched=True advances samples together in one array pass, batch_size
+    samples at a time (all of them by default). Only engines providing
+    runBatchedSimulation (the cohort engine) support it.
+
+    age_format="counts" replaces the age_distribution lists with compact age_0
+    ... age_N count columns, see src.results for helpers reading either format.
+
+    seed makes the run reproducible: every sample (or batch) gets its own
+    stream derived from it, so results do not depend on the number of workers
+    the samples are spread over (None uses every core). first_sample runs
+    samples first_sample, first_sample + 1, ... so more samples can be added
+    to an earlier run with the same seed.
+    Without a seed the streams derive from the global random module, so
+    random.seed(...) before the run makes it reproducible too.
+
+    stop_sample(row) ends a sample after the first year it returns True for,
+    e.g. src.stopping.Extinct(), see iterateSimulation to stop the whole run.
+
+    metrics, e.g. ["num_individuals"], computes only those columns instead of
+    every RESULT_COLUMNS column, see src.metrics.
+
+    store (a ResultStore or its path) streams the results to disk under
+    scenario, chunk_samples samples per file, and returns the store instead of
+    a DataFrame.
+
+    summary (a src.summary.Summary) folds every sample into per-year
+    statistics as it finishes, in the worker that ran it, and returns the
+    Summary instead of a DataFrame: only O(years) memory, whatever samples.
+
+    profile=True times every phase of the run and returns (results, Profile),
+    see src.profiling. A function is called with the Profile of every sample
+    (or batch) as it finishes instead, and a Profiler collects them.
+    """
 
-            # print(f"Year {year}: {len(population)}")
+    profiler = Profiler.resolve(profile)
+    function, jobs = simulationJobs(
+        parameters,
+        huntingStrategy,
+        initial_stags=initial_stags,
+        initial_hinds=initial_hinds,
+        initial_calves=initial_calves,
+        samples=samples,
+        start_year=start_year,
+        end_year=end_year,
+        engine=engine,
+        batched=batched,
+        age_format=age_format,
+        seed=seed,
+        batch_size=batch_size,
+        first_sample=first_sample,
+        stop_sample=stop_sample,
+        metrics=metrics,
+    )
+    if summary is not None:
+        if store is not None:
+            raise ValueError("store and summary cannot be used together")
+        function, jobs = summarised(function, jobs, summary)
+    function, jobs = profiler.wrap(function, jobs)
+
+    if summary is not None:
+        for job_summary in imap_jobs(function, jobs, workers):
+            with profiler.phase("summary"):
+                summary.merge(profiler.collect(job_summary))
+        return profiler.result(summary)
+
+    if store is not None:
+        store = ResultStore.open(store)
+        writer = store.writer(scenario, chunk_samples)
+        for job_results in imap_jobs(function, jobs, workers):
+            with profiler.phase("store"):
+                writer.add(profiler.collect(job_results))
+        with profiler.phase("store"):
+            writer.close()
+        return profiler.result(store)
+
+    results = ResultBuffer(
+        result_columns(age_format, metrics), samples * (end_year - start_year + 1)
+    )
+    for job_results in run_jobs(function, jobs, workers):
+        with profiler.phase("results"):
+            results.extend_from(profiler.collect(job_results))
 
-            num_individuals = len(population)
-            num_stags = sum(
-                1
-                for individual in population
-                if individual.isMale and individual.age >= 3
-            )
-            num_hinds = sum(
-                1
-                for individual in population
-                if individual.isFemale and individual.age >= 3
-            )
-            num_calves = sum(1 for individual in population if individual.age <= 2)
-            age_distribution = [individual.age for individual in population]
-            average_age = (
-                sum(age_distribution) / len(age_distribution)
-                if age_distribution
-                else 0  # TODO this includes 40% being age 0 calves
-            )
+    with profiler.phase("to_frame"):
+        frame = results.to_frame()
+    return profiler.result(frame)
 
-            year_data = pd.DataFrame(
-                {
-                    "iteration": [i],
-                    "year": [year],
-                    "num_individuals": [num_individuals],
-                    "num_stags": [num_stags],
-                    "num_hinds": [num_hinds],
-                    "num_calves": [num_calves],
-                    "age_distribution": [age_distribution],
-                    "calves_died_percentage": [percent_calves_died],
-                    "stags_died_percentage": [percent_stags_died],
-                    "hinds_died_percentage": [percent_hinds_died],
-                    "avg_age": [average_age],
-                }
-            )
 
-            population_df = pd.concat([population_df, year_data], ignore_index=True)
+def iterateSimulation(
+    parameters: ModelParameters,
+    huntingStrategy: HuntingParameters,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    engine="individual",
+    age_format="list",
+    seed=None,
+    workers=1,
+    first_sample=0,
+    stop_sample=None,
+    stop_run=None,
+    include_population=False,
+    metrics=None,
+):
+    """
+    Yields the rows of runSimulation as they are produced instead of returning
+    them all at the end, sample by sample.
+
+    stop_sample(row) ends the current sample after that row, and stop_run(row)
+    ends the whole run after it. Breaking out of the loop also stops the run.
+    With one worker the rows are produced year by year and include_population
+    adds each year's population under "population". With more workers each
+    sample runs in the pool and its rows are yielded once it has finished.
+    """
 
-    return population_df
+    seeds = sample_seeds(seed, samples, first_sample)
+    options = {
+        "parameters": parameters,
+        "huntingStrategy": huntingStrategy,
+        "initial_stags": initial_stags,
+        "initial_hinds": initial_hinds,
+        "initial_calves": initial_calves,
+        "start_year": start_year,
+        "end_year": end_year,
+        "engine": engine,
+        "age_format": age_format,
+        "metrics": None if metrics is None else resolve_metrics(metrics),
+    }
+
+    if resolve_workers(workers) == 1:
+        for i, sample_seed in enumerate(seeds, start=first_sample):
+            for row in iterateSample(
+                **options,
+                iteration=i,
+                seed=sample_seed,
+                include_population=include_population,
+            ):
+                yield row
+                if stop_run is not None and stop_run(row):
+                    return
+                if stop_sample is not None and stop_sample(row):
+                    break
+        return
+
+    jobs = [
+        {**options, "iteration": i, "seed": sample_seed, "stop_sample": stop_sample}
+        for i, sample_seed in enumerate(seeds, start=first_sample)
+    ]
+    for sample_results in imap_jobs(runSample, jobs, workers):
+        for row in sample_results.rows():
+            yield row
+            if stop_run is not None and stop_run(row):
+                return
 
 
 def calculate_death_percentages(
@@ -424,5 +931,70 @@ def count_population(population):
     return num_calves_before, num_stags_before, num_hinds_before
 
 
-def main():
-    pass
+def copy_population(population: List[Deer]) -> List[Deer]:
+    """
+    An independent copy of the population, much faster than copy.deepcopy.
+    """
+
+    return [Deer(deer.age, deer.isFemale, deer.isMale) for deer in population]
+
+
+def sex_age_counts(population: List[Deer]) -> np.ndarray:
+    """
+    Number of deer of each [sex, age], with the last age class absorbing: the
+    single pass src.metrics computes every count-based metric from.
+    """
+
+    counts = [[0] * AGE_CLASSES, [0] * AGE_CLASSES]
+    last = AGE_CLASSES - 1
+    for deer in population:
+        counts[MALE if deer.isMale else FEMALE][min(deer.age, last)] += 1
+
+    return np.array(counts)
+
+
+def summarise_population(population: List[Deer], age_format: str = "list"):
+    num_individuals = len(population)
+    num_stags = sum(
+        1 for individual in population if individual.isMale and individual.age >= 3
+    )
+    num_hinds = sum(
+        1 for individual in population if individual.isFemale and individual.age >= 3
+    )
+    num_calves = sum(1 for individual in population if individual.age <= 2)
+    ages = [individual.age for individual in population]
+    average_age = (
+        sum(ages) / len(ages)
+        if ages
+        else 0  # TODO this includes 40% being age 0 calves
+    )
+
+    if age_format == "counts":
+        age_distribution = [0] * AGE_CLASSES
+        for age in ages:
+            age_distribution[min(age, AGE_CLASSES - 1)] += 1
+    else:
+        age_distribution = ages
+
+    return (
+        num_individuals,
+        num_stags,
+        num_hinds,
+        num_calves,
+        age_distribution,
+        average_age,
+    )
+
+
+def main(argv=None):
+    """
+    Batch runs of scenario files from the command line, see src.cli.
+    """
+
+    from src.cli import main as run_cli
+
+    return run_cli(argv, model="main_v2")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
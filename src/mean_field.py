@@ -0,0 +1,314 @@
+"""
+Deterministic mean-field projection of the main_v2 model, for screening many
+culling schedules before running the promising ones stochastically.
+
+The population is the expected [sex, age] count table of the cohort engine,
+advanced with the same steps and the random draws replaced by their means:
+
+    grow            ages shift by one, as in cohort.grow
+    reproduce       births are fertility (by age) times hinds, p_o,m of them male
+    naturalDeath    survivors are (1 - mortality - adjustment) times the counts,
+                    adjustment being adjustMortalityRate's carrying capacity term
+                    at the expected population
+    hunting         the cohort engine's culls in list order, above huntingLimit,
+                    culled calves split between the sexes in proportion
+
+Every strategy of a projection shares the tables, so hundreds of culling
+schedules advance together in one array pass per year.
+
+The projection is the mean of the model only as far as density dependence is
+close to linear around the expected population (f(E[X]) for E[f(X)]), and it
+never goes extinct. Above all it hides the risk of losing control of the herd.
+Culls are fixed numbers that stop only at huntingLimit, so when they are close
+to what a group recruits, chance decides between samples in which the culls
+drive the group down to huntingLimit and samples in which the herd outgrows
+them. The outcome is then bimodal and the projection, a median-like trajectory,
+follows one mode or neither: create_hunting_strategy(7, 4, 2034) projects a few
+hundred deer in 2050 where the stochastic runs split between a few hundred and
+over 20000, with a mean near 10000.
+
+Screen with it by keeping every candidate within a wide margin of the target
+(shortlist), never by ranking on the projected value alone, then compare the
+shortlist with runSimulation or runSweep.
+"""
+
+import inspect
+
+import numpy as np
+
+from src.cache import cache_key
+from src.cohort import (
+    AGES,
+    CALF_MAX_AGE,
+    FEMALE,
+    MALE,
+    CohortPopulation,
+    count_population,
+    cull_group,
+    generateInitialPopulation,
+    grow,
+    percentage_died,
+)
+from src.main_v2 import AGE_CLASSES, ModelParameters
+from src.results import ResultBuffer, age_count_spec
+
+CULL_GROUPS = ("calves", "hinds", "stags")
+
+PROJECTION_COLUMNS = {
+    "strategy": np.int64,
+    "year": np.int64,
+    "num_individuals": np.float64,
+    "num_stags": np.float64,
+    "num_hinds": np.float64,
+    "num_calves": np.float64,
+    "calves_died_percentage": np.float64,
+    "stags_died_percentage": np.float64,
+    "hinds_died_percentage": np.float64,
+    "avg_age": np.float64,
+}
+
+
+def reproduce(population: CohortPopulation, params: ModelParameters):
+    counts = population.counts
+    hasMale = counts[..., MALE, 1:].sum(axis=-1) > 0
+
+    fertility = params.vitalRates.fertility_table(AGE_CLASSES)
+    births = (counts[..., FEMALE, :] * fertility).sum(axis=-1) * hasMale
+
+    counts = counts.copy()
+    counts[..., MALE, 0] += births * params.probMale
+    counts[..., FEMALE, 0] += births * (1 - params.probMale)
+
+    order = population.order.copy()
+    order[:, 0] = order.max() + 1
+
+    return CohortPopulation(counts, order)
+
+
+def naturalDeath(population: CohortPopulation, params: ModelParameters):
+    inow = population.counts.sum(axis=(-2, -1))  # Expected population size
+    imax = params.maximumIndividuals  # Maximum carrying capacity
+
+    # Carrying capacity adjustment (Algorithm 3)
+    adjustment = (params.maxCapacityImpact / 2) * (
+        1 + np.tanh(params.capacityCurveSlope * (inow - imax))
+    )
+    mortality = params.vitalRates.mortality_table(AGE_CLASSES)
+    adjusted_mortality = mortality + np.expand_dims(adjustment, (-2, -1))
+
+    counts = population.counts * np.clip(1 - adjusted_mortality, 0, 1)
+
+    return CohortPopulation(counts, population.order)
+
+
+def hunting(population: CohortPopulation, culls: np.ndarray, params: ModelParameters):
+    """
+    cohort.hunting with the year's culls given as a [..., group] array of
+    calves, hinds and stags, one row per strategy.
+    """
+
+    counts = population.counts.copy()
+    order = population.order
+    calves = counts[..., : CALF_MAX_AGE + 1]
+    adults = counts[..., CALF_MAX_AGE + 1 :]
+
+    # Cull calves, of each sex in proportion to the class
+    calves_culled = cull_group(
+        calves.sum(axis=-2),
+        order[FEMALE, : CALF_MAX_AGE + 1],
+        culls[..., 0],
+        params.huntingLimit,
+    )
+    total = calves.sum(axis=-2)
+    male_share = np.zeros(total.shape)
+    np.divide(calves[..., MALE, :], total, out=male_share, where=total > 0)
+    calves[..., MALE, :] -= calves_culled * male_share
+    calves[..., FEMALE, :] -= calves_culled * (1 - male_share)
+
+    # Cull hinds and stags
+    for sex, group in ((FEMALE, 1), (MALE, 2)):
+        adults[..., sex, :] -= cull_group(
+            adults[..., sex, :],
+            order[sex, CALF_MAX_AGE + 1 :],
+            culls[..., group],
+            params.huntingLimit,
+        )
+
+    # Rebuild population as calves + hinds + stags
+    group = np.full(order.shape, 2)
+    group[FEMALE] = 1
+    group[:, : CALF_MAX_AGE + 1] = 0
+    _, order = np.unique(group * (order.max() + 1) + order, return_inverse=True)
+
+    return CohortPopulation(counts, order.reshape(group.shape))
+
+
+def cull_table(huntingStrategies: list, years) -> np.ndarray:
+    """
+    Culls as a [year, strategy, group] array, group being CULL_GROUPS.
+    """
+
+    no_cull = dict.fromkeys(CULL_GROUPS, 0)
+    return np.array(
+        [
+            [
+                [
+                    strategy.culling_data.get(year, no_cull)[group]
+                    for group in CULL_GROUPS
+                ]
+                for strategy in huntingStrategies
+            ]
+            for year in years
+        ],
+        dtype=np.float64,
+    ).reshape(len(years), len(huntingStrategies), len(CULL_GROUPS))
+
+
+def runProjection(
+    parameters: ModelParameters,
+    huntingStrategies,
+    initial_stags=1800,
+    initial_hinds=3700,
+    initial_calves=3700,
+    start_year=2005,
+    end_year=2018,
+    age_format="list",
+):
+    """
+    Expected trajectory of every strategy, as a DataFrame of the runSimulation
+    columns with expected (float) counts and a strategy column, the index of
+    the strategy in huntingStrategies, instead of iteration. A single
+    HuntingParameters gives strategy 0.
+
+    age_format="counts" adds expected age_0 ... age_N columns. There are no
+    age_distribution lists, the counts not being whole deer.
+    """
+
+    parameters.vitalRates.check_age_classes(AGE_CLASSES, "the projection")
+    if not isinstance(huntingStrategies, (list, tuple)):
+        huntingStrategies = [huntingStrategies]
+    strategies = len(huntingStrategies)
+    years = np.arange(start_year, end_year + 1)
+    culls = cull_table(huntingStrategies, years.tolist())
+
+    initial = generateInitialPopulation(initial_stags, initial_hinds, initial_calves)
+    population = CohortPopulation(
+        np.repeat(initial.counts[np.newaxis].astype(np.float64), strategies, axis=0),
+        initial.order,
+    )
+
+    yearly_data = []
+    for culls_of_year in culls:
+        population = reproduce(grow(population), parameters)
+        before = count_population(population)
+        population = naturalDeath(population, parameters)
+        after = count_population(population)
+        population = hunting(population, culls_of_year, parameters)
+
+        num_calves, num_stags, num_hinds = count_population(population)
+        per_age = population.counts.sum(axis=-2)
+        num_individuals = per_age.sum(axis=-1)
+        average_age = np.zeros(strategies)
+        np.divide(
+            per_age @ AGES, num_individuals, out=average_age, where=num_individuals > 0
+        )
+        yearly_data.append(
+            {
+                "num_individuals": num_individuals,
+                "num_stags": num_stags,
+                "num_hinds": num_hinds,
+                "num_calves": num_calves,
+                "calves_died_percentage": percentage_died(before[0], after[0]),
+                "stags_died_percentage": percentage_died(before[1], after[1]),
+                "hinds_died_percentage": percentage_died(before[2], after[2]),
+                "avg_age": average_age,
+                "age_distribution": per_age,
+            }
+        )
+
+    # Strategy by strategy, as runSimulation writes samples
+    columns = dict(PROJECTION_COLUMNS)
+    if age_format == "counts":
+        columns["age_distribution"] = (np.float64, age_count_spec(AGE_CLASSES)[1])
+    results = ResultBuffer(columns, strategies * len(years))
+    results.extend(
+        strategies * len(years),
+        strategy=np.repeat(np.arange(strategies), len(years)),
+        year=np.tile(years, strategies),
+        **{
+            name: np.stack([data[name] for data in yearly_data], axis=1).reshape(
+                strategies * len(years), *yearly_data[0][name].shape[1:]
+            )
+            for name in columns
+            if name not in ("strategy", "year")
+        },
+    )
+
+    return results.to_frame()
+
+
+def runProjectionSweep(scenarios: list, **options):
+    """
+    runSweep's table of sweep.Scenario objects, with one expected trajectory
+    per scenario instead of samples. Scenarios sharing their parameters and
+    options are projected together.
+
+    options: runProjection keyword arguments shared by every scenario. Other
+        runSimulation options (engine, samples, seed, ...) are ignored, so the
+        same scenarios can be passed on to runSweep.
+    """
+
+    import pandas as pd
+
+    accepted = set(inspect.signature(runProjection).parameters) - {
+        "parameters",
+        "huntingStrategies",
+    }
+    groups = {}
+    for index, scenario in enumerate(scenarios):
+        scenario_options = {
+            name: value
+            for name, value in {**options, **scenario.options}.items()
+            if name in accepted
+        }
+        key = cache_key("mean_field", scenario.parameters, None, scenario_options)
+        groups.setdefault(key, (scenario.parameters, scenario_options, []))[2].append(
+            index
+        )
+
+    frames = [None] * len(scenarios)
+    for parameters, scenario_options, indices in groups.values():
+        projection = runProjection(
+            parameters,
+            [scenarios[index].huntingStrategy for index in indices],
+            **scenario_options,
+        )
+        for strategy, frame in projection.groupby("strategy", sort=False):
+            scenario = scenarios[indices[strategy]]
+            frame = frame.drop(columns="strategy")
+            for position, (name, value) in enumerate(
+                {"scenario": scenario.name, **scenario.labels}.items()
+            ):
+                frame.insert(position, name, value)
+            frames[indices[strategy]] = frame
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def shortlist(projection, target, margin=0.5, column="num_individuals", year=None):
+    """
+    Rows of a runProjection or runProjectionSweep table whose projected column
+    in year (the last year by default) is within margin * target of target,
+    closest first: the candidates to run stochastically.
+
+    Keep the margin wide, the projection can miss the stochastic mean by far
+    more than the gaps between candidates, see the module docstring.
+    """
+
+    if year is None:
+        year = projection["year"].max()
+    rows = projection[projection["year"] == year]
+    distance = (rows[column] - target).abs()
+    distance = distance[distance <= margin * abs(target)]
+
+    return rows.loc[distance.sort_values(kind="stable").index]
@@ -0,0 +1,362 @@
+"""
+Metapopulation of neighbouring herds coupled by dispersal.
+
+Every herd has its own ModelParameters (e.g. carrying capacity i_max) and
+HuntingParameters and starts from its own initial population. The herds are
+stepped together as one cohort count table with a herd axis, [..., herd, sex,
+age], by the same kernels as the cohort engine: HerdParameters and
+HerdCullingData present the herds' parameters and culls as arrays along the
+herd axis. A year costs about the same for any herd size and grows only slowly with
+the number of herds, so a whole deer management group landscape costs about as
+much as one herd.
+
+After hunting each year, deer move between herds according to the dispersal
+matrix: dispersal[i][j] is the probability a deer of herd i moves to herd j
+that year (the diagonal is ignored, deer that do not move stay). A (2, herds,
+herds) matrix gives separate [female] and [male] probabilities, as stags
+disperse much more than hinds. Movers are drawn multinomially for every
+(herd, sex, age) class and join the same class of their new herd.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.cohort import (
+    AGE_CLASSES,
+    AGES,
+    CohortPopulation,
+    count_population,
+    generateInitialPopulation,
+    grow,
+    hunting,
+    make_rng,
+    naturalDeath,
+    percentage_died,
+    reproduce,
+    summarise_batch,
+)
+from src.main_v2 import HuntingParameters, ModelParameters, result_columns
+from src.parallel import run_jobs, sample_seeds
+from src.results import ResultBuffer
+
+
+class Herd:
+    def __init__(
+        self,
+        name: str,
+        parameters: ModelParameters,
+        huntingStrategy: HuntingParameters,
+        initial_stags=1800,
+        initial_hinds=3700,
+        initial_calves=3700,
+    ):
+        self.name = name
+        self.parameters = parameters
+        self.huntingStrategy = huntingStrategy
+        self.initial_stags = initial_stags
+        self.initial_hinds = initial_hinds
+        self.initial_calves = initial_calves
+
+
+class HerdVitalRates:
+    """
+    The vital rate tables of several herds, stacked along the herd axis.
+    """
+
+    def __init__(self, vitalRates: list):
+        self.vitalRates = vitalRates
+        self._tables = {}
+
+    def mortality_table(self, age_classes: int = None) -> np.ndarray:
+        # [herd, sex, age], applied to the counts of both sexes
+        key = "mortality", age_classes
+        if key not in self._tables:
+            self._tables[key] = np.stack(
+                [rates.mortality_table(age_classes) for rates in self.vitalRates]
+            )[:, np.newaxis, :]
+        return self._tables[key]
+
+    def fertility_table(self, age_classes: int = None) -> np.ndarray:
+        # [herd, age], applied to the counts of hinds
+        key = "fertility", age_classes
+        if key not in self._tables:
+            self._tables[key] = np.stack(
+                [rates.fertility_table(age_classes) for rates in self.vitalRates]
+            )
+        return self._tables[key]
+
+
+class HerdParameters:
+    """
+    ModelParameters of several herds as arrays along the herd axis.
+    """
+
+    def __init__(self, parameters: list):
+        for name in (
+            "maxCapacityImpact",  # c
+            "capacityCurveSlope",  # a
+            "huntingLimit",  # l
+            "maximumIndividuals",  # i_max
+            "probMale",  # p_o,m
+            "probFemale",  # p_o,f
+        ):
+            setattr(self, name, np.array([getattr(p, name) for p in parameters]))
+        for each in parameters:
+            each.vitalRates.check_age_classes(AGE_CLASSES, "the cohort engine")
+        self.vitalRates = HerdVitalRates([p.vitalRates for p in parameters])
+
+
+class HerdCullingData:
+    """
+    culling_data of several herds: get(year) gives the culls of every herd as
+    arrays along the herd axis.
+    """
+
+    def __init__(self, strategies: list):
+        self.strategies = strategies
+
+    def get(self, year, default=None):
+        default = default or {"calves": 0, "hinds": 0, "stags": 0}
+        culls = [
+            strategy.culling_data.get(year, default) for strategy in self.strategies
+        ]
+        return {
+            group: np.array([cull.get(group, 0) for cull in culls])
+            for group in ("calves", "hinds", "stags")
+        }
+
+
+def herd_hunting_parameters(strategies: list) -> HuntingParameters:
+    return HuntingParameters(culling_data=HerdCullingData(strategies))
+
+
+def dispersal_probabilities(dispersal) -> np.ndarray:
+    """
+    Multinomial probabilities [source herd, sex, destination herd] of a
+    (herds, herds) or (2, herds, herds) dispersal matrix.
+    """
+
+    dispersal = np.asarray(dispersal, dtype=float)
+    if dispersal.ndim == 2:
+        dispersal = np.stack([dispersal, dispersal])
+    if dispersal.ndim != 3 or dispersal.shape[0] != 2:
+        raise ValueError("dispersal must be (herds, herds) or (2, herds, herds)")
+
+    herds = dispersal.shape[-1]
+    moving = dispersal * (1 - np.eye(herds))
+    if (moving < 0).any() or (moving.sum(axis=-1) > 1).any():
+        raise ValueError("Dispersal probabilities must be >= 0 and sum to <= 1")
+
+    # Deer that do not move stay in their herd
+    probabilities = moving + np.eye(herds) * (1 - moving.sum(axis=-1, keepdims=True))
+    return probabilities.transpose(1, 0, 2)
+
+
+def disperse(
+    population: CohortPopulation,
+    probabilities: np.ndarray,
+    rng: np.random.Generator,
+    ages: np.ndarray = None,
+):
+    """
+    Moves deer between herds (axis -3 of the counts), returning the new
+    population, the emigrants and the immigrants of every herd. ages: boolean
+    mask of the ages that disperse, all by default.
+    """
+
+    counts = population.counts
+    dispersing = counts if ages is None else counts * ages
+
+    # [..., source, sex, age, destination]
+    moved = rng.multinomial(dispersing, probabilities[:, :, np.newaxis, :])
+    arriving = np.moveaxis(moved.sum(axis=-4), -1, -3)
+
+    stayed = np.moveaxis(np.diagonal(moved, axis1=-4, axis2=-1), -1, -3)
+    emigrants = (dispersing - stayed).sum(axis=(-2, -1))
+    immigrants = (arriving - stayed).sum(axis=(-2, -1))
+
+    counts = counts - dispersing + arriving
+    return CohortPopulation(counts, population.order), emigrants, immigrants
+
+
+def metapopulation_columns(age_format="list") -> dict:
+    columns = result_columns(age_format)
+    return {
+        "iteration": columns["iteration"],
+        "herd": object,
+        **{name: dtype for name, dtype in columns.items() if name != "iteration"},
+        "emigrants": np.int64,
+        "immigrants": np.int64,
+    }
+
+
+def runMetapopulationBatch(
+    herds: list,
+    dispersal,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    age_format="list",
+    first_iteration=0,
+    seed=None,
+    dispersal_ages=None,
+) -> ResultBuffer:
+    """
+    Runs samples of every herd in lock-step as one [sample, herd, sex, age]
+    count table. Rows are written sample by sample, herd by herd.
+    """
+
+    rng = make_rng(seed)
+    parameters = HerdParameters([herd.parameters for herd in herds])
+    huntingStrategy = herd_hunting_parameters([herd.huntingStrategy for herd in herds])
+    probabilities = dispersal_probabilities(dispersal)
+    if probabilities.shape[0] != len(herds):
+        raise ValueError("dispersal must have one row and column per herd")
+    ages = None
+    if dispersal_ages is not None:
+        ages = np.isin(AGES, list(dispersal_ages))
+
+    initial = [
+        generateInitialPopulation(
+            herd.initial_stags, herd.initial_hinds, herd.initial_calves
+        )
+        for herd in herds
+    ]
+    # Every initial population has the same block order
+    population = CohortPopulation(
+        np.repeat(
+            np.stack([herd.counts for herd in initial])[np.newaxis], samples, axis=0
+        ),
+        initial[0].order.copy(),
+    )
+    years = np.arange(start_year, end_year + 1)
+
+    yearly_data = []
+    for year in range(start_year, end_year + 1):
+        population = grow(population)
+        population = reproduce(population, parameters, rng)
+
+        before = count_population(population)
+        population = naturalDeath(population, parameters, rng)
+        after = count_population(population)
+
+        population = hunting(population, year, huntingStrategy, parameters, rng)
+        population, emigrants, immigrants = disperse(
+            population, probabilities, rng, ages
+        )
+
+        # Summarise every (sample, herd) as one batch
+        (
+            num_individuals,
+            num_stags,
+            num_hinds,
+            num_calves,
+            age_distribution,
+            average_age,
+        ) = summarise_batch(
+            CohortPopulation(
+                population.counts.reshape(-1, 2, AGE_CLASSES), population.order
+            ),
+            age_format,
+        )
+
+        yearly_data.append(
+            {
+                "num_individuals": num_individuals,
+                "num_stags": num_stags.ravel(),
+                "num_hinds": num_hinds.ravel(),
+                "num_calves": num_calves.ravel(),
+                "age_distribution": age_distribution,
+                "calves_died_percentage": percentage_died(before[0], after[0]).ravel(),
+                "stags_died_percentage": percentage_died(before[1], after[1]).ravel(),
+                "hinds_died_percentage": percentage_died(before[2], after[2]).ravel(),
+                "avg_age": average_age,
+                "emigrants": emigrants.ravel(),
+                "immigrants": immigrants.ravel(),
+            }
+        )
+
+    trajectories = samples * len(herds)
+    if age_format == "counts":
+        age_distribution = np.stack(
+            [data["age_distribution"] for data in yearly_data], axis=1
+        ).reshape(trajectories * len(years), AGE_CLASSES)
+    else:
+        age_distribution = [
+            data["age_distribution"][i]
+            for i in range(trajectories)
+            for data in yearly_data
+        ]
+
+    results = ResultBuffer(
+        metapopulation_columns(age_format), trajectories * len(years)
+    )
+    results.extend(
+        trajectories * len(years),
+        iteration=np.repeat(
+            first_iteration + np.arange(samples), len(herds) * len(years)
+        ),
+        herd=np.tile(np.repeat([herd.name for herd in herds], len(years)), samples),
+        year=np.tile(years, trajectories),
+        age_distribution=age_distribution,
+        **{
+            name: np.stack([data[name] for data in yearly_data], axis=-1).ravel()
+            for name in yearly_data[0]
+            if name != "age_distribution"
+        },
+    )
+
+    return results
+
+
+def runMetapopulation(
+    herds: list,
+    dispersal,
+    samples=100,
+    start_year=2005,
+    end_year=2018,
+    age_format="list",
+    seed=None,
+    workers=1,
+    batch_size=None,
+    dispersal_ages=None,
+) -> pd.DataFrame:
+    """
+    Simulates herds coupled by yearly dispersal, returning the runSimulation
+    columns of every herd with a herd column and the number of emigrants and
+    immigrants of the year.
+
+    herds: Herd list
+    dispersal: (herds, herds) or (2, herds, herds) yearly dispersal
+        probabilities, see the module docstring
+    dispersal_ages: the ages that disperse, e.g. range(1, 4), all by default
+
+    Samples run batch_size at a time (all at once by default), each batch
+    using the seed stream of its first sample, and batches are spread over
+    workers.
+    """
+
+    batch_size = batch_size or samples
+    jobs = [
+        {
+            "herds": herds,
+            "dispersal": dispersal,
+            "samples": min(batch_size, samples - first),
+            "start_year": start_year,
+            "end_year": end_year,
+            "age_format": age_format,
+            "first_iteration": first,
+            "seed": sample_seeds(seed, 1, first)[0],
+            "dispersal_ages": dispersal_ages,
+        }
+        for first in range(0, samples, batch_size)
+    ]
+
+    results = ResultBuffer(
+        metapopulation_columns(age_format),
+        samples * len(herds) * (end_year - start_year + 1),
+    )
+    for batch_results in run_jobs(runMetapopulationBatch, jobs, workers):
+        results.extend_from(batch_results)
+
+    return results.to_frame()
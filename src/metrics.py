@@ -0,0 +1,180 @@
+"""
+Selectable per-year metrics for runSimulation(..., metrics=[...]).
+
+By default every sample-year computes all the RESULT_COLUMNS of main_v2: two
+count_population passes for the death percentages, the headcounts, the age
+distribution and the average age. With metrics only the chosen columns are
+computed, and all the count-based ones share a single pass over the
+population: the engine's sex_age_counts table, built the first time a metric
+needs it. Metrics that need nothing from it (num_individuals only needs the
+population size) never build it, and the counts around naturalDeath are only
+taken if a death percentage is selected.
+
+Custom metrics are Metric objects, passed directly or registered by name:
+
+    def num_adults(state):
+        return state.counts[:, CALF_MAX_AGE + 1 :].sum()
+
+    register_metric(Metric("num_adults", num_adults, np.int64))
+    runSimulation(..., metrics=["num_individuals", "num_adults"])
+
+Reducers must be module-level functions to run with more than one worker.
+"""
+
+import numpy as np
+
+FEMALE = 0
+MALE = 1
+
+CALF_MAX_AGE = 2  # Calves are aged 0-2 in main_v2, adults 3 and over
+
+
+class Metric:
+    def __init__(self, name: str, reduce, dtype=np.float64, deaths: bool = False):
+        """
+        reduce: function of a YearState returning the value of the year
+        dtype: column dtype, object for lists
+        deaths: the metric uses the counts before and after naturalDeath
+        """
+
+        self.name = name
+        self.reduce = reduce
+        self.dtype = dtype
+        self.deaths = deaths
+
+
+class YearState:
+    """
+    What a metric can use: the population after hunting, its [sex, age] count
+    table (computed once, on first use), and the count tables before and after
+    naturalDeath for metrics with deaths=True.
+    """
+
+    def __init__(
+        self,
+        population,
+        model,
+        year: int,
+        parameters,
+        age_format="list",
+        before_death=None,
+        after_death=None,
+    ):
+        self.population = population
+        self.model = model  # Engine module
+        self.year = year
+        self.parameters = parameters
+        self.age_format = age_format
+        self.before_death = before_death
+        self.after_death = after_death
+        self._counts = None
+
+    @property
+    def counts(self) -> np.ndarray:
+        # The fused pass every count-based metric shares
+        if self._counts is None:
+            self._counts = self.model.sex_age_counts(self.population)
+        return self._counts
+
+
+def num_individuals(state: YearState):
+    return len(state.population)
+
+
+def num_stags(state: YearState):
+    return state.counts[MALE, CALF_MAX_AGE + 1 :].sum()
+
+
+def num_hinds(state: YearState):
+    return state.counts[FEMALE, CALF_MAX_AGE + 1 :].sum()
+
+
+def num_calves(state: YearState):
+    return state.counts[:, : CALF_MAX_AGE + 1].sum()
+
+
+def age_distribution(state: YearState):
+    if state.age_format == "counts":
+        return state.counts.sum(axis=0)
+    # The ages of every deer in list order cannot come from the count table
+    return state.model.summarise_population(state.population, "list")[4]
+
+
+def avg_age(state: YearState):
+    ages = state.counts.sum(axis=0)
+    total = ages.sum()
+    # TODO this includes 40% being age 0 calves
+    return (ages * np.arange(len(ages))).sum() / total if total else 0
+
+
+def _died_percentage(before: int, after: int) -> float:
+    return (before - after) / before * 100 if before > 0 else 0
+
+
+def calves_died_percentage(state: YearState):
+    return _died_percentage(
+        state.before_death[:, : CALF_MAX_AGE + 1].sum(),
+        state.after_death[:, : CALF_MAX_AGE + 1].sum(),
+    )
+
+
+def stags_died_percentage(state: YearState):
+    return _died_percentage(
+        state.before_death[MALE, CALF_MAX_AGE + 1 :].sum(),
+        state.after_death[MALE, CALF_MAX_AGE + 1 :].sum(),
+    )
+
+
+def hinds_died_percentage(state: YearState):
+    return _died_percentage(
+        state.before_death[FEMALE, CALF_MAX_AGE + 1 :].sum(),
+        state.after_death[FEMALE, CALF_MAX_AGE + 1 :].sum(),
+    )
+
+
+METRICS = {
+    metric.name: metric
+    for metric in [
+        Metric("num_individuals", num_individuals, np.int64),
+        Metric("num_stags", num_stags, np.int64),
+        Metric("num_hinds", num_hinds, np.int64),
+        Metric("num_calves", num_calves, np.int64),
+        Metric("age_distribution", age_distribution, object),
+        Metric("calves_died_percentage", calves_died_percentage, deaths=True),
+        Metric("stags_died_percentage", stags_died_percentage, deaths=True),
+        Metric("hinds_died_percentage", hinds_died_percentage, deaths=True),
+        Metric("avg_age", avg_age),
+    ]
+}
+
+
+def register_metric(metric: Metric):
+    METRICS[metric.name] = metric
+
+
+def resolve_metrics(metrics: list) -> list:
+    """
+    Metric objects for a list of metric names and Metric objects.
+    """
+
+    resolved = []
+    for metric in metrics:
+        if isinstance(metric, Metric):
+            resolved.append(metric)
+        elif metric in METRICS:
+            resolved.append(METRICS[metric])
+        else:
+            raise ValueError(f"Unknown metric: {metric!r}")
+
+    names = [metric.name for metric in resolved]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Metrics selected more than once: {names}")
+    return resolved
+
+
+def needs_deaths(metrics: list) -> bool:
+    return any(metric.deaths for metric in metrics)
+
+
+def evaluate(metrics: list, state: YearState) -> dict:
+    return {metric.name: metric.reduce(state) for metric in metrics}
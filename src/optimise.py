@@ -0,0 +1,176 @@
+"""
+Search culling schedules for the lowest total cull that brings the population
+below a target by a deadline year with a given probability.
+
+Candidates are raced: every candidate starts with a few samples, and after each
+round those that are clearly hopeless (upper confidence bound on the success
+probability below the requirement) or clearly good enough (lower bound above
+it) stop sampling. Only the candidates near the boundary get more samples, and
+candidates that cull at least as much as the best accepted one are dropped.
+"""
+
+from functools import partial
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from src.blackmount import DESIRED_POPULATION, create_hunting_strategy
+from src.branching import runBranchedSweep
+from src.sweep import runSweep, scenario_grid
+
+
+def total_cull(huntingStrategy, last_year=None) -> int:
+    """
+    Total number of deer culled by a strategy, up to and including last_year.
+    """
+
+    return sum(
+        sum(year_cull.values())
+        for year, year_cull in huntingStrategy.culling_data.items()
+        if last_year is None or year <= last_year
+    )
+
+
+def wilson_interval(successes, samples, confidence=0.95):
+    """
+    Wilson score interval for a binomial success probability.
+    """
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / samples
+    centre = (p + z**2 / (2 * samples)) / (1 + z**2 / samples)
+    half_width = (
+        z
+        * np.sqrt(p * (1 - p) / samples + z**2 / (4 * samples**2))
+        / (1 + z**2 / samples)
+    )
+    return centre - half_width, centre + half_width
+
+
+class CullOptimisation:
+    def __init__(self, candidates: pd.DataFrame, scenarios: dict):
+        self.candidates = candidates  # One row per candidate, by total cull
+        self._scenarios = scenarios
+
+        accepted = candidates[candidates["status"] == "accepted"]
+        self.best = accepted.iloc[0] if len(accepted) else None
+
+    @property
+    def strategy(self):
+        """
+        HuntingParameters of the best candidate, or None if none was accepted.
+        """
+
+        if self.best is None:
+            return None
+        return self._scenarios[self.best["scenario"]].huntingStrategy
+
+
+def optimiseCullingStrategy(
+    parameters,
+    make_strategy=create_hunting_strategy,
+    target=DESIRED_POPULATION,
+    deadline=2050,
+    probability=0.9,
+    confidence=0.95,
+    initial_samples=10,
+    batch_samples=10,
+    max_samples=200,
+    seed=None,
+    workers=1,
+    engine="cohort",
+    shared_until=None,
+    **axes,
+) -> CullOptimisation:
+    """
+    Finds the candidate schedule with the lowest total cull whose population in
+    the deadline year is at most target with at least the given probability.
+
+    make_strategy: function building HuntingParameters from the axes values
+    axes: candidate values, by default the create_hunting_strategy multipliers
+        1-10 and change years 2020-2045
+    shared_until: last year every candidate culls the same, e.g. 2018 for
+        create_hunting_strategy, so it is simulated once per sample for all of
+        them (see src.branching)
+    """
+
+    axes = axes or {
+        "period_1_multiplier": range(1, 11),
+        "period_2_multiplier": range(1, 11),
+        "change_year": range(2020, 2050, 5),
+    }
+    scenarios = scenario_grid(parameters, make_strategy, **axes)
+    by_name = {scenario.name: scenario for scenario in scenarios}
+
+    candidates = pd.DataFrame(
+        [
+            {
+                "scenario": scenario.name,
+                **scenario.labels,
+                "total_cull": total_cull(scenario.huntingStrategy, deadline),
+                "samples": 0,
+                "successes": 0,
+                "status": "racing",
+            }
+            for scenario in scenarios
+        ]
+    )
+    candidates = candidates.sort_values("total_cull", kind="stable", ignore_index=True)
+
+    samples = initial_samples
+    while True:
+        racing = candidates["status"] == "racing"
+        if not racing.any():
+            break
+
+        # Every racing candidate has had the same samples so far
+        first_sample = int(candidates.loc[racing, "samples"].iloc[0])
+        sweep = runSweep
+        if shared_until is not None:
+            sweep = partial(runBranchedSweep, shared_until=shared_until)
+        results = sweep(
+            [by_name[name] for name in candidates.loc[racing, "scenario"]],
+            samples=samples,
+            seed=seed,
+            workers=workers,
+            first_sample=first_sample,
+            end_year=deadline,
+            engine=engine,
+            age_format="counts",
+        )
+        final = results[results["year"] == deadline]
+        successes = (final["num_individuals"] <= target).groupby(final["scenario"]).sum()
+
+        names = candidates.loc[racing, "scenario"]
+        candidates.loc[racing, "samples"] += samples
+        candidates.loc[racing, "successes"] += names.map(successes).to_numpy()
+
+        lower, upper = wilson_interval(
+            candidates["successes"], candidates["samples"].clip(lower=1), confidence
+        )
+        candidates["lower_bound"] = lower
+        candidates["upper_bound"] = upper
+
+        candidates.loc[racing & (upper < probability), "status"] = "rejected"
+        candidates.loc[racing & (lower >= probability), "status"] = "accepted"
+
+        # Nothing culling as much as an accepted candidate can beat it
+        accepted = candidates["status"] == "accepted"
+        if accepted.any():
+            best_cull = candidates.loc[accepted, "total_cull"].min()
+            candidates.loc[
+                (candidates["status"] == "racing")
+                & (candidates["total_cull"] >= best_cull),
+                "status",
+            ] = "dominated"
+
+        candidates.loc[
+            (candidates["status"] == "racing") & (candidates["samples"] >= max_samples),
+            "status",
+        ] = "inconclusive"
+
+        samples = min(batch_samples, max_samples - first_sample - samples)
+
+    candidates["probability"] = candidates["successes"] / candidates["samples"]
+    return CullOptimisation(candidates, by_name)
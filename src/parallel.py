@@ -0,0 +1,88 @@
+"""
+Seeding and process-pool helpers for running samples in parallel.
+
+Every sample gets its own SeedSequence, derived from the run seed and the
+sample index alone, so a sample produces the same result whichever worker runs
+it and however many workers there are.
+"""
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def root_seed(seed):
+    """
+    seed, or if it is None a seed drawn from the global random module, so that
+    random.seed(...) before a run still reproduces it. Draw it once for runs
+    that must share their streams.
+    """
+
+    if seed is None:
+        return random.getrandbits(128)
+    return seed
+
+
+def sample_seeds(seed, samples: int, first: int = 0) -> list:
+    """
+    Independent seed streams for samples first ... first + samples - 1.
+
+    seed: int, SeedSequence or None, see root_seed
+    """
+
+    root = root_seed(seed)
+    if not isinstance(root, np.random.SeedSequence):
+        root = np.random.SeedSequence(root)
+    return [
+        np.random.SeedSequence(root.entropy, spawn_key=(*root.spawn_key, k))
+        for k in range(first, first + samples)
+    ]
+
+
+def python_seed(seed: np.random.SeedSequence) -> int:
+    """
+    Integer seed for random.Random drawn from a SeedSequence.
+    """
+
+    return int(seed.generate_state(1, np.uint64)[0])
+
+
+def resolve_workers(workers) -> int:
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+
+def _run_job(job):
+    function, kwargs = job
+    return function(**kwargs)
+
+
+def imap_jobs(function, jobs: list, workers=1):
+    """
+    Yields function(**job) for every job, in order. With more than one worker
+    the jobs run in a process pool, so function must be importable at module
+    level and its arguments picklable.
+    """
+
+    workers = resolve_workers(workers)
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield function(**job)
+        return
+
+    chunksize = max(1, len(jobs) // (4 * workers))
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        yield from pool.map(
+            _run_job, [(function, job) for job in jobs], chunksize=chunksize
+        )
+    finally:
+        # Drop the jobs not started yet if the caller stops iterating early
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_jobs(function, jobs: list, workers=1) -> list:
+    return list(imap_jobs(function, jobs, workers))
@@ -0,0 +1,220 @@
+"""
+Opt-in instrumentation for runSimulation: wall time and call counts of every
+phase of a year (grow, reproduce, naturalDeath, hunting, ...), the population
+size each year and peak memory.
+
+    results, profile = runSimulation(..., profile=True)
+    profile.phases()
+
+or, to watch a long sweep without holding on to anything,
+
+    runSimulation(..., profile=lambda sample_profile: print(sample_profile.phases()))
+
+Each job (sample or batch) is profiled in the process that runs it and the
+profiles are merged as the jobs finish.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Profile:
+    def __init__(self):
+        self.seconds = {}  # Wall time by phase
+        self.calls = {}  # Calls by phase
+        self.population = []  # (iteration, year, size after reproduction)
+        self.peak_memory = 0  # Bytes, see Profiler
+        self.jobs = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def record_population(self, iteration, year, size):
+        self.population.append((int(iteration), int(year), int(size)))
+
+    def merge(self, other: "Profile"):
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.calls[name]
+        self.population.extend(other.population)
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+        self.jobs += other.jobs
+
+    def phases(self) -> pd.DataFrame:
+        """
+        Calls and wall time of every phase, slowest first. Times of jobs run in
+        parallel add up, so share is of the total time spent in the phases.
+        """
+
+        import pandas as pd
+
+        frame = pd.DataFrame(
+            {
+                "phase": list(self.seconds),
+                "calls": [self.calls[name] for name in self.seconds],
+                "seconds": list(self.seconds.values()),
+            }
+        )
+        frame["seconds_per_call"] = frame["seconds"] / frame["calls"]
+        frame["share"] = frame["seconds"] / frame["seconds"].sum()
+        return frame.sort_values("seconds", ascending=False, ignore_index=True)
+
+    def population_frame(self) -> pd.DataFrame:
+        import pandas as pd
+
+        return pd.DataFrame(self.population, columns=["iteration", "year", "size"])
+
+
+class _NoProfile:
+    # Stands in for a Profile when profiling is off, at the cost of a no-op
+    # context manager per phase
+    def phase(self, name: str):
+        return nullcontext()
+
+    def record_population(self, iteration, year, size):
+        pass
+
+
+NO_PROFILE = _NoProfile()
+
+
+def peak_rss() -> int:
+    """
+    Peak resident set size of this process in bytes, 0 where unavailable.
+    """
+
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def run_profiled(function, memory="rss", **job):
+    """
+    Runs function(**job, profile=...) with a fresh Profile, returning the job
+    results and the Profile.
+    """
+
+    profile = Profile()
+    profile.jobs = 1
+
+    tracing = memory == "tracemalloc" and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if memory == "tracemalloc":
+        tracemalloc.reset_peak()
+
+    try:
+        results = function(**job, profile=profile)
+    finally:
+        if memory == "tracemalloc":
+            profile.peak_memory = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+        elif memory == "rss":
+            profile.peak_memory = peak_rss()
+
+    return results, profile
+
+
+class Profiler:
+    def __init__(self, hook=None, memory="rss"):
+        """
+        hook: called with the Profile of every job as it finishes
+        memory: "rss" for the peak resident memory of the process running the
+            job (cheap, but includes everything the process ran before),
+            "tracemalloc" for the peak Python allocations of the job alone
+            (slows the run down) or None
+        """
+
+        if memory not in ("rss", "tracemalloc", None):
+            raise ValueError(f"Unknown memory measure: {memory!r}")
+
+        self.hook = hook
+        self.memory = memory
+        self.profile = Profile()
+        self.return_profile = False
+
+    @classmethod
+    def resolve(cls, profile):
+        """
+        The Profiler for runSimulation's profile argument: None (off), True
+        (return the Profile with the results), a hook or a Profiler.
+        """
+
+        if profile is None or profile is False:
+            return NO_PROFILER
+        if isinstance(profile, Profiler):
+            return profile
+        if profile is True:
+            profiler = cls()
+            profiler.return_profile = True
+            return profiler
+        if callable(profile):
+            return cls(hook=profile)
+        raise TypeError(f"profile must be True, a hook or a Profiler, not {profile!r}")
+
+    def phase(self, name: str):
+        return self.profile.phase(name)
+
+    def wrap(self, function, jobs: list):
+        """
+        Jobs running function with a profile, for imap_jobs.
+        """
+
+        return run_profiled, [
+            {"function": function, "memory": self.memory, **job} for job in jobs
+        ]
+
+    def collect(self, output):
+        """
+        Results of a wrapped job, after merging its Profile.
+        """
+
+        results, profile = output
+        self.profile.merge(profile)
+        if self.hook is not None:
+            self.hook(profile)
+        return results
+
+    def result(self, results):
+        return (results, self.profile) if self.return_profile else results
+
+
+class _NoProfiler:
+    def phase(self, name: str):
+        return nullcontext()
+
+    def wrap(self, function, jobs: list):
+        return function, jobs
+
+    def collect(self, output):
+        return output
+
+    def result(self, results):
+        return results
+
+
+NO_PROFILER = _NoProfiler()
@@ -0,0 +1,207 @@
+"""
+Columnar buffers for simulation results.
+
+runSimulation used to build a one-row DataFrame every year and concatenate it
+onto the results, which is quadratic in samples x years. ResultBuffer instead
+preallocates one array per column, fills them in place and builds a single
+DataFrame at the end.
+
+Ages can be stored either as the original ``age_distribution`` column (one list
+of ages per row) or as fixed-width per-age counts in ``age_0``, ``age_1``, ...
+columns, which take orders of magnitude less memory. The helpers below work
+with either format.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+# pandas is only imported by the functions building frames, so that worker
+# processes running samples start without it
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class ResultBuffer:
+    def __init__(self, columns: dict, rows: int):
+        """
+        columns: dict of column name to NumPy dtype, in output order. A
+            (dtype, names) pair stores a fixed-width vector per row, which
+            to_frame expands into one column per name.
+        rows: expected number of rows, the buffer grows if more are appended
+        """
+
+        self.spec = dict(columns)
+        self.columns = {}
+        self.expanded_names = {}
+        for name, dtype in columns.items():
+            if isinstance(dtype, tuple):
+                dtype, self.expanded_names[name] = dtype
+                shape = (rows, len(self.expanded_names[name]))
+            else:
+                shape = (rows,)
+            self.columns[name] = np.empty(shape, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def like(cls, other: "ResultBuffer", rows: int = 0) -> "ResultBuffer":
+        """
+        An empty buffer with the same columns as other.
+        """
+
+        return cls(other.spec, rows)
+
+    def _reserve(self, rows: int):
+        capacity = len(next(iter(self.columns.values())))
+        if self.size + rows <= capacity:
+            return
+
+        capacity = max(self.size + rows, 2 * capacity)
+        for name, column in self.columns.items():
+            grown = np.empty((capacity, *column.shape[1:]), dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            self.columns[name] = grown
+
+    def append(self, **row):
+        """
+        Adds one row, given as one value per column.
+        """
+
+        self._reserve(1)
+        for name, column in self.columns.items():
+            column[self.size] = row[name]
+        self.size += 1
+
+    def extend(self, rows: int, **block):
+        """
+        Adds a block of rows, given as one sequence per column. Scalars are
+        repeated for every row of the block.
+        """
+
+        self._reserve(rows)
+        for name, column in self.columns.items():
+            values = block[name]
+            if column.dtype == object:
+                # Assign element-wise so list values are not broadcast
+                for offset, value in enumerate(values):
+                    column[self.size + offset] = value
+            else:
+                column[self.size : self.size + rows] = values
+        self.size += rows
+
+    def extend_from(self, other: "ResultBuffer"):
+        """
+        Adds every row of another buffer with the same columns.
+        """
+
+        self.extend(
+            other.size,
+            **{name: column[: other.size] for name, column in other.columns.items()},
+        )
+
+    def rows(self):
+        """
+        Yields every row as a dict of column values.
+        """
+
+        for i in range(self.size):
+            yield {name: column[i] for name, column in self.columns.items()}
+
+    def to_frame(self) -> pd.DataFrame:
+        import pandas as pd
+
+        data = {}
+        for name, column in self.columns.items():
+            if column.ndim == 1:
+                data[name] = column[: self.size]
+            else:
+                for k, expanded_name in enumerate(self.expanded_names[name]):
+                    data[expanded_name] = column[: self.size, k]
+
+        return pd.DataFrame(data, copy=False)
+
+
+AGE_COUNT_DTYPE = np.uint32
+
+
+def age_count_spec(age_classes: int) -> tuple:
+    """
+    ResultBuffer column spec storing per-age counts as age_0 ... age_N columns.
+    """
+
+    return AGE_COUNT_DTYPE, [f"age_{age}" for age in range(age_classes)]
+
+
+def age_count_columns(population_df: pd.DataFrame) -> list:
+    """
+    Names of the age_0, age_1, ... count columns, in age order.
+    """
+
+    columns = [
+        column
+        for column in population_df.columns
+        if column.startswith("age_") and column[4:].isdigit()
+    ]
+    return sorted(columns, key=lambda column: int(column[4:]))
+
+
+def age_counts(population_df: pd.DataFrame) -> np.ndarray:
+    """
+    Per-age counts for every row, shape (rows, ages), from either age format.
+    """
+
+    columns = age_count_columns(population_df)
+    if columns:
+        return population_df[columns].to_numpy()
+
+    ages = population_df["age_distribution"]
+    width = max((max(row) + 1 for row in ages if len(row)), default=1)
+    return np.stack(
+        [np.bincount(row, minlength=width).astype(AGE_COUNT_DTYPE) for row in ages]
+    )
+
+
+def mean_age(population_df: pd.DataFrame) -> pd.Series:
+    """
+    Average age of every row, as in the avg_age column.
+    """
+
+    import pandas as pd
+
+    counts = age_counts(population_df)
+    totals = counts.sum(axis=1)
+    means = np.zeros(len(counts))
+    np.divide(counts @ np.arange(counts.shape[1]), totals, out=means, where=totals > 0)
+
+    return pd.Series(means, index=population_df.index, name="avg_age")
+
+
+def age_histogram(population_df: pd.DataFrame, year=None) -> pd.Series:
+    """
+    Mean number of deer of each age across the selected rows (every row, or
+    only those of the given year), indexed by age.
+    """
+
+    import pandas as pd
+
+    if year is not None:
+        population_df = population_df[population_df["year"] == year]
+
+    counts = age_counts(population_df)
+    return pd.Series(
+        counts.mean(axis=0), index=pd.RangeIndex(counts.shape[1], name="age")
+    )
+
+
+def age_distribution_lists(counts: np.ndarray) -> list:
+    """
+    Expands per-age counts back into age_distribution lists.
+    """
+
+    ages = np.arange(counts.shape[-1])
+    return [np.repeat(ages, row).tolist() for row in counts]
@@ -0,0 +1,510 @@
+"""
+Global sensitivity analysis of a main_v2 outcome (by default the 2050
+population) to the model parameters, through a Gaussian process emulator.
+
+Sobol and Morris indices need tens of thousands of model evaluations, far too
+many stochastic runs. Instead:
+
+1. A Latin hypercube design of points spreads over the parameter ranges, and
+   every point is simulated samples times (in parallel, in batches). The mean
+   outcome and the variance of that mean are kept.
+2. A Gaussian process with an anisotropic squared exponential kernel is fitted
+   to the means, each point's variance being its noise, so the emulator
+   smooths the sampling noise rather than interpolating it.
+3. The indices are computed on the emulator mean, which is cheap to evaluate.
+
+    sensitivity = runSensitivity(points=200, workers=None, path="design.npz")
+    sensitivity.sobol()
+    sensitivity.morris()
+    sensitivity.validation()  # Leave-one-out check of the emulator
+
+With a path, the simulated points are saved and reused: running again with
+more points only simulates the new ones, each batch of points being a Latin
+hypercube of its own, and refits the emulator on all of them.
+"""
+
+import os
+
+import numpy as np
+
+from src.blackmount import create_hunting_strategy
+from src.cache import cache_key
+from src.calibration import FIXED_PARAMETERS, PRIORS, Uniform
+from src.main_v2 import ModelParameters, iterateSample
+from src.parallel import imap_jobs, root_seed, sample_seeds
+
+# Parameters varied and the ranges they are varied over
+RANGES = {
+    **PRIORS,
+    "maximumIndividuals": Uniform(8000, 25000),  # i_max
+    "huntingLimit": Uniform(0, 500),  # l
+}
+
+INTEGER_PARAMETERS = ("maximumIndividuals", "huntingLimit")
+
+
+def latin_hypercube(points: int, dimensions: int, rng: np.random.Generator):
+    """
+    points points of the unit cube, one in each of points equal slices of
+    every dimension.
+    """
+
+    strata = np.argsort(rng.random((dimensions, points)), axis=1).T
+    return (strata + rng.random((points, dimensions))) / points
+
+
+class Design:
+    def __init__(self, ranges: dict, key: str, seed: int):
+        """
+        ranges: distribution (with quantile(u) and, for INTEGER_PARAMETERS,
+            cdf(x) methods) of every parameter
+        key: cache_key of everything the outputs depend on
+        seed: the seed every point's streams derive from
+        """
+
+        self.ranges = ranges
+        self.names = list(ranges)
+        self.key = key
+        self.seed = seed
+        self.unit = np.zeros((0, len(ranges)))  # Points simulated, see snap
+        self.outputs = np.zeros(0)  # Mean outcome of each point
+        self.variances = np.zeros(0)  # Variance of each mean
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def parameters(self, unit: np.ndarray) -> list:
+        """
+        The ModelParameters arguments of every point of the unit cube.
+        """
+
+        values = {
+            name: self.ranges[name].quantile(unit[:, i])
+            for i, name in enumerate(self.names)
+        }
+        return [
+            {
+                name: (
+                    int(round(value[point]))
+                    if name in INTEGER_PARAMETERS
+                    else float(value[point])
+                )
+                for name, value in values.items()
+            }
+            for point in range(len(unit))
+        ]
+
+    def snap(self, unit: np.ndarray) -> np.ndarray:
+        """
+        The points of the unit cube moved to the rounded values of the integer
+        parameters that parameters(unit) simulates, so that the emulator is
+        fitted where the model was run.
+        """
+
+        unit = np.array(unit, dtype=np.float64)
+        for i, name in enumerate(self.names):
+            if name in INTEGER_PARAMETERS:
+                values = np.round(self.ranges[name].quantile(unit[:, i]))
+                unit[:, i] = self.ranges[name].cdf(values)
+        return unit
+
+    def add(self, unit: np.ndarray, outputs, variances):
+        self.unit = np.concatenate([self.unit, self.snap(unit)])
+        self.outputs = np.concatenate([self.outputs, outputs])
+        self.variances = np.concatenate([self.variances, variances])
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                unit=self.unit,
+                outputs=self.outputs,
+                variances=self.variances,
+                key=self.key,
+                seed=str(self.seed),  # Wider than any NumPy integer
+            )
+
+    @classmethod
+    def load(cls, path, ranges: dict) -> "Design":
+        with np.load(path) as data:
+            design = cls(ranges, str(data["key"]), int(str(data["seed"])))
+            design.add(data["unit"], data["outputs"], data["variances"])
+        return design
+
+
+def runDesignBatch(
+    points: list,
+    seeds: list,
+    huntingStrategy,
+    fixed: dict,
+    column: str,
+    year: int,
+    samples: int,
+    **options,
+) -> list:
+    """
+    Simulates each point (a dict of ModelParameters arguments) samples times
+    up to year. Returns the mean of column in year and the variance of that
+    mean for every point.
+    """
+
+    outcomes = []
+    for point, seed in zip(points, seeds):
+        parameters = ModelParameters(**{**fixed, **point})
+        values = np.zeros(samples)
+        for sample, sample_seed in enumerate(sample_seeds(seed, samples)):
+            for row in iterateSample(
+                parameters,
+                huntingStrategy,
+                sample,
+                sample_seed,
+                end_year=year,
+                metrics=[column],
+                **options,
+            ):
+                values[sample] = row[column]
+
+        variance = values.var(ddof=1) / samples if samples > 1 else 0.0
+        outcomes.append((float(values.mean()), float(variance)))
+
+    return outcomes
+
+
+class GaussianProcess:
+    def __init__(self, inputs: np.ndarray, outputs: np.ndarray, noise=None):
+        """
+        inputs: (points, dimensions) design, in the unit cube
+        outputs: value at every point
+        noise: known noise variance of every output, if any
+        """
+
+        self.inputs = inputs
+        self.mean = outputs.mean()
+        self.scale = outputs.std() or 1.0
+        self.outputs = (outputs - self.mean) / self.scale  # Standardised
+        self.noise = (
+            np.zeros(len(outputs)) if noise is None else noise / self.scale**2
+        )
+
+        # Log hyperparameters: length scale of every dimension, signal
+        # variance and noise variance on top of the known noise
+        self.log_lengthscales = np.full(inputs.shape[1], np.log(0.3))
+        self.log_signal = 0.0
+        self.log_jitter = np.log(1e-4)
+        self._factorise()
+
+    def _kernel(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        lengthscales = np.exp(self.log_lengthscales)
+        a = a / lengthscales
+        b = b / lengthscales
+        distances = (
+            (a**2).sum(axis=1)[:, np.newaxis]
+            + (b**2).sum(axis=1)[np.newaxis]
+            - 2 * a @ b.T
+        )
+        return np.exp(self.log_signal) * np.exp(-0.5 * np.maximum(distances, 0))
+
+    def _factorise(self):
+        covariance = self._kernel(self.inputs, self.inputs) + np.diag(
+            self.noise + np.exp(self.log_jitter)
+        )
+        cholesky = np.linalg.cholesky(covariance)
+        self._inverse_cholesky = np.linalg.inv(cholesky)
+        self._inverse = self._inverse_cholesky.T @ self._inverse_cholesky
+        self._weights = self._inverse @ self.outputs
+        self.log_likelihood = float(
+            -0.5 * self.outputs @ self._weights
+            - np.log(np.diag(cholesky)).sum()
+            - 0.5 * len(self.outputs) * np.log(2 * np.pi)
+        )
+
+    def _gradient(self) -> np.ndarray:
+        # d log likelihood = tr((w w^T - K^-1) dK) / 2 for every hyperparameter
+        outer = np.outer(self._weights, self._weights) - self._inverse
+        signal = self._kernel(self.inputs, self.inputs)
+        differences = (
+            self.inputs[:, np.newaxis, :] - self.inputs[np.newaxis, :, :]
+        ) ** 2 / np.exp(2 * self.log_lengthscales)
+        return 0.5 * np.concatenate(
+            [
+                np.einsum("ij,ij,ijk->k", outer, signal, differences),
+                [(outer * signal).sum()],
+                [np.exp(self.log_jitter) * np.trace(outer)],
+            ]
+        )
+
+    def fit(self, iterations=300, learning_rate=0.05) -> "GaussianProcess":
+        """
+        Maximises the log marginal likelihood over the hyperparameters with
+        Adam, there being no SciPy optimiser to rely on.
+        """
+
+        theta = np.concatenate(
+            [self.log_lengthscales, [self.log_signal, self.log_jitter]]
+        )
+        low = np.r_[np.full(len(self.log_lengthscales), np.log(1e-2)), -5, -18]
+        high = np.r_[np.full(len(self.log_lengthscales), np.log(1e2)), 5, 2]
+        first = np.zeros(len(theta))
+        second = np.zeros(len(theta))
+        for step in range(1, iterations + 1):
+            gradient = self._gradient()
+            first = 0.9 * first + 0.1 * gradient
+            second = 0.999 * second + 0.001 * gradient**2
+            theta = theta + learning_rate * (first / (1 - 0.9**step)) / (
+                np.sqrt(second / (1 - 0.999**step)) + 1e-8
+            )
+            theta = np.clip(theta, low, high)
+            self.log_lengthscales = theta[:-2]
+            self.log_signal, self.log_jitter = theta[-2:]
+            self._factorise()
+
+        return self
+
+    def predict(self, inputs: np.ndarray, return_std=False, chunk=4096):
+        """
+        Emulator mean (and standard deviation) at every row of inputs.
+        """
+
+        means = np.empty(len(inputs))
+        stds = np.empty(len(inputs))
+        for start in range(0, len(inputs), chunk):
+            covariance = self._kernel(inputs[start : start + chunk], self.inputs)
+            means[start : start + chunk] = covariance @ self._weights
+            if return_std:
+                projected = covariance @ self._inverse_cholesky.T
+                stds[start : start + chunk] = np.sqrt(
+                    np.maximum(np.exp(self.log_signal) - (projected**2).sum(axis=1), 0)
+                )
+
+        means = self.mean + self.scale * means
+        return (means, self.scale * stds) if return_std else means
+
+    def leave_one_out(self):
+        """
+        Prediction of every design output by the emulator fitted to the others
+        (with the same hyperparameters), and its standard deviation.
+        """
+
+        diagonal = np.diag(self._inverse)
+        means = self.outputs - self._weights / diagonal
+        return self.mean + self.scale * means, self.scale / np.sqrt(diagonal)
+
+
+def sobol_indices(function, dimensions: int, n=4096, rng=None):
+    """
+    First order (Saltelli 2010) and total (Jansen) Sobol indices of function,
+    a vectorised function of points of the unit cube, from n (d + 2) calls.
+    """
+
+    rng = rng or np.random.default_rng()
+    a = rng.random((n, dimensions))
+    b = rng.random((n, dimensions))
+    values_a = function(a)
+    values_b = function(b)
+    variance = np.concatenate([values_a, values_b]).var()
+
+    first_order = np.zeros(dimensions)
+    total = np.zeros(dimensions)
+    for i in range(dimensions):
+        mixed = a.copy()
+        mixed[:, i] = b[:, i]
+        values_mixed = function(mixed)
+        first_order[i] = np.mean(values_b * (values_mixed - values_a)) / variance
+        total[i] = 0.5 * np.mean((values_a - values_mixed) ** 2) / variance
+
+    return first_order, total
+
+
+def morris_effects(function, dimensions: int, trajectories=100, levels=4, rng=None):
+    """
+    Elementary effects of function, a vectorised function of points of the
+    unit cube, along trajectories one-at-a-time paths on a levels grid, as a
+    (trajectories, dimensions) array.
+    """
+
+    rng = rng or np.random.default_rng()
+    delta = levels / (2 * (levels - 1))
+    # Starting levels from which a step of delta stays in the cube
+    starts = np.arange(levels // 2) / (levels - 1)
+
+    orders = np.argsort(rng.random((trajectories, dimensions)), axis=1)
+    paths = np.repeat(
+        rng.choice(starts, (trajectories, 1, dimensions)), dimensions + 1, axis=1
+    )
+    for step in range(dimensions):
+        moved = orders[:, step]
+        paths[np.arange(trajectories), step + 1 :, moved] += delta
+
+    values = function(paths.reshape(-1, dimensions)).reshape(
+        trajectories, dimensions + 1
+    )
+    effects = np.empty((trajectories, dimensions))
+    effects[np.arange(trajectories)[:, np.newaxis], orders] = (
+        np.diff(values, axis=1) / delta
+    )
+    return effects
+
+
+class Sensitivity:
+    def __init__(self, design: Design, emulator: GaussianProcess):
+        self.design = design
+        self.emulator = emulator
+
+    def sobol(self, n=4096, seed=None):
+        """
+        First order and total Sobol index of every parameter, on the emulator.
+        """
+
+        import pandas as pd
+
+        first_order, total = sobol_indices(
+            self.emulator.predict,
+            len(self.design.names),
+            n,
+            np.random.default_rng(seed),
+        )
+        return pd.DataFrame(
+            {"parameter": self.design.names, "first_order": first_order, "total": total}
+        )
+
+    def morris(self, trajectories=100, levels=4, seed=None):
+        """
+        Morris mean, mean absolute (mu_star) and standard deviation of the
+        elementary effects of every parameter, on the emulator. Effects are per
+        whole range of the parameter.
+        """
+
+        import pandas as pd
+
+        effects = morris_effects(
+            self.emulator.predict,
+            len(self.design.names),
+            trajectories,
+            levels,
+            np.random.default_rng(seed),
+        )
+        return pd.DataFrame(
+            {
+                "parameter": self.design.names,
+                "mu": effects.mean(axis=0),
+                "mu_star": np.abs(effects).mean(axis=0),
+                "sigma": effects.std(axis=0, ddof=1),
+            }
+        )
+
+    def validation(self):
+        """
+        Every design point with its simulated output, the leave-one-out
+        emulator prediction and the standardised error, which should mostly
+        lie within +-2 for a trustworthy emulator.
+        """
+
+        import pandas as pd
+
+        predicted, std = self.emulator.leave_one_out()
+        frame = pd.DataFrame(self.design.parameters(self.design.unit))
+        frame["output"] = self.design.outputs
+        frame["predicted"] = predicted
+        # The leave-one-out deviation already includes the point's noise
+        frame["standardised_error"] = (self.design.outputs - predicted) / std
+        return frame
+
+
+def runSensitivity(
+    points=200,
+    ranges=None,
+    huntingStrategy=None,
+    column="num_individuals",
+    year=2050,
+    samples=5,
+    fixed=None,
+    seed=None,
+    workers=1,
+    batch_size=10,
+    path=None,
+    fit_iterations=300,
+    engine="cohort",
+    **options,
+) -> Sensitivity:
+    """
+    Simulates a design of points parameter sets and fits the emulator.
+
+    ranges: distribution (with quantile(u) and, for INTEGER_PARAMETERS,
+        cdf(x) methods) of every varied ModelParameters argument, RANGES by
+        default
+    huntingStrategy: the culls simulated, the notebook base rates
+        (create_hunting_strategy(1, 1, 2034)) by default
+    column, year: the outcome, column of the results in year
+    samples: simulations averaged at every point
+    fixed: ModelParameters arguments that are not varied
+    path: .npz file caching the design; only the points beyond those already
+        cached are simulated. Raises ValueError if it was run with other
+        settings.
+    options: initial_stags, initial_hinds, initial_calves or start_year
+    """
+
+    ranges = ranges or RANGES
+    huntingStrategy = huntingStrategy or create_hunting_strategy(1, 1, 2034)
+    fixed = {**FIXED_PARAMETERS, **(fixed or {})}
+    options = {"engine": engine, **options}
+
+    cached = None
+    if path is not None and os.path.exists(path):
+        cached = Design.load(path, ranges)
+        if seed is None:
+            seed = cached.seed
+    # Fixed from here on, so that the design can be extended
+    seed = root_seed(seed)
+
+    key = cache_key(
+        "sensitivity",
+        fixed,
+        huntingStrategy,
+        {
+            "ranges": ranges,
+            "column": column,
+            "year": year,
+            "samples_per_point": samples,
+            "seed": seed,
+            **options,
+        },
+    )
+    if cached is not None and cached.key != key:
+        raise ValueError(f"{path} was simulated with other settings")
+    design = cached or Design(ranges, key, seed)
+
+    first = len(design)
+    if points > first:
+        unit = latin_hypercube(
+            points - first, len(design.names), np.random.default_rng([seed, first])
+        )
+        parameters = design.parameters(unit)
+        seeds = sample_seeds(seed, points - first, first)
+        jobs = [
+            {
+                "points": parameters[start : start + batch_size],
+                "seeds": seeds[start : start + batch_size],
+                "huntingStrategy": huntingStrategy,
+                "fixed": fixed,
+                "column": column,
+                "year": year,
+                "samples": samples,
+                **options,
+            }
+            for start in range(0, points - first, batch_size)
+        ]
+        outcomes = [
+            outcome
+            for batch_outcomes in imap_jobs(runDesignBatch, jobs, workers)
+            for outcome in batch_outcomes
+        ]
+        design.add(
+            unit,
+            [mean for mean, _ in outcomes],
+            [variance for _, variance in outcomes],
+        )
+        if path is not None:
+            design.save(path)
+
+    emulator = GaussianProcess(design.unit, design.outputs, design.variances)
+    return Sensitivity(design, emulator.fit(fit_iterations))
@@ -0,0 +1,53 @@
+"""
+Conditions for stopping a sample or a whole run early, for the stop_sample and
+stop_run arguments of runSimulation and iterateSimulation.
+
+They are classes rather than lambdas so they can be sent to worker processes.
+"""
+
+
+class Extinct:
+    """
+    No deer left.
+    """
+
+    def __call__(self, row) -> bool:
+        return row["num_individuals"] == 0
+
+
+class Below:
+    """
+    A row value at or below a threshold, e.g. the target population.
+    """
+
+    def __init__(self, threshold, column="num_individuals"):
+        self.threshold = threshold
+        self.column = column
+
+    def __call__(self, row) -> bool:
+        return row[self.column] <= self.threshold
+
+
+class Above:
+    """
+    A row value above a threshold, e.g. the carrying capacity i_max.
+    """
+
+    def __init__(self, threshold, column="num_individuals"):
+        self.threshold = threshold
+        self.column = column
+
+    def __call__(self, row) -> bool:
+        return row[self.column] > self.threshold
+
+
+class AnyOf:
+    """
+    Any of several conditions.
+    """
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+
+    def __call__(self, row) -> bool:
+        return any(condition(row) for condition in self.conditions)
@@ -0,0 +1,165 @@
+"""
+Chunked on-disk result store for runs too large to keep in one DataFrame.
+
+Results are written as Parquet files partitioned by scenario,
+
+    <path>/scenario=<name>/samples-<first>-<last>.parquet
+
+one file per chunk of samples, and read back through memory mapping with
+column projection, so plotting ``year`` and ``num_individuals`` never touches
+the ``age_distribution`` lists. Requires the optional pyarrow dependency.
+"""
+
+import os
+from urllib.parse import quote
+
+import numpy as np
+
+from src.results import ResultBuffer
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "The result store needs pyarrow, install it with `pip install pyarrow`"
+        ) from error
+    return pyarrow
+
+
+def buffer_to_table(results: ResultBuffer, labels: dict = None):
+    """
+    Arrow table of a ResultBuffer, with a constant column for every label.
+    """
+
+    pa = _pyarrow()
+    size = results.size
+
+    data = {name: np.full(size, value) for name, value in (labels or {}).items()}
+    for name, column in results.columns.items():
+        if column.dtype == object:
+            # age_distribution lists
+            data[name] = pa.array(list(column[:size]), type=pa.list_(pa.int16()))
+        elif column.ndim == 1:
+            data[name] = column[:size]
+        else:
+            for k, expanded_name in enumerate(results.expanded_names[name]):
+                data[expanded_name] = column[:size, k]
+
+    return pa.table(data)
+
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = os.fspath(path)
+
+    @classmethod
+    def open(cls, store) -> "ResultStore":
+        """
+        store: a ResultStore or the path of one
+        """
+
+        return store if isinstance(store, cls) else cls(store)
+
+    def partition(self, scenario: str) -> str:
+        return os.path.join(self.path, f"scenario={quote(str(scenario), safe='')}")
+
+    def write(self, results: ResultBuffer, scenario="default", labels: dict = None):
+        """
+        Writes the rows of a buffer as one chunk of the scenario's partition.
+        """
+
+        pa = _pyarrow()
+        if results.size == 0:
+            return
+
+        iterations = results.columns["iteration"][: results.size]
+        directory = self.partition(scenario)
+        os.makedirs(directory, exist_ok=True)
+        pa.parquet.write_table(
+            buffer_to_table(results, labels),
+            os.path.join(
+                directory,
+                f"samples-{iterations.min():06d}-{iterations.max():06d}.parquet",
+            ),
+        )
+
+    def writer(self, scenario="default", chunk_samples=100, labels: dict = None):
+        return ChunkWriter(self, scenario, chunk_samples, labels)
+
+    def dataset(self):
+        """
+        The whole store as a memory-mapped pyarrow dataset.
+        """
+
+        pa = _pyarrow()
+        return pa.dataset.dataset(
+            self.path,
+            format="parquet",
+            partitioning="hive",
+            filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+        )
+
+    def scenarios(self) -> list:
+        dataset = self.dataset()
+        return sorted(set(dataset.to_table(columns=["scenario"])["scenario"].to_pylist()))
+
+    def table(self, columns: list = None, scenarios: list = None, iterations=None):
+        """
+        Arrow table of only the given columns, scenarios and iterations.
+        """
+
+        pa = _pyarrow()
+        dataset = self.dataset()
+
+        condition = None
+        if scenarios is not None:
+            condition = pa.dataset.field("scenario").isin(list(scenarios))
+        if iterations is not None:
+            selected = pa.dataset.field("iteration").isin(list(iterations))
+            condition = selected if condition is None else condition & selected
+
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def read(self, columns: list = None, scenarios: list = None, iterations=None):
+        """
+        DataFrame of only the given columns, scenarios and iterations, e.g.
+        store.read(["iteration", "year", "num_individuals"]) for plotting.
+        """
+
+        return self.table(columns, scenarios, iterations).to_pandas()
+
+
+class ChunkWriter:
+    """
+    Collects ResultBuffers and writes them to a store every chunk_samples
+    samples.
+    """
+
+    def __init__(self, store: ResultStore, scenario, chunk_samples, labels=None):
+        self.store = store
+        self.scenario = scenario
+        self.chunk_samples = chunk_samples
+        self.labels = labels
+        self.buffer = None
+
+    def add(self, results: ResultBuffer):
+        if self.buffer is None:
+            self.buffer = ResultBuffer.like(results)
+        self.buffer.extend_from(results)
+
+        iterations = self.buffer.columns["iteration"][: self.buffer.size]
+        if len(np.unique(iterations)) >= self.chunk_samples:
+            self.flush()
+
+    def flush(self):
+        if self.buffer is not None:
+            self.store.write(self.buffer, self.scenario, self.labels)
+            self.buffer = ResultBuffer.like(self.buffer)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,333 @@
+"""
+Streaming per-year summaries across samples, for runSimulation(...,
+summary=Summary(...)).
+
+The notebooks only plot per-year spreads across iterations, yet a run keeps
+every row of every sample. A Summary instead folds each sample's rows into
+per-year reducers as the sample finishes, and the rows are dropped:
+
+    mean and variance   Welford's running moments
+    min and max
+    quantiles           a DDSketch-style log-bucket sketch, accurate to within
+                        relative_accuracy of the true value
+    below_<threshold>   share of samples at or below the threshold, e.g.
+                        DESIRED_POPULATION for num_individuals
+
+Memory grows with the number of years (and sketch buckets), not samples. Every
+reducer merges exactly, so each worker summarises its own samples and the
+parent merges the summaries.
+"""
+
+from __future__ import annotations
+
+import math
+from functools import partial
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.results import ResultBuffer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class _Buckets:
+    """
+    Counts of log buckets [slot, bucket], growing to fit new buckets.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self.offset = 0  # Bucket index of column 0
+
+    def _fit(self, slots: int, low: int, high: int):
+        rows, columns = self.counts.shape
+        if self.counts.size:
+            low = min(low, self.offset)
+            high = max(high, self.offset + columns - 1)
+        slots = max(slots, rows)
+        if (slots, high - low + 1) == self.counts.shape and low == self.offset:
+            return
+
+        counts = np.zeros((slots, high - low + 1), dtype=np.int64)
+        start = self.offset - low
+        counts[:rows, start : start + columns] = self.counts
+        self.counts = counts
+        self.offset = low
+
+    def add(self, slots: np.ndarray, buckets: np.ndarray, slot_count: int):
+        if not len(buckets):
+            self._fit(slot_count, self.offset, self.offset)
+            return
+        self._fit(slot_count, int(buckets.min()), int(buckets.max()))
+        np.add.at(self.counts, (slots, buckets - self.offset), 1)
+
+    def merge(self, other: "_Buckets", slots: np.ndarray, slot_count: int):
+        """
+        Adds the counts of other, whose slot i is slot slots[i] here.
+        """
+
+        rows, columns = other.counts.shape
+        if not columns:
+            self._fit(slot_count, self.offset, self.offset)
+            return
+        self._fit(slot_count, other.offset, other.offset + columns - 1)
+        start = other.offset - self.offset
+        self.counts[slots, start : start + columns] += other.counts
+
+
+class Summary:
+    def __init__(
+        self,
+        columns=("num_individuals",),
+        quantiles=(0.05, 0.25, 0.5, 0.75, 0.95),
+        thresholds: dict = None,
+        relative_accuracy=0.01,
+    ):
+        """
+        columns: results columns summarised
+        quantiles: quantiles reported by frame
+        thresholds: column to values whose probability of being at or below
+            is reported, e.g. {"num_individuals": [DESIRED_POPULATION]}
+        relative_accuracy: quantile sketch accuracy, relative to the value
+        """
+
+        self.columns = list(columns)
+        self.quantiles = list(quantiles)
+        self.thresholds = {
+            column: list(values) for column, values in (thresholds or {}).items()
+        }
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+
+        self.years = []  # Year of each slot, in the order first seen
+        self._slots = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self._moments = {}  # column: (mean, M2, min, max) arrays by slot
+        self._below = {}  # column: [threshold, slot] counts
+        self._sketch = {}  # column: (positive, negative, zero) buckets
+        for column in self.columns:
+            self._moments[column] = tuple(np.zeros(0) for _ in range(4))
+            self._below[column] = np.zeros(
+                (len(self.thresholds.get(column, [])), 0), dtype=np.int64
+            )
+            self._sketch[column] = (_Buckets(), _Buckets(), np.zeros(0, np.int64))
+
+    def like(self) -> "Summary":
+        """
+        An empty Summary of the same columns and settings.
+        """
+
+        return Summary(
+            self.columns, self.quantiles, self.thresholds, self.relative_accuracy
+        )
+
+    def _slots_of(self, years) -> np.ndarray:
+        for year in years:
+            if year not in self._slots:
+                self._slots[year] = len(self.years)
+                self.years.append(year)
+
+        slots = len(self.years)
+        grow = slots - len(self.count)
+        if grow:
+            self.count = np.concatenate([self.count, np.zeros(grow, np.int64)])
+            for column in self.columns:
+                mean, m2, low, high = self._moments[column]
+                self._moments[column] = (
+                    np.concatenate([mean, np.zeros(grow)]),
+                    np.concatenate([m2, np.zeros(grow)]),
+                    np.concatenate([low, np.full(grow, np.inf)]),
+                    np.concatenate([high, np.full(grow, -np.inf)]),
+                )
+                below = self._below[column]
+                self._below[column] = np.concatenate(
+                    [below, np.zeros((len(below), grow), np.int64)], axis=1
+                )
+                positive, negative, zero = self._sketch[column]
+                self._sketch[column] = (
+                    positive,
+                    negative,
+                    np.concatenate([zero, np.zeros(grow, np.int64)]),
+                )
+
+        return np.array([self._slots[year] for year in years], dtype=np.int64)
+
+    def _bucket(self, values: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(values) / math.log(self._gamma)).astype(np.int64)
+
+    def _merge_moments(self, column, slots, count, mean, m2, low, high):
+        # Chan et al.'s pairwise update of the running moments
+        own_mean, own_m2, own_low, own_high = self._moments[column]
+        own_count = self.count[slots]
+        total = own_count + count
+        delta = mean - own_mean[slots]
+        weight = np.divide(count, total, out=np.zeros(len(total)), where=total > 0)
+        own_mean[slots] += delta * weight
+        own_m2[slots] += m2 + delta**2 * own_count * weight
+        own_low[slots] = np.minimum(own_low[slots], low)
+        own_high[slots] = np.maximum(own_high[slots], high)
+
+    def add(self, results):
+        """
+        Folds in rows of results (a ResultBuffer or DataFrame with a year
+        column), typically the rows of one or more finished samples.
+        """
+
+        if isinstance(results, ResultBuffer):
+            data = {}
+            for name, column in results.columns.items():
+                if column.ndim == 1:
+                    data[name] = column[: results.size]
+                else:  # age_0 ... age_N count columns
+                    for k, expanded_name in enumerate(results.expanded_names[name]):
+                        data[expanded_name] = column[: results.size, k]
+        else:
+            data = {name: results[name].to_numpy() for name in results.columns}
+
+        years, index = np.unique(data["year"], return_inverse=True)
+        slots = self._slots_of(years.tolist())
+        count = np.bincount(index, minlength=len(years))
+
+        for column in self.columns:
+            values = np.asarray(data[column], dtype=float)
+
+            mean = np.bincount(index, values, len(years)) / count
+            m2 = np.bincount(index, (values - mean[index]) ** 2, len(years))
+            low = np.full(len(years), np.inf)
+            high = np.full(len(years), -np.inf)
+            np.minimum.at(low, index, values)
+            np.maximum.at(high, index, values)
+            self._merge_moments(column, slots, count, mean, m2, low, high)
+
+            for row, threshold in enumerate(self.thresholds.get(column, [])):
+                self._below[column][row, slots] += np.bincount(
+                    index, values <= threshold, len(years)
+                ).astype(np.int64)
+
+            positive, negative, zero = self._sketch[column]
+            for buckets, sign in ((positive, 1), (negative, -1)):
+                selected = sign * values > 0
+                buckets.add(
+                    slots[index[selected]],
+                    self._bucket(sign * values[selected]),
+                    len(self.years),
+                )
+            zero[slots] += np.bincount(index, values == 0, len(years)).astype(np.int64)
+
+        self.count[slots] += count
+
+    def merge(self, other: "Summary"):
+        """
+        Folds in another Summary of the same columns, e.g. from another worker.
+        """
+
+        if other.columns != self.columns or other._gamma != self._gamma:
+            raise ValueError("Only summaries with the same settings can be merged")
+
+        slots = self._slots_of(other.years)
+        for column in self.columns:
+            mean, m2, low, high = other._moments[column]
+            self._merge_moments(column, slots, other.count, mean, m2, low, high)
+            self._below[column][:, slots] += other._below[column]
+
+            positive, negative, zero = self._sketch[column]
+            other_positive, other_negative, other_zero = other._sketch[column]
+            positive.merge(other_positive, slots, len(self.years))
+            negative.merge(other_negative, slots, len(self.years))
+            zero[slots] += other_zero
+
+        self.count[slots] += other.count
+
+    def _quantile(self, column, slot, q) -> float:
+        positive, negative, zero = self._sketch[column]
+        # Buckets in increasing order of value
+        counts = np.concatenate(
+            [
+                negative.counts[slot, ::-1] if negative.counts.size else [],
+                [zero[slot]],
+                positive.counts[slot] if positive.counts.size else [],
+            ]
+        )
+        indices = np.concatenate(
+            [
+                np.arange(negative.counts.shape[1])[::-1] + negative.offset,
+                [0],
+                np.arange(positive.counts.shape[1]) + positive.offset,
+            ]
+        )
+        signs = np.concatenate(
+            [
+                -np.ones(negative.counts.shape[1]),
+                [0],
+                np.ones(positive.counts.shape[1]),
+            ]
+        )
+
+        rank = q * (self.count[slot] - 1)
+        bucket = np.searchsorted(np.cumsum(counts), rank, side="right")
+        bucket = min(bucket, len(counts) - 1)
+        # The bucket's value with the lowest worst-case relative error
+        return float(
+            signs[bucket] * 2 * self._gamma ** indices[bucket] / (self._gamma + 1)
+        )
+
+    def frame(self) -> pd.DataFrame:
+        """
+        One row per year: the number of samples and, for every column, its
+        mean, std, min, max, quantiles and below_<threshold> probabilities.
+        """
+
+        import pandas as pd
+
+        order = np.argsort(self.years, kind="stable")
+        data = {
+            "year": np.array(self.years)[order],
+            "samples": self.count[order],
+        }
+        for column in self.columns:
+            mean, m2, low, high = self._moments[column]
+            data[f"{column}_mean"] = mean[order]
+            data[f"{column}_std"] = np.sqrt(
+                np.divide(
+                    m2,
+                    self.count - 1,
+                    out=np.full(len(m2), np.nan),
+                    where=self.count > 1,
+                )
+            )[order]
+            data[f"{column}_min"] = low[order]
+            data[f"{column}_max"] = high[order]
+            for q in self.quantiles:
+                data[f"{column}_q{q * 100:g}"] = [
+                    self._quantile(column, slot, q) for slot in order
+                ]
+            for row, threshold in enumerate(self.thresholds.get(column, [])):
+                data[f"{column}_below_{threshold:g}"] = (
+                    self._below[column][row] / np.maximum(self.count, 1)
+                )[order]
+
+        return pd.DataFrame(data)
+
+
+def run_summarised(function, summary: Summary, **job) -> Summary:
+    """
+    Runs function(**job) and returns the Summary of its results alone, so only
+    the summary leaves the worker.
+    """
+
+    job_summary = summary.like()
+    job_summary.add(function(**job))
+    return job_summary
+
+
+def summarised(function, jobs: list, summary: Summary):
+    """
+    Jobs returning the Summary of function's results, for imap_jobs.
+    """
+
+    # Bound with partial, so that Profiler.wrap can add its own function
+    return partial(run_summarised, function), [
+        {"summary": summary.like(), **job} for job in jobs
+    ]
@@ -0,0 +1,200 @@
+"""
+Scenario sweeps: run many (ModelParameters, HuntingParameters) scenarios and
+collect them into one results table.
+
+Every (scenario, sample) job is scheduled on the same worker pool, and sample k
+of every scenario uses the same seed stream, so scenarios are compared under
+common random numbers.
+"""
+
+from __future__ import annotations
+
+import importlib
+import inspect
+from itertools import product
+from typing import TYPE_CHECKING
+
+from src.parallel import imap_jobs, root_seed
+from src.results import ResultBuffer
+from src.store import ResultStore
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Scenario:
+    def __init__(
+        self,
+        name: str,
+        parameters,
+        huntingStrategy,
+        labels: dict = None,
+        **options,
+    ):
+        """
+        labels: extra columns added to this scenario's results, e.g. grid values
+        options: runSimulation keyword arguments for this scenario only, e.g.
+            end_year or engine
+        """
+
+        self.name = name
+        self.parameters = parameters
+        self.huntingStrategy = huntingStrategy
+        self.labels = labels or {}
+        self.options = options
+
+
+def _call_with(function, values: dict):
+    # Pass a grid function only the grid values it has arguments for
+    accepted = inspect.signature(function).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in accepted.values()):
+        return function(**values)
+    return function(**{name: value for name, value in values.items() if name in accepted})
+
+
+def scenario_grid(parameters, huntingStrategy, options: dict = None, **axes) -> list:
+    """
+    One scenario per combination of the axes values.
+
+    parameters, huntingStrategy: fixed objects, or functions called with the
+        grid values they take arguments for
+    axes: grid values, e.g. period_1_multiplier=range(1, 11)
+
+    Example:
+        scenario_grid(
+            defaultParameters,
+            create_hunting_strategy,
+            period_1_multiplier=range(1, 11),
+            period_2_multiplier=range(1, 11),
+            change_year=[2034],
+        )
+    """
+
+    names = list(axes)
+    scenarios = []
+    for combination in product(*axes.values()):
+        values = dict(zip(names, combination))
+        scenarios.append(
+            Scenario(
+                ",".join(f"{name}={value}" for name, value in values.items()),
+                _call_with(parameters, values) if callable(parameters) else parameters,
+                (
+                    _call_with(huntingStrategy, values)
+                    if callable(huntingStrategy)
+                    else huntingStrategy
+                ),
+                labels=values,
+                **(options or {}),
+            )
+        )
+
+    return scenarios
+
+
+def get_model(model: str):
+    """
+    The model module a sweep runs: "main" (paper) or "main_v2" (Black Mount).
+    """
+
+    if model not in ("main", "main_v2"):
+        raise ValueError(f"Unknown model: {model!r}")
+    return importlib.import_module(f"src.{model}")
+
+
+def sweepJobs(scenarios: list, samples=100, seed=None, model="main_v2", **options):
+    """
+    The job function, keyword arguments and scenario index of every job of a
+    sweep, scenario by scenario.
+    """
+
+    model = get_model(model)
+    seed = root_seed(seed)  # One root, so every scenario has the same streams
+    jobs = []
+    for index, scenario in enumerate(scenarios):
+        function, scenario_jobs = model.simulationJobs(
+            scenario.parameters,
+            scenario.huntingStrategy,
+            samples=samples,
+            seed=seed,
+            **{**options, **scenario.options},
+        )
+        jobs.extend((function, job, index) for job in scenario_jobs)
+
+    return jobs
+
+
+def _run_sweep_job(function, job):
+    return function(**job)
+
+
+def runSweep(
+    scenarios: list,
+    samples=100,
+    seed=None,
+    workers=1,
+    model="main_v2",
+    store=None,
+    chunk_samples=100,
+    **options,
+) -> pd.DataFrame:
+    """
+    Runs samples of every scenario and returns one table with a scenario
+    column, the scenario labels and the usual runSimulation columns.
+
+    options: runSimulation keyword arguments shared by every scenario
+    store: a ResultStore (or its path) to stream the results to, partitioned
+        by scenario with chunk_samples samples per file. The store is returned
+        instead of a DataFrame.
+    """
+
+    jobs = sweepJobs(scenarios, samples=samples, seed=seed, model=model, **options)
+    buffers = imap_jobs(
+        _run_sweep_job,
+        [{"function": function, "job": job} for function, job, _ in jobs],
+        workers,
+    )
+
+    return collect_sweep(
+        scenarios,
+        ((index, job_results) for (_, _, index), job_results in zip(jobs, buffers)),
+        store,
+        chunk_samples,
+    )
+
+
+def collect_sweep(scenarios: list, results, store=None, chunk_samples=100):
+    """
+    The runSweep table (or store) of (scenario index, ResultBuffer) pairs,
+    the buffers of each scenario coming in sample order.
+    """
+
+    if store is not None:
+        store = ResultStore.open(store)
+        writers = [
+            store.writer(scenario.name, chunk_samples, scenario.labels)
+            for scenario in scenarios
+        ]
+        for index, job_results in results:
+            writers[index].add(job_results)
+        for writer in writers:
+            writer.close()
+        return store
+
+    import pandas as pd
+
+    buffers = [None] * len(scenarios)
+    for index, job_results in results:
+        if buffers[index] is None:
+            buffers[index] = ResultBuffer.like(job_results)
+        buffers[index].extend_from(job_results)
+
+    frames = []
+    for scenario, scenario_results in zip(scenarios, buffers):
+        frame = scenario_results.to_frame()
+        for position, (name, value) in enumerate(
+            {"scenario": scenario.name, **scenario.labels}.items()
+        ):
+            frame.insert(position, name, value)
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,140 @@
+"""
+Configurable age schedules for mortality (p_{i,d}) and fertility, compiled once
+into per-age lookup tables.
+
+A schedule is a list of age bands. A mortality band covers ages min_age to
+max_age (inclusive, None for no upper bound) with the rate
+
+    (rate + slope * (age - origin)) * exp(growth * (age - origin))
+
+which gives the constant, linear and exponential pieces of the thesis
+mortality function. A fertility band gives the probability a hind of those
+ages has a calf. Ages outside every band have a mortality of one and a
+fertility of zero.
+
+Every model step looks rates up in the tables instead of recomputing them for
+every deer, so only the carrying capacity term of Algorithm 3 is left to
+compute, once per year.
+"""
+
+from math import exp
+
+import numpy as np
+
+
+class MortalityBand:
+    def __init__(
+        self,
+        min_age: int,
+        max_age: int = None,
+        rate: float = 0.0,
+        slope: float = 0.0,
+        growth: float = 0.0,
+        origin: int = 0,
+    ):
+        self.min_age = min_age
+        self.max_age = max_age
+        self.rate = rate
+        self.slope = slope
+        self.growth = growth
+        self.origin = origin
+
+    def covers(self, age: int) -> bool:
+        return self.min_age <= age and (self.max_age is None or age <= self.max_age)
+
+    def __call__(self, age: int) -> float:
+        return (self.rate + self.slope * (age - self.origin)) * exp(
+            self.growth * (age - self.origin)
+        )
+
+
+class FertilityBand:
+    def __init__(self, min_age: int, max_age: int, probability: float):
+        self.min_age = min_age
+        self.max_age = max_age
+        self.probability = probability
+
+    def covers(self, age: int) -> bool:
+        return self.min_age <= age and (self.max_age is None or age <= self.max_age)
+
+
+class VitalRates:
+    def __init__(self, mortality: list, fertility: list, max_age_classes: int = 100):
+        """
+        mortality: MortalityBand list, the first band covering an age is used
+        fertility: FertilityBand list, the first band covering an age is used
+        max_age_classes: cap on age_classes if the mortality never reaches one
+        """
+
+        self.mortality = mortality
+        self.fertility = fertility
+        self.max_age_classes = max_age_classes
+
+        self._tables = {}  # Memoised tables by (kind, age classes)
+
+    def mortality_rate(self, age: int) -> float:
+        for band in self.mortality:
+            if band.covers(age):
+                return band(age)
+        return 1.0
+
+    def fertility_rate(self, age: int) -> float:
+        for band in self.fertility:
+            if band.covers(age):
+                return band.probability
+        return 0.0
+
+    @property
+    def age_classes(self) -> int:
+        """
+        Number of age classes needed to hold the population: every deer dies
+        once it reaches the first age with a mortality of one. The last class
+        is absorbing if the mortality never reaches one within max_age_classes.
+        """
+
+        if "age_classes" not in self._tables:
+            self._tables["age_classes"] = next(
+                (
+                    age + 1
+                    for age in range(self.max_age_classes)
+                    if self.mortality_rate(age) >= 1
+                ),
+                self.max_age_classes,
+            )
+        return self._tables["age_classes"]
+
+    def check_age_classes(self, age_classes: int, holder: str):
+        """
+        Raises ValueError if the population would need more than age_classes
+        classes, which holder (a fixed-width table) would silently truncate.
+        """
+
+        if self.age_classes > age_classes:
+            raise ValueError(
+                f"The vital rates need {self.age_classes} age classes, "
+                f"{holder} only holds {age_classes}"
+            )
+
+    def _table(self, kind: str, rate, age_classes: int) -> np.ndarray:
+        age_classes = age_classes or self.age_classes
+        if (kind, age_classes) not in self._tables:
+            table = np.array([rate(age) for age in range(age_classes)])
+            table.setflags(write=False)
+            self._tables[kind, age_classes] = table
+        return self._tables[kind, age_classes]
+
+    def mortality_table(self, age_classes: int = None) -> np.ndarray:
+        """
+        Mortality of ages 0 ... age_classes - 1 (age_classes by default). Read
+        only, as it is shared by every caller.
+        """
+
+        return self._table("mortality", self.mortality_rate, age_classes)
+
+    def fertility_table(self, age_classes: int = None) -> np.ndarray:
+        """
+        Fertility of ages 0 ... age_classes - 1 (age_classes by default). Read
+        only, as it is shared by every caller.
+        """
+
+        return self._table("fertility", self.fertility_rate, age_classes)